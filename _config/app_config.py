@@ -3,10 +3,14 @@ import logging
 
 
 class AppConfig:
-    def __init__(self, config_file_path: str = None):
+    def __init__(self, config_file_path: str = None, config: dict = None):
         """
         Initialize the AppConfig with the configuration file path.
+        :param config: Optional configuration dictionary used instead of the file, e.g. by the network simulation.
         """
+        if config is not None:
+            self.config = self.validate_config(config)
+            return
         if config_file_path is None:
             config_file_path = "_config/config.json"
 
@@ -25,6 +29,15 @@ class AppConfig:
         except Exception as e:
             raise ValueError(f"Error loading configuration: {e}")
 
+        return self.validate_config(config)
+
+    def validate_config(self, config: dict) -> dict:
+        """
+        Check that the configuration has all required sections.
+
+        :param config: The configuration dictionary.
+        :return: The configuration dictionary.
+        """
         required_keys = ["network_config", "mining_config", "shard_config", "stake_info"]
         for key in required_keys:
             if key not in config:
@@ -44,6 +57,21 @@ class AppConfig:
     def get_stake_info(self) -> dict:
         return self.config["stake_info"]
 
+    def get_chain_config(self) -> dict:
+        return self.config.get("chain_config", {})
+
+    def get_storage_config(self) -> dict:
+        return self.config.get("storage_config", {})
+
+    def get_sync_config(self) -> dict:
+        return self.config.get("sync_config", {})
+
+    def get_epoch_config(self) -> dict:
+        return self.config.get("epoch_config", {})
+
+    def get_coordinator_config(self) -> dict:
+        return self.config.get("coordinator_config", {})
+
     def get_peers_for_shard(self, shard: str) -> list:
         """
         Get the list of peers for a given shard.
@@ -90,6 +118,6 @@ class AppConfig:
         """
         all_peers = self.config.get("network_config", {}).get("peers", [])
         other_stakers = [
-            peer for peer in all_peers if "staker" in peer and not peer.startswith(node_name)
+            peer for peer in all_peers if "staker" in peer and peer.split(":")[0] != node_name
         ]
         return other_stakers
\ No newline at end of file
@@ -0,0 +1,63 @@
+import time
+import zlib
+from blockchain.blockchain import Blockchain
+from network.codec import WireCodec, MsgPack, msgpack
+from network.message import Message
+from transaction.transaction import Transaction
+from transaction.transaction_manager import TransactionManager
+
+
+def create_block_message(num_transactions: int) -> Message:
+    """
+    Create a MAIN_BLOCK message shaped like the ones stakers exchange.
+    """
+    transactions = [
+        Transaction(sender=f"address_{i % 97:04d}", recipient=f"address_{(i * 7) % 89:04d}", amount=round(i * 1.25, 2),
+                    timestamp=str(1700000000 + i), metadata={"memo": f"payment {i}", "fee": 0.01}, signature=f"{i:064x}")
+        for i in range(num_transactions)
+    ]
+    blockchain = Blockchain()
+    shard_data = {
+        f"miner{shard}{miner}": {"block_hash": f"{shard * 10 + miner:064x}", "miner_numeric_id": miner, "timestamp": "1700000000.0",
+                                 "merkle_root": f"{miner:064x}", "nonce": 12345 + miner, "nbits": "0x1e0ffff0"}
+        for shard in (1, 2) for miner in (1, 2)
+    }
+    block = blockchain.create_block(staker_signature="staker10:signature", tx_root=TransactionManager.calculate_merkle_root(transactions),
+                                    shard_data=shard_data, transactions=transactions)
+    return Message(content_type="MAIN_BLOCK", content=block.to_dict(), sender="staker10")
+
+
+def measure(function, repeat: int) -> float:
+    """
+    Get the average run time of a function in seconds.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def run_benchmark(block_sizes=(10, 100, 1000), repeat: int = 20):
+    """
+    Compare the encode/decode throughput and the encoded size of the wire codecs for block messages.
+    """
+    codecs = [("json", lambda message: WireCodec.encode("json", message), lambda data: WireCodec.decode("json", data)),
+              ("msgpack (pure python)", lambda message: MsgPack.pack(message.to_dict()), lambda data: Message.from_dict(MsgPack.unpack(data)))]
+    if msgpack is not None:
+        codecs.append(("msgpack (C extension)", lambda message: msgpack.packb(message.to_dict(), use_bin_type=True),
+                       lambda data: Message.from_dict(msgpack.unpackb(data, raw=False))))
+
+    print(f"{'codec':<24}{'txs':>6}{'bytes':>10}{'zlib bytes':>12}{'encode MB/s':>13}{'decode MB/s':>13}")
+    for num_transactions in block_sizes:
+        message = create_block_message(num_transactions)
+        for name, encode, decode in codecs:
+            data = encode(message)
+            encode_time = measure(lambda: encode(message), repeat)
+            decode_time = measure(lambda: decode(data), repeat)
+            megabytes = len(data) / 1e6
+            print(f"{name:<24}{num_transactions:>6}{len(data):>10}{len(zlib.compress(data, 6)):>12}"
+                  f"{megabytes / encode_time:>13.1f}{megabytes / decode_time:>13.1f}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -1,9 +1,9 @@
 import json
 import hashlib
+from blockchain.block_store import BlockStore
 
-# Load the blockchain data from the JSON file
-with open("./data/staker10_blockchain.json", "r") as file:
-    blockchain = json.load(file)
+# Load the blockchain data from the block store
+blockchain = BlockStore(node_name="staker10", data_dir="./data").read_blocks()
 
 def calculate_block_hash(block):
     """
@@ -0,0 +1,97 @@
+import copy
+import json
+import asyncio
+import logging
+import tempfile
+from blockchain.main import BlockchainNode
+from network.transport import SimulatedNetwork
+from _config.app_config import AppConfig
+
+
+def build_config(num_shards: int = None, miners_per_shard: int = 2, data_dir: str = None, nbits: str = "0x2000ffff",
+                 base_config_path: str = "_config/config.json") -> dict:
+    """
+    Build a node configuration for the simulation from the repository config.
+    Without num_shards, the shard layout of the config file is kept; otherwise a layout with the same naming
+    (shard10 with staker10 and its miners, shard20, ...) is generated.
+    :param num_shards: The number of shards to generate, each with one staker.
+    :param miners_per_shard: The number of miners per generated shard.
+    :param data_dir: The directory for block stores and indexes, a temporary directory by default.
+    :param nbits: The mining difficulty; the default makes mining take milliseconds.
+    :param base_config_path: The config file the other settings are taken from.
+    """
+    with open(base_config_path, "r") as file:
+        config = json.load(file)
+    config = copy.deepcopy(config)
+
+    if num_shards is not None:
+        config["shard_config"] = {
+            f"shard{shard}0": [f"staker{shard}0:5000"] + [f"miner{shard}_{miner}:5000" for miner in range(1, miners_per_shard + 1)]
+            for shard in range(1, num_shards + 1)
+        }
+        config["stake_info"] = {f"staker{shard}0": 100 + 10 * shard for shard in range(1, num_shards + 1)}
+        config["network_config"]["peers"] = [peer for peers in config["shard_config"].values() for peer in peers]
+
+    config["mining_config"]["nbits"] = nbits
+    config.setdefault("storage_config", {})["data_dir"] = data_dir if data_dir is not None else tempfile.mkdtemp(prefix="simulation_")
+    return config
+
+
+def get_nodes(config: dict) -> list:
+    """
+    Get the (node name, shard name) of every node in the shard layout.
+    """
+    return [(peer.split(":")[0], shard) for shard, peers in config["shard_config"].items() for peer in peers]
+
+
+async def run_simulation(config: dict, duration: float = 30, latency: float = 0.02, bandwidth: float = None, loss: float = 0.0,
+                         jitter: float = 0.0, partition_at: float = None, heal_at: float = None, seed: int = 1):
+    """
+    Run every node of the config in this process over a simulated network and report the resulting chains.
+    :param config: The node configuration, see build_config.
+    :param duration: Seconds to run the nodes.
+    :param latency: One-way link latency in seconds.
+    :param bandwidth: Link bandwidth in bytes per second, None for unlimited.
+    :param loss: Probability that a write is lost and retransmitted.
+    :param jitter: Maximum random latency added to a write, in seconds.
+    :param partition_at: Optional second at which the shards are partitioned from each other.
+    :param heal_at: Optional second at which the partition is healed.
+    :param seed: Seed of the network's random generator.
+    :return: A dictionary with the chain height of every staker and the network counters.
+    """
+    network = SimulatedNetwork(latency=latency, bandwidth=bandwidth, loss=loss, jitter=jitter, seed=seed)
+    app_config = AppConfig(config=config)
+    nodes = [BlockchainNode(config=app_config, node_name=node_name, shard_name=shard_name,
+                            transport=network.create_transport(node_name), enable_webserver=False)
+             for node_name, shard_name in get_nodes(config)]
+    tasks = [asyncio.create_task(node.start()) for node in nodes]
+    logging.warning(f"Simulating {len(nodes)} nodes in {len(config['shard_config'])} shard(s) for {duration} seconds.")
+
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    if partition_at is not None:
+        await asyncio.sleep(partition_at)
+        network.partition(*[[peer.split(":")[0] for peer in peers] for peers in config["shard_config"].values()])
+        logging.warning(f"Partitioned the shards at {loop.time() - started_at:.1f}s.")
+    if heal_at is not None:
+        await asyncio.sleep(max(0, heal_at - (loop.time() - started_at)))
+        network.heal()
+        logging.warning(f"Healed the partition at {loop.time() - started_at:.1f}s.")
+    await asyncio.sleep(max(0, duration - (loop.time() - started_at)))
+
+    report = {
+        "heights": {node.node_name: node.blockchain.get_last_block().index for node in nodes if node.node_name.startswith("staker")},
+        "tips": {node.node_name: node.blockchain.get_last_block().block_hash[:16] for node in nodes if node.node_name.startswith("staker")},
+        "messages_out": sum(counters["messages_out"] for node in nodes for counters in node.host.metrics.snapshot()["peers"].values()),
+        "network": dict(network.stats),
+    }
+    for task in tasks:
+        task.cancel()
+    for node in nodes:
+        await node.shutdown()
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    print(json.dumps(asyncio.run(run_simulation(build_config(), duration=20)), indent=2))
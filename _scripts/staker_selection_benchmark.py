@@ -0,0 +1,193 @@
+import time
+import hashlib
+import numpy as np  # pip install -r requirements-benchmark.txt
+from blockchain.stake_index import StakeIndex
+
+
+def generate_stakes(num_stakers: int, distribution: str = "uniform", seed: int = 1) -> dict:
+    """
+    Generate synthetic integer stakes named like the configured stakers.
+    :param distribution: "uniform" for stakes between 1 and 1000, "pareto" for a few large stakers and a long tail.
+    """
+    rng = np.random.default_rng(seed)
+    if distribution == "pareto":
+        amounts = np.ceil(rng.pareto(1.16, num_stakers) * 100) + 1
+    else:
+        amounts = rng.integers(1, 1001, num_stakers)
+    return {f"staker{i}0": int(amount) for i, amount in enumerate(amounts, start=1)}
+
+
+def hash_to_targets(digests: bytes, total_stake: int) -> np.ndarray:
+    """
+    Reduce SHA-256 digests, read as big-endian 256-bit integers like int(hexdigest, 16), modulo the total stake.
+    The digests are processed as eight 32-bit words, so the reduction stays exact in 64-bit arithmetic.
+    :param digests: The concatenated 32-byte digests.
+    :param total_stake: The total stake, below 2**32.
+    :return: The selection target of every digest.
+    """
+    if not 0 < total_stake < 2 ** 32:
+        raise ValueError(f"The total stake must be between 1 and 2**32 - 1, got {total_stake}.")
+    words = np.frombuffer(digests, dtype=">u4").reshape(-1, 8).astype(np.uint64)
+    targets = np.zeros(len(words), dtype=np.uint64)
+    modulus = np.uint64(total_stake)
+    for column in range(8):
+        targets = ((targets << np.uint64(32)) | words[:, column]) % modulus
+    return targets
+
+
+def select_batch(sorted_stakes: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """
+    Apply ShardStaker.select_staker's rule to a batch of targets: the first staker, in sorted order, whose
+    cumulative stake exceeds the target.
+    :return: The positions of the selected stakers in sorted order.
+    """
+    return np.searchsorted(np.cumsum(sorted_stakes, dtype=np.uint64), targets, side="right")
+
+
+def generate_digests(stakes: dict, first_epoch: int, num_epochs: int, exact: bool, rng: np.random.Generator) -> bytes:
+    """
+    Generate the selection hashes of a batch of epochs.
+    With exact, the hashes are computed like select_staker does, from synthetic previous block hashes and the
+    sorted staker IDs; otherwise uniform random digests stand in for SHA-256, which is much faster for large sets.
+    """
+    if not exact:
+        return rng.bytes(32 * num_epochs)
+    staker_string = "".join(sorted(stakes)).encode()
+    return b"".join(
+        hashlib.sha256(hashlib.sha256(str(epoch).encode()).hexdigest().encode() + staker_string).digest()
+        for epoch in range(first_epoch, first_epoch + num_epochs)
+    )
+
+
+def simulate(stakes: dict, num_epochs: int = 1_000_000, exact: bool = False, batch_size: int = 1_000_000, seed: int = 1) -> dict:
+    """
+    Simulate staker selection over many epochs in batches.
+    :param stakes: A dictionary of staker IDs and their stakes.
+    :param num_epochs: The number of epochs to simulate.
+    :param exact: Compute the real selection hashes instead of uniform random ones.
+    :param batch_size: The number of epochs per batch.
+    :return: The selection counts in sorted staker order, the streak length histogram and the run time.
+    """
+    rng = np.random.default_rng(seed)
+    sorted_stakers = sorted(stakes)
+    sorted_stakes = np.array([stakes[staker] for staker in sorted_stakers], dtype=np.uint64)
+    total_stake = int(sorted_stakes.sum())
+    counts = np.zeros(len(sorted_stakers), dtype=np.int64)
+    streaks = np.zeros(1, dtype=np.int64)  # streaks[n]: the number of runs of n consecutive selections of a staker
+    longest_streak = (0, None)
+    previous, run_length = -1, 0  # The run still open at the end of the last batch
+    hash_time = select_time = 0.0
+
+    def record_runs(values: np.ndarray, lengths: np.ndarray):
+        nonlocal streaks, longest_streak
+        if not len(lengths):
+            return
+        streaks = np.pad(streaks, (0, max(0, int(lengths.max()) + 1 - len(streaks))))
+        streaks += np.bincount(lengths, minlength=len(streaks))
+        longest = int(np.argmax(lengths))
+        if lengths[longest] > longest_streak[0]:
+            longest_streak = (int(lengths[longest]), sorted_stakers[values[longest]])
+
+    for first_epoch in range(0, num_epochs, batch_size):
+        size = min(batch_size, num_epochs - first_epoch)
+        start = time.perf_counter()
+        digests = generate_digests(stakes, first_epoch, size, exact, rng)
+        hash_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        selected = select_batch(sorted_stakes, hash_to_targets(digests, total_stake))
+        select_time += time.perf_counter() - start
+        counts += np.bincount(selected, minlength=len(sorted_stakers))
+
+        # Runs of the same staker, continuing the run that was open at the end of the previous batch
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(selected)) + 1))
+        values = selected[starts]
+        lengths = np.diff(np.concatenate((starts, [size])))
+        if values[0] == previous:
+            lengths[0] += run_length
+        elif run_length:
+            values = np.concatenate(([previous], values))
+            lengths = np.concatenate(([run_length], lengths))
+        record_runs(values[:-1], lengths[:-1])
+        previous, run_length = int(values[-1]), int(lengths[-1])
+
+    record_runs(np.array([previous]), np.array([run_length]))
+    return {"stakers": sorted_stakers, "stakes": sorted_stakes, "counts": counts, "streaks": streaks,
+            "longest_streak": longest_streak, "hash_time": hash_time, "select_time": select_time}
+
+
+def measure_index(stakes: dict, rounds: int = 2000) -> float:
+    """
+    Get the average time of one StakeIndex selection, as done by every staker per epoch, in seconds.
+    """
+    stake_index = StakeIndex(stakes)
+    previous_hashes = [hashlib.sha256(str(epoch).encode()).hexdigest() for epoch in range(rounds)]
+    start = time.perf_counter()
+    for previous_hash in previous_hashes:
+        stake_index.select(previous_hash)
+    return (time.perf_counter() - start) / rounds
+
+
+def verify_against_index(stakes: dict, num_epochs: int = 2000) -> int:
+    """
+    Compare the batch selection with StakeIndex.select on the same epochs, to catch selection regressions.
+    :return: The number of epochs selecting a different staker.
+    """
+    sorted_stakers = sorted(stakes)
+    stake_index = StakeIndex(stakes)
+    sorted_stakes = np.array([stakes[staker] for staker in sorted_stakers], dtype=np.uint64)
+    digests = generate_digests(stakes, 0, num_epochs, True, None)
+    selected = select_batch(sorted_stakes, hash_to_targets(digests, int(sorted_stakes.sum())))
+    return sum(
+        sorted_stakers[position] != stake_index.select(hashlib.sha256(str(epoch).encode()).hexdigest())
+        for epoch, position in enumerate(selected)
+    )
+
+
+def report(result: dict, num_epochs: int) -> dict:
+    """
+    Summarize a simulation: selection frequency against stake share, streaks and cost per epoch.
+    """
+    shares = result["stakes"] / result["stakes"].sum()
+    expected = shares * num_epochs
+    frequencies = result["counts"] / num_epochs
+    streaks = result["streaks"]
+    largest = int(np.argmax(shares))
+    return {
+        "max_share_error": float(np.abs(frequencies - shares).max()),
+        "chi_square_per_dof": float(((result["counts"] - expected) ** 2 / expected).sum() / max(1, len(shares) - 1)),
+        "never_selected": int((result["counts"] == 0).sum()),
+        "largest_share": float(shares[largest]),
+        "largest_frequency": float(frequencies[largest]),
+        "mean_streak": float((np.arange(len(streaks)) * streaks).sum() / streaks.sum()),
+        "longest_streak": result["longest_streak"],
+        "hash_ns_per_epoch": result["hash_time"] / num_epochs * 1e9,
+        "select_ns_per_epoch": result["select_time"] / num_epochs * 1e9,
+    }
+
+
+def run_benchmark(staker_counts=(10, 1000, 10000), distributions=("uniform", "pareto"), num_epochs: int = 1_000_000,
+                  exact_epochs: int = 20000):
+    """
+    Simulate staker selection for several staker set sizes and stake distributions, and check the batch rule
+    against StakeIndex. A chi-square per degree of freedom near 1 means the selection frequencies follow the
+    stake shares; the mean streak is about 1 / (1 - p) for stakers with share p.
+    """
+    print(f"{'stakers':>8} {'stakes':<8}{'mode':<8}{'epochs':>9}{'max err':>9}{'chi2/dof':>9}{'unsel':>7}{'top p':>7}{'top f':>7}"
+          f"{'streak':>8}{'longest':>8}{'hash ns':>9}{'sel ns':>8}{'index us':>9}{'diff':>5}")
+    for num_stakers in staker_counts:
+        for distribution in distributions:
+            stakes = generate_stakes(num_stakers, distribution)
+            index_time = measure_index(stakes)
+            mismatches = verify_against_index(stakes, num_epochs=min(exact_epochs, 2000))
+            for exact, epochs in ((False, num_epochs), (True, exact_epochs)):
+                summary = report(simulate(stakes, num_epochs=epochs, exact=exact), epochs)
+                print(f"{num_stakers:>8} {distribution:<8}{'exact' if exact else 'uniform':<8}{epochs:>9}"
+                      f"{summary['max_share_error']:>9.4f}{summary['chi_square_per_dof']:>9.2f}{summary['never_selected']:>7}"
+                      f"{summary['largest_share']:>7.3f}{summary['largest_frequency']:>7.3f}{summary['mean_streak']:>8.3f}"
+                      f"{summary['longest_streak'][0]:>8}{summary['hash_ns_per_epoch']:>9.0f}{summary['select_ns_per_epoch']:>8.0f}"
+                      f"{index_time * 1e6:>9.1f}{mismatches:>5}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
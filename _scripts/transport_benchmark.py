@@ -0,0 +1,103 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from network.host import Host
+from network.message import Message
+from network.transport import TcpTransport
+
+
+def create_host(port: int, peer_port: int, profile: str, flush_latency: float) -> Host:
+    """
+    Create a Host on the loopback interface with the given transport profile, without compression or heartbeats.
+    """
+    return Host({
+        "peers": [f"127.0.0.1:{peer_port}"],
+        "port": port,
+        "transport": {"profile": profile},
+        "compression": {"codecs": []},
+        "outbound": {"flush_latency": flush_latency},
+        "metrics": {"heartbeat_interval": 0},
+        "queues": {"main_blocks": {"maxsize": 4096}},
+    }, node_name="127.0.0.1")
+
+
+async def measure_latency(sender: Host, receiver_identity: str, rounds: int) -> list:
+    """
+    Measure PING/PONG round trip times, one ping at a time.
+    :return: The round trip times in seconds.
+    """
+    rtts = []
+    pong_received = asyncio.Event()
+
+    async def handle_pong(pong: Message):
+        rtts.append(time.perf_counter() - pong.get_content()["sent_at"])
+        pong_received.set()
+
+    sender.message_handler.register_handler("PONG", handle_pong)
+    for _ in range(rounds):
+        pong_received.clear()
+        ping = Message.generate_ping_message(peer=receiver_identity, nonce=uuid.uuid4().hex, sent_at=time.perf_counter(),
+                                             node_name=sender.connection_manager.get_identity())
+        await sender.connection_manager.send(receiver_identity, "PING", ping)
+        await asyncio.wait_for(pong_received.wait(), timeout=5)
+    return rtts
+
+
+async def measure_throughput(sender: Host, receiver: Host, receiver_identity: str, block_size: int, count: int) -> float:
+    """
+    Send block-sized messages as fast as the receiver takes them.
+    :return: The throughput in MB/s.
+    """
+    content = {"data": os.urandom(block_size // 2).hex()}
+    start = time.perf_counter()
+    for _ in range(count):
+        await sender.connection_manager.send(receiver_identity, "MAIN_BLOCK", Message("MAIN_BLOCK", content, "sender"))
+    for _ in range(count):
+        await asyncio.wait_for(receiver.message_handler.get_main_block(), timeout=30)
+    return block_size * count / (time.perf_counter() - start) / 1e6
+
+
+async def run_profile(profile: str, flush_latency: float, rounds: int, block_size: int, count: int, base_port: int) -> dict:
+    """
+    Connect two Hosts with a transport profile and measure latency and throughput between them.
+    """
+    sender = create_host(base_port, base_port + 1, profile, flush_latency)
+    receiver = create_host(base_port + 1, base_port, profile, flush_latency)
+    await asyncio.gather(sender.start(), receiver.start())
+    receiver_identity = f"127.0.0.1:{base_port + 1}"
+    try:
+        rtts = sorted(await measure_latency(sender, receiver_identity, rounds))
+        throughput = await measure_throughput(sender, receiver, receiver_identity, block_size, count)
+    finally:
+        for host in (sender, receiver):
+            await host.stop()
+    return {"p50": rtts[len(rtts) // 2], "p99": rtts[int(len(rtts) * 0.99)], "throughput": throughput}
+
+
+def run_benchmark(profiles=None, event_loops=("asyncio", "uvloop"), flush_latencies=(0.001, 0), rounds: int = 500,
+                  block_size: int = 1024 * 1024, count: int = 50):
+    """
+    Compare the transport profiles and event loops on loopback: PING/PONG round trip time for small messages
+    and throughput for block-sized messages.
+    """
+    profiles = profiles if profiles is not None else list(TcpTransport.PROFILES)
+    print(f"{'profile':<14}{'loop':<10}{'flush ms':>9}{'rtt p50 ms':>12}{'rtt p99 ms':>12}{'MB/s':>9}")
+    base_port = 6100
+    for event_loop in event_loops:
+        installed_loop = TcpTransport.install_event_loop(event_loop)
+        if installed_loop != event_loop:
+            continue
+        for profile in profiles:
+            for flush_latency in flush_latencies:
+                base_port += 2
+                result = asyncio.run(run_profile(profile, flush_latency, rounds, block_size, count, base_port))
+                print(f"{profile:<14}{installed_loop:<10}{flush_latency * 1000:>9.1f}{result['p50'] * 1000:>12.3f}"
+                      f"{result['p99'] * 1000:>12.3f}{result['throughput']:>9.1f}")
+    TcpTransport.install_event_loop("asyncio")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    run_benchmark()
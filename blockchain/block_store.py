@@ -0,0 +1,335 @@
+import os
+import json
+import logging
+import threading
+from blockchain.main_block import MainBlock
+from blockchain.cold_segment import ColdSegment
+
+
+class BlockStore:
+    def __init__(self, node_name: str, data_dir: str = "/app/data", segment_size: int = 1000, snapshot_interval: int = 100,
+                 snapshot_window: int = 1000, hot_segments: int = 1, cold_codec: str = "zlib", compression_level: int = 6):
+        """
+        Initializes an append-only store of the main chain blocks.
+        Blocks are written as one JSON line each into fixed size segment files, next to a snapshot of the most recent
+        chain headers. Older headers are read from the segments when the restored chain first accesses them.
+        Full segments older than the `hot_segments` most recent ones are compressed into cold segments.
+        Blocks are written by the chain listener thread and read from the event loop, e.g. to serve chain sync,
+        so the segment files and the opened cold segments are only accessed with the store lock held.
+        :param node_name: The name of the node owning the store.
+        :param data_dir: The directory of the shared data volume.
+        :param segment_size: The number of blocks per segment file.
+        :param snapshot_interval: The number of blocks between two chain snapshots.
+        :param snapshot_window: The number of most recent headers in a snapshot.
+        :param hot_segments: The number of full segments kept uncompressed, besides the segment being written.
+        :param cold_codec: The codec of cold segments ("zlib", "lzma" or "bz2"), or None to never compress.
+        :param compression_level: The compression level of cold segments.
+        """
+        self.node_name = node_name
+        self.store_dir = os.path.join(data_dir, f"{node_name}_blocks")
+        self.segment_size = segment_size
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_window = snapshot_window
+        self.hot_segments = hot_segments
+        self.cold_codec = cold_codec
+        self.compression_level = compression_level
+        self.cold_segments = {}  # segment number -> opened ColdSegment
+        self.snapshot_path = os.path.join(self.store_dir, "snapshot.json")
+        self.snapshot_height = -1
+        self.blockchain = None
+        self.lock = threading.RLock()
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.height = self.find_height()
+
+    def get_segment_path(self, segment_number: int) -> str:
+        """
+        Get the path of a hot (uncompressed) segment file.
+        :param segment_number: The number of the segment.
+        """
+        return os.path.join(self.store_dir, f"segment_{segment_number:06d}.jsonl")
+
+    def get_cold_segment_path(self, segment_number: int) -> str:
+        """
+        Get the path of a cold (compressed) segment file.
+        :param segment_number: The number of the segment.
+        """
+        return os.path.join(self.store_dir, f"segment_{segment_number:06d}{ColdSegment.FILE_EXTENSION}")
+
+    def get_segment_numbers(self) -> list:
+        """
+        Get the numbers of all segment files in the store, hot and cold, in ascending order.
+        """
+        segment_numbers = set()
+        for file_name in os.listdir(self.store_dir):
+            name, extension = os.path.splitext(file_name)
+            if name.startswith("segment_") and extension in (".jsonl", ColdSegment.FILE_EXTENSION):
+                segment_numbers.add(int(name[len("segment_"):]))
+        return sorted(segment_numbers)
+
+    def is_cold(self, segment_number: int) -> bool:
+        """
+        Check if a segment is compressed.
+        :param segment_number: The number of the segment.
+        """
+        return segment_number in self.cold_segments or os.path.exists(self.get_cold_segment_path(segment_number))
+
+    def get_cold_segment(self, segment_number: int) -> ColdSegment:
+        """
+        Get an opened cold segment, keeping its offset table in memory for random access.
+        :param segment_number: The number of the segment.
+        """
+        if segment_number not in self.cold_segments:
+            self.cold_segments[segment_number] = ColdSegment(self.get_cold_segment_path(segment_number))
+        return self.cold_segments[segment_number]
+
+    def compress_segments(self):
+        """
+        Compress the full hot segments that are older than the `hot_segments` most recent ones.
+        The segment is compressed without holding the lock, readers keep using the hot segment until it is replaced.
+        """
+        if not self.cold_codec:
+            return
+        newest_cold_segment = (self.height + 1) // self.segment_size - 1 - self.hot_segments
+        for segment_number in self.get_segment_numbers():
+            if segment_number > newest_cold_segment:
+                break
+            segment_path = self.get_segment_path(segment_number)
+            with self.lock:
+                if self.is_cold(segment_number):
+                    continue
+                with open(segment_path, "rb") as segment_file:
+                    encoded_blocks = [line.rstrip(b"\n") for line in segment_file if line.strip()]
+
+            cold_path = self.get_cold_segment_path(segment_number)
+            ColdSegment.write(cold_path + ".tmp", encoded_blocks, codec=self.cold_codec, level=self.compression_level)
+            with self.lock:
+                os.replace(cold_path + ".tmp", cold_path)
+                os.remove(segment_path)
+            logging.info(f"Compressed block store segment {segment_number} "
+                         f"({sum(len(block) for block in encoded_blocks)} -> {os.path.getsize(cold_path)} bytes).")
+
+    def decompress_segment(self, segment_number: int):
+        """
+        Turn a cold segment back into a hot segment, e.g. before truncating it.
+        :param segment_number: The number of the segment.
+        """
+        with self.lock:
+            cold_segment = self.get_cold_segment(segment_number)
+            with open(self.get_segment_path(segment_number), "wb") as segment_file:
+                for encoded_block in cold_segment.read_blocks():
+                    segment_file.write(encoded_block + b"\n")
+            os.remove(cold_segment.path)
+            del self.cold_segments[segment_number]
+
+    def find_height(self) -> int:
+        """
+        Find the height of the last stored block by reading only the last segment.
+        :return: The height of the last block, or -1 if the store is empty.
+        """
+        segment_numbers = self.get_segment_numbers()
+        if not segment_numbers:
+            return -1
+        last_segment = segment_numbers[-1]
+        if self.is_cold(last_segment):
+            return last_segment * self.segment_size + self.get_cold_segment(last_segment).block_count - 1
+        with open(self.get_segment_path(last_segment), "r") as segment_file:
+            block_count = sum(1 for line in segment_file if line.strip())
+        return last_segment * self.segment_size + block_count - 1
+
+    def append_block(self, block):
+        """
+        Append a block to the store. A block at or below the stored height replaces the stored blocks from its height on.
+        :param block: The block to append.
+        """
+        with self.lock:
+            if block.index <= self.height:
+                self.truncate(block.index)
+            if block.index != self.height + 1:
+                logging.error(f"Cannot store block {block.index}, the block store is at height {self.height}.")
+                return
+
+            segment_number = block.index // self.segment_size
+            with open(self.get_segment_path(segment_number), "a") as segment_file:
+                segment_file.write(json.dumps(block.to_dict(), separators=(",", ":")) + "\n")
+            self.height = block.index
+
+        if (self.height + 1) % self.segment_size == 0:
+            self.compress_segments()
+
+    def truncate(self, height: int):
+        """
+        Remove all stored blocks from the given height on.
+        :param height: The height of the first block to remove.
+        """
+        with self.lock:
+            first_segment = height // self.segment_size
+            for segment_number in self.get_segment_numbers():
+                if segment_number > first_segment:
+                    for segment_path in (self.get_segment_path(segment_number), self.get_cold_segment_path(segment_number)):
+                        if os.path.exists(segment_path):
+                            os.remove(segment_path)
+                    self.cold_segments.pop(segment_number, None)
+
+            if self.is_cold(first_segment):
+                self.decompress_segment(first_segment)
+            segment_path = self.get_segment_path(first_segment)
+            if os.path.exists(segment_path):
+                with open(segment_path, "r") as segment_file:
+                    lines = segment_file.readlines()
+                with open(segment_path, "w") as segment_file:
+                    segment_file.writelines(lines[:height % self.segment_size])
+
+            if height <= self.snapshot_height:
+                os.remove(self.snapshot_path)
+                self.snapshot_height = -1
+            self.height = min(self.height, height - 1)
+
+    def read_blocks(self, start_height: int = 0):
+        """
+        Iterate over the stored blocks from the given height on.
+        Each segment is read with the lock held, the blocks are decoded and yielded after releasing it.
+        :param start_height: The height of the first block to read.
+        :return: A generator of block dictionaries.
+        """
+        for segment_number in self.get_segment_numbers():
+            if (segment_number + 1) * self.segment_size <= start_height:
+                continue
+            start_position = max(start_height - segment_number * self.segment_size, 0)
+            with self.lock:
+                encoded_blocks = self.read_segment(segment_number, start_position)
+            for encoded_block in encoded_blocks:
+                yield json.loads(encoded_block)
+
+    def read_segment(self, segment_number: int, start_position: int = 0) -> list:
+        """
+        Read the encoded blocks of a segment. Must be called with the lock held.
+        :param segment_number: The number of the segment.
+        :param start_position: The position of the first block to read within the segment.
+        :return: List of encoded blocks, empty if the segment does not exist.
+        """
+        if self.is_cold(segment_number):
+            return list(self.get_cold_segment(segment_number).read_blocks(start_position))
+        segment_path = self.get_segment_path(segment_number)
+        if not os.path.exists(segment_path):
+            return []
+        with open(segment_path, "rb") as segment_file:
+            return [line for offset, line in enumerate(segment_file) if offset >= start_position and line.strip()]
+
+    def get_block(self, height: int):
+        """
+        Read a single block from the store.
+        :param height: The height of the block.
+        :return: The block dictionary, or None if the block is not stored.
+        """
+        with self.lock:
+            if height < 0 or height > self.height:
+                return None
+            segment_number = height // self.segment_size
+            if self.is_cold(segment_number):
+                return json.loads(self.get_cold_segment(segment_number).read_block(height % self.segment_size))
+            with open(self.get_segment_path(segment_number), "rb") as segment_file:
+                for offset, line in enumerate(segment_file):
+                    if offset == height % self.segment_size:
+                        return json.loads(line)
+        return None
+
+    def get_header(self, height: int):
+        """
+        Read the header of a stored block, without its transactions.
+        :param height: The height of the block.
+        :return: The header MainBlock object, or None if the block is not stored.
+        """
+        block_data = self.get_block(height)
+        if block_data is None:
+            return None
+        return MainBlock.from_dict({field: value for field, value in block_data.items() if field != "transactions"})
+
+    def write_snapshot(self, snapshot: dict = None):
+        """
+        Atomically write a snapshot of the attached blockchain to the store.
+        :param snapshot: The snapshot to write, as created by Blockchain.to_snapshot(), or None to create it now.
+        """
+        temporary_path = self.snapshot_path + ".tmp"
+        if snapshot is None:
+            snapshot = self.blockchain.to_snapshot(window=self.snapshot_window)
+        with open(temporary_path, "w") as snapshot_file:
+            json.dump(snapshot, snapshot_file, separators=(",", ":"))
+        with self.lock:
+            os.replace(temporary_path, self.snapshot_path)
+            self.snapshot_height = snapshot["height"]
+
+    def read_snapshot(self):
+        """
+        Read the snapshot from the store.
+        :return: The snapshot dictionary, or None if there is no valid snapshot.
+        """
+        if not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, "r") as snapshot_file:
+                return json.load(snapshot_file)
+        except json.JSONDecodeError:
+            logging.warning(f"Snapshot {self.snapshot_path} is corrupted, ignoring it.")
+            return None
+
+    def restore(self, blockchain):
+        """
+        Restore the blockchain from the snapshot, replay the stored blocks after it and keep the store in sync with the chain.
+        :param blockchain: The Blockchain object, containing only the genesis block.
+        """
+        self.blockchain = blockchain
+        start_height = 1
+
+        snapshot = self.read_snapshot()
+        if snapshot:
+            self.snapshot_height = snapshot["height"]
+            if snapshot["height"] <= self.height and blockchain.load_snapshot(snapshot, load_header=self.get_header):
+                start_height = snapshot["height"] + 1
+                logging.info(f"Restored {self.node_name} chain snapshot at height {snapshot['height']}.")
+
+        replayed_blocks = 0
+        invalid_height = None
+        for block_data in self.read_blocks(start_height=start_height):
+            if not blockchain.add_block(MainBlock.from_dict(block_data)):
+                invalid_height = block_data.get("index")
+                break
+            replayed_blocks += 1
+        if invalid_height is not None:
+            logging.warning(f"Stored block {invalid_height} could not be replayed, truncating the block store.")
+            self.truncate(invalid_height)
+        if replayed_blocks:
+            logging.info(f"Replayed {replayed_blocks} block(s) from the {self.node_name} block store.")
+
+        if self.height < 0:
+            self.append_block(blockchain.get_last_block())
+        blockchain.register_listener(self)
+
+    def capture_state(self, event: str, block) -> dict:
+        """
+        Capture the chain snapshot at snapshot heights, called on the thread changing the chain when the block is
+        connected, so the snapshot written later by the listener thread matches the chain at that block.
+        :param event: The name of the listener method.
+        :param block: The block that joined or left the main chain.
+        :return: The keyword arguments passed along to the listener method.
+        """
+        if event == "block_connected" and self.snapshot_interval and block.index % self.snapshot_interval == 0:
+            return {"snapshot": self.blockchain.to_snapshot(window=self.snapshot_window, height=block.index)}
+        return {}
+
+    def block_connected(self, block, snapshot: dict = None):
+        """
+        Persist a block that joined the main chain.
+        :param block: The connected block.
+        :param snapshot: The chain snapshot captured for the block, if it is at a snapshot height.
+        """
+        self.append_block(block)
+        if snapshot is not None:
+            self.write_snapshot(snapshot)
+
+    def block_disconnected(self, block):
+        """
+        Remove a block that left the main chain.
+        :param block: The disconnected block.
+        """
+        self.truncate(block.index)
@@ -1,17 +1,33 @@
 import time
-import json
 import logging
-import os
+from concurrent.futures import ThreadPoolExecutor
 from blockchain.main_block import MainBlock
+from blockchain.orphan_pool import OrphanPool
+from blockchain.lazy_chain import LazyChain
 from transaction.utils import load_genesis_transactions
 # Blockchain Class 
 class Blockchain:
-  def __init__(self):
+  FORK_CHOICE_RULES = ("longest", "stake")
+
+  def __init__(self, fork_choice: str = "longest", stake_info: dict = None, max_orphans: int = 256):
     """
     Initializes the blockchain with the genesis block.
+    The blockchain keeps a tree of all connected blocks, self.chain is the branch selected by the fork choice rule.
+    :param fork_choice: The fork choice rule, "longest" (height) or "stake" (cumulative stake of the block proposers).
+    :param stake_info: A dictionary of staker IDs and their stakes, used by the "stake" fork choice rule.
+    :param max_orphans: The maximum number of blocks with unknown parents kept in memory.
     """
+    if fork_choice not in self.FORK_CHOICE_RULES:
+      raise ValueError(f"Unknown fork choice rule '{fork_choice}', expected one of {self.FORK_CHOICE_RULES}.")
+    self.fork_choice = fork_choice
+    self.stake_info = stake_info if stake_info is not None else {}
     self.chain = []
-    self.block_lookup_table = {}
+    self.block_lookup_table = {}  # block_hash -> block, for the main chain and all side branches
+    self.block_scores = {}        # block_hash -> fork choice score of the branch ending at the block
+    self.tip_hash = None
+    self.orphan_pool = OrphanPool(max_orphans=max_orphans)
+    self.listeners = []
+    self.listener_executor = None  # Single worker thread notifying the listeners in the background, if enabled
     self.create_genesis_block()
     
 
@@ -34,7 +50,7 @@ class Blockchain:
     self.add_block(genesis_block)
     
 
-  def create_block(self, staker_signature, tx_root, nonce: int=0, nbits=None, shard_data: dict=None,transactions: list=[]):
+  def create_block(self, staker_signature, tx_root, nonce: int=0, nbits=None, shard_data: dict=None,transactions: list=[], version: int=1):
     """
     Creates a new block with the given transaction root.
     :param staker_signature: The signature of the staker.
@@ -42,6 +58,7 @@ class Blockchain:
     :param nonce: The nonce value for the block (for backward compatability).
     :param nbits: The target difficulty for the block. (for backward compatability).
     :param transactions: List of transactions to be included in the block.
+    :param version: The block format version, see MainBlock.
     """
     previous_block = self.get_last_block()
     previous_hash = previous_block.compute_hash()
@@ -55,20 +72,170 @@ class Blockchain:
       nbits = nbits,
       nonce = nonce,
       shard_data = shard_data if shard_data is not None else {},
-      transactions = transactions
+      transactions = transactions,
+      version = version
     )
     return new_block
   
   def add_block(self, block):
     """
-    Add a block to the blockchain after validation.
+    Add a block to the block tree after validation.
+    Blocks whose parent is unknown are buffered in the orphan pool and connected once the parent arrives.
     :param block: The block to be added.
+    :return: True if the block was connected to the block tree, False otherwise.
     """
+    block_hash = block.compute_hash()
+    if block_hash in self.block_lookup_table:
+      return False
+
+    if block.index != 0 and block.previous_hash not in self.block_lookup_table:
+      if self.orphan_pool.add_orphan(block, block_hash):
+        logging.info(f"Block {block.index} buffered as orphan, waiting for parent {block.previous_hash[:16]}.")
+      return False
+
+    if block.index != 0 and block.previous_hash not in self.block_scores:
+      logging.warning(f"Block {block.index} branches off below the restored snapshot, rejecting it.")
+      return False
+
     if not self.is_block_valid(block):
       return False
-    self.chain.append(block)
-    self.block_lookup_table[block.compute_hash()] = block
+    self.connect_block(block, block_hash)
+
+    # Connect any orphans that were waiting for this block
+    connected_hashes = [block_hash]
+    while connected_hashes:
+      parent_hash = connected_hashes.pop()
+      for child_hash, child_block in self.orphan_pool.pop_children(parent_hash):
+        if self.is_block_valid(child_block):
+          self.connect_block(child_block, child_hash)
+          connected_hashes.append(child_hash)
     return True
+
+  def connect_block(self, block, block_hash):
+    """
+    Connect a validated block to the block tree and apply the fork choice rule.
+    :param block: The block to be connected.
+    :param block_hash: The hash of the block.
+    """
+    block.block_hash = block_hash
+    self.block_lookup_table[block_hash] = block
+    self.block_scores[block_hash] = self.calculate_score(block)
+
+    if self.tip_hash is None or self.block_scores[block_hash] > self.block_scores[self.tip_hash]:
+      self.set_tip(block, block_hash)
+
+  def calculate_score(self, block):
+    """
+    Calculate the fork choice score of the branch ending at the block from its parent's score.
+    Scores are compared as tuples, the height breaks ties between equally staked branches.
+    :param block: The block to be scored.
+    """
+    if self.fork_choice == "stake":
+      parent_stake = self.block_scores[block.previous_hash][0] if block.index != 0 else 0
+      return (parent_stake + self.get_proposer_stake(block), block.index)
+    return (block.index,)
+
+  def get_proposer_stake(self, block):
+    """
+    Returns the stake of the staker that proposed the block.
+    :param block: The block whose proposer is looked up.
+    """
+    staker_id = str(block.staker_signature).split(":")[0]
+    return self.stake_info.get(staker_id, 0)
+
+  def set_tip(self, block, block_hash):
+    """
+    Make the block the tip of the main chain, switching branches if it does not extend the current tip.
+    :param block: The new tip.
+    :param block_hash: The hash of the new tip.
+    """
+    branch = []
+    cursor, cursor_hash = block, block_hash
+    while not self.is_in_main_chain(cursor, cursor_hash):
+      branch.append(cursor)
+      if cursor.index == 0:
+        break
+      cursor_hash = cursor.previous_hash
+      cursor = self.block_lookup_table[cursor_hash]
+    else:
+      disconnected_blocks = self.chain[cursor.index + 1:]
+      if disconnected_blocks:
+        logging.info(f"Chain reorganization at height {cursor.index + 1}, switching {len(disconnected_blocks)} block(s).")
+      del self.chain[cursor.index + 1:]
+      for disconnected_block in reversed(disconnected_blocks):
+        self.notify_listeners("block_disconnected", disconnected_block)
+
+    branch.reverse()
+    self.chain.extend(branch)
+    self.tip_hash = block_hash
+    for connected_block in branch:
+      self.notify_listeners("block_connected", connected_block)
+
+  def register_listener(self, listener):
+    """
+    Register a listener that is notified when blocks join or leave the main chain.
+    A listener may also implement capture_state(event, block), called on the thread changing the chain, whose
+    returned dictionary is passed as keyword arguments to the listener method, e.g. chain state for a background listener.
+    :param listener: An object implementing block_connected(block) and block_disconnected(block).
+    """
+    self.listeners.append(listener)
+
+  def start_background_listeners(self):
+    """
+    Notify the listeners from a single background thread from now on, so persisting and indexing blocks
+    does not hold up the caller of add_block. Events are still delivered in order.
+    """
+    if self.listener_executor is None:
+      self.listener_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chain-listeners")
+
+  def stop_background_listeners(self):
+    """
+    Wait for the pending listener notifications, then notify the listeners synchronously again.
+    """
+    if self.listener_executor is not None:
+      self.listener_executor.shutdown(wait=True)
+      self.listener_executor = None
+
+  def notify_listeners(self, event, block):
+    """
+    Notify all listeners of a main chain event.
+    :param event: The name of the listener method, "block_connected" or "block_disconnected".
+    :param block: The block that joined or left the main chain.
+    """
+    captured_states = []
+    for listener in self.listeners:
+      try:
+        state = listener.capture_state(event, block) if hasattr(listener, "capture_state") else {}
+      except Exception as e:
+        logging.error(f"Listener {type(listener).__name__} failed to capture {event} for block {block.index}: {e}")
+        state = {}
+      captured_states.append((listener, state))
+
+    if self.listener_executor is not None:
+      self.listener_executor.submit(self.call_listeners, event, block, captured_states)
+    else:
+      self.call_listeners(event, block, captured_states)
+
+  def call_listeners(self, event, block, captured_states):
+    """
+    Call the listeners for a main chain event, logging their failures.
+    :param event: The name of the listener method.
+    :param block: The block that joined or left the main chain.
+    :param captured_states: List of (listener, keyword arguments) tuples captured when the event occurred.
+    """
+    for listener, state in captured_states:
+      try:
+        getattr(listener, event)(block, **state)
+      except Exception as e:
+        logging.error(f"Listener {type(listener).__name__} failed on {event} for block {block.index}: {e}")
+
+  def is_in_main_chain(self, block, block_hash):
+    """
+    Check if the block is part of the main chain.
+    :param block: The block to be checked.
+    :param block_hash: The hash of the block.
+    """
+    return block.index < len(self.chain) and self.chain[block.index].block_hash == block_hash
   
   def get_last_block(self):
     """
@@ -88,6 +255,35 @@ class Blockchain:
       return None
     return self.block_lookup_table.get(previous_hash, None)
   
+  def get_locator(self):
+    """
+    Returns a block locator: main chain hashes from the tip backwards, dense for the last 10 blocks and then
+    exponentially spaced down to the genesis block, so a peer can find the fork point in O(log n) hashes.
+    """
+    locator = []
+    height, step = len(self.chain) - 1, 1
+    while height > 0:
+      locator.append(self.chain[height].block_hash)
+      if len(locator) >= 10:
+        step *= 2
+      height -= step
+    locator.append(self.chain[0].block_hash)
+    return locator
+
+  def get_headers_after(self, locator, max_headers):
+    """
+    Returns the main chain headers following the first locator hash that is on the main chain.
+    :param locator: A list of block hashes, as created by get_locator().
+    :param max_headers: The maximum number of headers to return.
+    """
+    start_height = 1
+    for block_hash in locator:
+      block = self.block_lookup_table.get(block_hash)
+      if block is not None and self.is_in_main_chain(block, block_hash):
+        start_height = block.index + 1
+        break
+    return [block.to_header_dict() for block in self.chain[start_height:start_height + max_headers]]
+
   def is_block_valid(self, block):
     """
     Validates the block by checking its proof of work and previous.
@@ -104,6 +300,10 @@ class Blockchain:
     if previous_block is None:
       return False
 
+    # Validate height
+    if block.index != previous_block.index + 1:
+      return False
+
     # Validate previous hash
     if block.previous_hash != previous_block.compute_hash():
       return False
@@ -129,49 +329,104 @@ class Blockchain:
   def replace_chain(self, new_chain):
     """
     Replaces the current chain with a new chain if the new chain is valid.
+    The new blocks are connected to the block tree and the tip is moved to the end of the new chain,
+    so listeners see the replaced blocks disconnected and the new ones connected.
     :param new_chain: The new chain to replace the current chain with.
     """
     if len(new_chain) <= len(self.chain):
       return False
     if not self.is_chain_valid():
       return False
-    self.chain = new_chain
-    self.block_lookup_table = {block.compute_hash(): block for block in new_chain}
+    for block in new_chain:
+      block_hash = block.compute_hash()
+      if block_hash not in self.block_lookup_table:
+        if not self.is_block_valid(block):
+          return False
+        self.connect_block(block, block_hash)
+    new_tip_hash = new_chain[-1].compute_hash()
+    if self.tip_hash != new_tip_hash:
+      self.set_tip(self.block_lookup_table[new_tip_hash], new_tip_hash)
     return True
   
-  def write_to_json(self, node_name, block, file_path=None):
-      """
-      Append a new block to the blockchain JSON file in the shared docker volume.
-
-      :param node_name: The name of the staker node.
-      :param block: The new block to append.
-      :param file_path: Optional custom file path. If not provided, the filename will be based on the node name.
-      """
-      try:
-          # Default filename in the shared volume directory
-          if not file_path:
-              file_path = f"/app/data/{node_name}_blockchain.json"
-
-          # Check if the file exists and is not empty
-          if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-              # Reading the existing blockchain
-              try:
-                  with open(file_path, "r") as json_file:
-                      blockchain_data = json.load(json_file)
-              except json.JSONDecodeError:
-                  logging.warning(f"File {file_path} is corrupted. Reinitializing.")
-                  blockchain_data = []
-          else:
-              # Initialize a new blockchain file if it does not exist or is empty
-              blockchain_data = []
-
-          # Add the new block
-          blockchain_data.append(block.to_dict())
-
-          # Write back to the JSON file
-          with open(file_path, "w") as json_file:
-              json.dump(blockchain_data, json_file, indent=4)
-
-          # logging.info(f"Block {block.index} added to {file_path}.")
-      except Exception as e:
-          logging.error(f"Failed to append block to {file_path}: {e}")
+  def to_snapshot(self, window: int = 1000, height: int = None):
+    """
+    Create a compact snapshot of the main chain: the fork choice state and the headers (without transactions) of the
+    most recent blocks, so the snapshot size does not grow with the chain. Older headers stay in the block store.
+    Must be called on the thread changing the chain, see BlockStore.capture_state().
+    :param window: The number of most recent headers in the snapshot.
+    :param height: The height of the last header in the snapshot, the tip if None.
+    :return: A dictionary that can be serialized to JSON.
+    """
+    end_height = height + 1 if height is not None else len(self.chain)
+    chain = self.chain[max(0, end_height - window):end_height]
+    header_fields = ["index", "timestamp", "previous_hash", "tx_root", "staker_signature", "nbits", "nonce", "shard_data", "block_hash", "version"]
+    headers = [
+      [getattr(block, field) for field in header_fields] + [list(self.block_scores[block.block_hash])]
+      for block in chain
+    ]
+    return {
+      "fork_choice": self.fork_choice,
+      "height": chain[-1].index,
+      "tip_hash": chain[-1].block_hash,
+      "header_fields": header_fields + ["score"],
+      "headers": headers,
+    }
+
+  def load_snapshot(self, snapshot, load_header=None):
+    """
+    Restore the main chain from a snapshot created by to_snapshot().
+    The snapshot is trusted, so headers are neither re-hashed nor re-validated.
+    Restored blocks carry no transactions, their bodies stay in the block store. Headers older than the snapshot
+    are loaded with `load_header` when they are first accessed; blocks branching off below the snapshot are rejected.
+    :param snapshot: The snapshot dictionary.
+    :param load_header: Function returning the header block at a height, required if the snapshot does not start at the genesis block.
+    :return: True if the snapshot was loaded, False if it does not match this blockchain.
+    """
+    if snapshot.get("fork_choice") != self.fork_choice:
+      logging.warning(f"Snapshot uses fork choice '{snapshot.get('fork_choice')}', expected '{self.fork_choice}'.")
+      return False
+
+    fields = snapshot["header_fields"]
+    headers = [dict(zip(fields, header)) for header in snapshot["headers"]]
+    if not headers:
+      logging.warning("Snapshot contains no headers.")
+      return False
+    start_height = headers[0]["index"]
+    if start_height == 0 and headers[0]["block_hash"] != self.chain[0].block_hash:
+      logging.warning("Snapshot does not start at the genesis block.")
+      return False
+    if start_height > 0 and load_header is None:
+      logging.warning(f"Snapshot starts at height {start_height}, but there is no block store to load the older headers from.")
+      return False
+
+    genesis_block = self.chain[0]
+    self.block_lookup_table = {}
+    self.block_scores = {}
+    blocks = []
+    for header in headers:
+      score = tuple(header.pop("score"))
+      block = MainBlock(**header)
+      blocks.append(block)
+      self.block_lookup_table[block.block_hash] = block
+      self.block_scores[block.block_hash] = score
+
+    if start_height > 0:
+      self.block_lookup_table[genesis_block.block_hash] = genesis_block
+      self.chain = LazyChain(genesis_block, blocks, lambda height: self.load_stored_header(height, load_header))
+    else:
+      self.chain = blocks
+    self.tip_hash = self.chain[-1].block_hash
+    return True
+
+  def load_stored_header(self, height, load_header):
+    """
+    Load a main chain header older than the restored snapshot, making it known to the block tree.
+    Such headers have no fork choice score, so no block can be connected to them.
+    :param height: The height of the header.
+    :param load_header: Function returning the header block at a height.
+    """
+    block = load_header(height)
+    if block is None or block.index != height:
+      raise IndexError(f"Block {height} is missing from the block store.")
+    self.block_lookup_table[block.block_hash] = block
+    return block
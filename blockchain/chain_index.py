@@ -0,0 +1,147 @@
+import sqlite3
+import logging
+import threading
+from blockchain.main_block import MainBlock
+
+
+class ChainIndex:
+    def __init__(self, db_path: str):
+        """
+        Initializes the secondary indexes of the main chain in an embedded SQLite database:
+        txid -> (height, position) and address (sender or recipient) -> txids.
+        The indexes follow the main chain as a Blockchain listener and are rolled back on reorganizations.
+        :param db_path: Path of the SQLite database file.
+
+        reference: https://docs.python.org/3/library/sqlite3.html
+        """
+        self.lock = threading.Lock()  # The webserver thread reads while the node writes
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS blocks (height INTEGER PRIMARY KEY, block_hash TEXT NOT NULL)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS transactions ("
+                "height INTEGER NOT NULL, position INTEGER NOT NULL, txid TEXT NOT NULL, "
+                "PRIMARY KEY (height, position)) WITHOUT ROWID")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS transactions_by_txid ON transactions (txid)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS address_history ("
+                "address TEXT NOT NULL, height INTEGER NOT NULL, position INTEGER NOT NULL, txid TEXT NOT NULL, "
+                "PRIMARY KEY (address, height, position)) WITHOUT ROWID")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS address_history_by_height ON address_history (height)")
+
+    def get_indexed_height(self) -> int:
+        """
+        Get the height of the last indexed block, or -1 if nothing is indexed.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT MAX(height) FROM blocks").fetchone()
+        return row[0] if row[0] is not None else -1
+
+    def get_indexed_hash(self, height: int):
+        """
+        Get the hash of the block indexed at a height.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT block_hash FROM blocks WHERE height = ?", (height,)).fetchone()
+        return row[0] if row else None
+
+    def block_connected(self, block):
+        """
+        Index the transactions of a block that joined the main chain.
+        :param block: The connected block.
+        """
+        transaction_rows = []
+        address_rows = []
+        for position, tx in enumerate(block.transactions):
+            txid = tx.calculate_hash()
+            transaction_rows.append((block.index, position, txid))
+            for address in {tx.sender, tx.recipient}:
+                address_rows.append((address, block.index, position, txid))
+
+        with self.lock, self.connection:
+            self.delete_from_height(block.index)
+            self.connection.execute("INSERT INTO blocks (height, block_hash) VALUES (?, ?)", (block.index, block.block_hash))
+            self.connection.executemany("INSERT INTO transactions (height, position, txid) VALUES (?, ?, ?)", transaction_rows)
+            self.connection.executemany("INSERT INTO address_history (address, height, position, txid) VALUES (?, ?, ?, ?)", address_rows)
+
+    def block_disconnected(self, block):
+        """
+        Roll back the indexes of a block that left the main chain.
+        :param block: The disconnected block.
+        """
+        with self.lock, self.connection:
+            self.delete_from_height(block.index)
+
+    def delete_from_height(self, height: int):
+        """
+        Delete all index entries from the given height on. Must be called with the lock held, inside a transaction.
+        """
+        self.connection.execute("DELETE FROM blocks WHERE height >= ?", (height,))
+        self.connection.execute("DELETE FROM transactions WHERE height >= ?", (height,))
+        self.connection.execute("DELETE FROM address_history WHERE height >= ?", (height,))
+
+    def sync_with_chain(self, blockchain, block_store=None):
+        """
+        Bring the persisted indexes in line with the main chain, then follow the chain as a listener.
+        Blocks indexed on a branch that is no longer the main chain are rolled back, missing blocks are indexed
+        from the block store (for headers restored from a snapshot) or from the chain itself.
+        :param blockchain: The Blockchain object.
+        :param block_store: Optional BlockStore holding the block bodies.
+        """
+        indexed_height = min(self.get_indexed_height(), len(blockchain.chain) - 1)
+        while indexed_height >= 0 and self.get_indexed_hash(indexed_height) != blockchain.chain[indexed_height].block_hash:
+            indexed_height -= 1
+        with self.lock, self.connection:
+            self.delete_from_height(indexed_height + 1)
+
+        start_height = indexed_height + 1
+        if block_store is not None:
+            for block_data in block_store.read_blocks(start_height=start_height):
+                height = block_data.get("index")
+                if height >= len(blockchain.chain) or block_data.get("block_hash") != blockchain.chain[height].block_hash:
+                    break
+                self.block_connected(MainBlock.from_dict(block_data))
+                start_height = height + 1
+        for block in blockchain.chain[start_height:]:
+            self.block_connected(block)
+
+        logging.info(f"Transaction index synced at height {self.get_indexed_height()}.")
+        blockchain.register_listener(self)
+
+    def get_transaction_locations(self, txid: str) -> list:
+        """
+        Find the main chain blocks that include a transaction.
+        :param txid: The transaction hash.
+        :return: List of dictionaries with the height and position of the transaction, most recent first.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT height, position FROM transactions WHERE txid = ? ORDER BY height DESC", (txid,)).fetchall()
+        return [{"height": height, "position": position} for height, position in rows]
+
+    def get_address_history(self, address: str, limit: int = 100, before_height: int = None) -> list:
+        """
+        Get the transactions sent or received by an address, most recent first.
+        :param address: The sender or recipient address.
+        :param limit: The maximum number of entries to return.
+        :param before_height: Only return entries below this height, used to page through long histories.
+        :return: List of dictionaries with the txid, height and position of each transaction.
+        """
+        if before_height is None:
+            before_height = self.get_indexed_height() + 1
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT txid, height, position FROM address_history WHERE address = ? AND height < ? "
+                "ORDER BY height DESC, position DESC LIMIT ?", (address, before_height, limit)).fetchall()
+        return [{"txid": txid, "height": height, "position": position} for txid, height, position in rows]
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self.lock:
+            self.connection.close()
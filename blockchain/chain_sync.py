@@ -0,0 +1,262 @@
+import uuid
+import asyncio
+import logging
+from collections import deque
+from typing import List
+from network.host import Host
+from network.message import Message
+from network.peer import Peer
+from blockchain.blockchain import Blockchain
+from blockchain.main_block import MainBlock
+
+
+class ChainSync:
+    def __init__(self, host: Host, blockchain: Blockchain, node_name: str, sync_peers: List[Peer], block_store=None, sync_config: dict = None):
+        """
+        Initializes the headers-first chain synchronization between stakers.
+        :param host: The Host used to exchange sync messages.
+        :param blockchain: The Blockchain object to synchronize.
+        :param node_name: The name of this node.
+        :param sync_peers: The peers (other stakers) to synchronize with.
+        :param block_store: Optional BlockStore used to serve block bodies restored from a snapshot.
+        :param sync_config: Optional sync settings (max_headers, blocks_per_request, window, request_timeout).
+        """
+        sync_config = sync_config if sync_config is not None else {}
+        self.host = host
+        self.blockchain = blockchain
+        self.node_name = node_name
+        self.sync_peers = sync_peers
+        self.peers_by_name = {peer.get_hostname(): peer for peer in sync_peers}
+        self.block_store = block_store
+        self.max_headers = sync_config.get("max_headers", 500)
+        self.blocks_per_request = sync_config.get("blocks_per_request", 16)
+        self.window = sync_config.get("window", 4)
+        self.request_timeout = sync_config.get("request_timeout", 10)
+        self.pending_requests = {}  # request_id -> Future resolved with the response content
+        self.sync_lock = asyncio.Lock()
+
+    async def serve_requests(self):
+        """
+        Answer GET_HEADERS and GET_BLOCKS requests from other stakers.
+        """
+        while True:
+            try:
+                request = await self.host.message_handler.get_sync_request()
+                peer = self.peers_by_name.get(request.get_sender())
+                if peer is None:
+                    logging.warning(f"Ignoring {request.get_content_type()} from unknown peer {request.get_sender()}.")
+                    continue
+
+                content = request.get_content()
+                if request.get_content_type() == "GET_HEADERS":
+                    max_headers = min(content.get("max_headers", self.max_headers), self.max_headers)
+                    headers = self.blockchain.get_headers_after(content.get("locator", []), max_headers)
+                    response = Message.generate_headers_message(headers=headers, request_id=content["request_id"], node_name=self.node_name)
+                else:
+                    blocks = [self.get_block_body(block_hash) for block_hash in content.get("block_hashes", [])]
+                    blocks = [block for block in blocks if block is not None]
+                    response = Message.generate_blocks_message(blocks=blocks, request_id=content["request_id"], node_name=self.node_name)
+                await self.host.send_message(peer, response)
+            except Exception as e:
+                logging.error(f"Error serving sync request: {e}")
+
+    def get_block_body(self, block_hash: str):
+        """
+        Get the full block for a hash, reading it from the block store if only its header is in memory.
+        :param block_hash: The hash of the block.
+        :return: The block dictionary, or None if the block is unknown.
+        """
+        block = self.blockchain.block_lookup_table.get(block_hash)
+        if block is None:
+            return None
+        if not block.transactions and self.block_store is not None:
+            stored_block = self.block_store.get_block(block.index)
+            if stored_block is not None and stored_block.get("block_hash") == block_hash:
+                return stored_block
+        return block.to_dict()
+
+    async def dispatch_responses(self):
+        """
+        Resolve pending requests with the HEADERS and BLOCKS responses received from peers.
+        """
+        while True:
+            response = await self.host.message_handler.get_sync_response()
+            future = self.pending_requests.get(response.get_content().get("request_id"))
+            if future is not None and not future.done():
+                future.set_result(response.get_content())
+
+    async def request(self, peer: Peer, message: Message, request_id: str):
+        """
+        Send a request to a peer and wait for its response.
+        :return: The response content, or None if the peer did not answer in time.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending_requests[request_id] = future
+        try:
+            await self.host.send_message(peer, message)
+            return await asyncio.wait_for(future, timeout=self.request_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Sync request {message.get_content_type()} to {peer} timed out.")
+            return None
+        finally:
+            self.pending_requests.pop(request_id, None)
+
+    async def request_headers(self, peer: Peer, locator: list):
+        """
+        Request the headers following the locator from a peer.
+        """
+        request_id = uuid.uuid4().hex
+        message = Message.generate_get_headers_message(locator=locator, max_headers=self.max_headers, request_id=request_id, node_name=self.node_name)
+        response = await self.request(peer, message, request_id)
+        return response.get("headers", []) if response is not None else None
+
+    async def request_blocks(self, peer: Peer, block_hashes: list):
+        """
+        Request full blocks by hash from a peer.
+        """
+        request_id = uuid.uuid4().hex
+        message = Message.generate_get_blocks_message(block_hashes=block_hashes, request_id=request_id, node_name=self.node_name)
+        response = await self.request(peer, message, request_id)
+        return response.get("blocks", []) if response is not None else None
+
+    def validate_headers(self, headers: list):
+        """
+        Validate that the headers hash correctly and link to each other and to a known block.
+        :param headers: List of header dictionaries, in ascending height.
+        :return: List of header MainBlock objects, or None if the headers are invalid.
+        """
+        header_blocks = [MainBlock.from_dict(header) for header in headers]
+        previous_block = self.blockchain.block_lookup_table.get(header_blocks[0].previous_hash)
+        if previous_block is None:
+            return None
+
+        for header, header_block in zip(headers, header_blocks):
+            if header_block.block_hash != header.get("block_hash"):
+                return None
+            if header_block.previous_hash != previous_block.block_hash or header_block.index != previous_block.index + 1:
+                return None
+            previous_block = header_block
+        return header_blocks
+
+    def validate_body(self, block_data: dict, header_block: MainBlock):
+        """
+        Validate a downloaded block against its header.
+        :return: The MainBlock object, or None if the body does not match the header.
+        """
+        block = MainBlock.from_dict(block_data)
+        if block.block_hash != header_block.block_hash:
+            return None
+        if not block.verify_transactions():
+            return None
+        return block
+
+    async def synchronize(self):
+        """
+        Catch up with the other stakers: fetch missing headers in bulk, validate the hash links,
+        then download the block bodies in parallel from several peers. Peers are tried in order of latency.
+        """
+        if not self.sync_peers or self.sync_lock.locked():
+            return
+        async with self.sync_lock:
+            sync_peers = self.host.peer_manager.rank_peers(self.sync_peers)
+            peer_offset = 0
+            last_header_hash = None  # The last header of the previous batch, where the next batch continues
+            while True:
+                peer = sync_peers[peer_offset % len(sync_peers)]
+                locator = self.blockchain.get_locator()
+                if last_header_hash is not None:
+                    locator = [last_header_hash] + locator
+                headers = await self.request_headers(peer, locator)
+                if headers is None:
+                    peer_offset += 1
+                    if peer_offset >= len(sync_peers):
+                        break
+                    continue
+                if not headers:
+                    break
+
+                header_blocks = self.validate_headers(headers)
+                if header_blocks is None:
+                    logging.warning(f"Invalid headers received from {peer}.")
+                    peer_offset += 1
+                    if peer_offset >= len(sync_peers):
+                        break
+                    continue
+
+                if header_blocks[-1].block_hash == last_header_hash:
+                    # The peer answered with the same batch again, the sync makes no progress
+                    break
+
+                missing_headers = [header for header in header_blocks if header.block_hash not in self.blockchain.block_lookup_table]
+                logging.info(f"Received {len(headers)} headers from {peer}, downloading {len(missing_headers)} block(s).")
+                if not await self.download_blocks(missing_headers, sync_peers):
+                    break
+                if len(headers) < self.max_headers:
+                    break
+                # Continue after this batch even if it did not move the tip, e.g. a known branch with less work,
+                # so a full batch of known headers is not requested again with the same locator
+                last_header_hash = header_blocks[-1].block_hash
+            logging.info(f"Chain sync finished at height {self.blockchain.get_last_block().index}.")
+
+    async def download_blocks(self, header_blocks: list, sync_peers: list = None) -> bool:
+        """
+        Download and connect the bodies of the given headers, keeping up to `window` requests in flight
+        spread round-robin over the sync peers. Batches are connected in height order as they arrive.
+        :param header_blocks: List of header MainBlock objects, in ascending height.
+        :param sync_peers: The peers to download from, fastest first; all sync peers by default.
+        :return: True if all blocks were downloaded and connected.
+        """
+        sync_peers = sync_peers if sync_peers else self.sync_peers
+        batches = [header_blocks[i:i + self.blocks_per_request] for i in range(0, len(header_blocks), self.blocks_per_request)]
+        queued_batches = deque(range(len(batches)))
+        attempts = [0] * len(batches)
+        received_batches = {}
+        in_flight = {}
+        next_batch_to_connect = 0
+
+        while queued_batches or in_flight:
+            while queued_batches and len(in_flight) < self.window:
+                batch_number = queued_batches.popleft()
+                peer = sync_peers[(batch_number + attempts[batch_number]) % len(sync_peers)]
+                block_hashes = [header.block_hash for header in batches[batch_number]]
+                task = asyncio.create_task(self.request_blocks(peer, block_hashes))
+                in_flight[task] = (batch_number, peer)
+
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                batch_number, peer = in_flight.pop(task)
+                blocks = self.match_bodies(task.result(), batches[batch_number])
+                if blocks is None:
+                    attempts[batch_number] += 1
+                    if attempts[batch_number] >= len(sync_peers):
+                        logging.error("Could not download block bodies from any peer, aborting chain sync.")
+                        for pending_task in in_flight:
+                            pending_task.cancel()
+                        return False
+                    logging.warning(f"Block bodies from {peer} missing or invalid, retrying with another peer.")
+                    queued_batches.append(batch_number)
+                else:
+                    received_batches[batch_number] = blocks
+
+            while next_batch_to_connect in received_batches:
+                for block in received_batches.pop(next_batch_to_connect):
+                    self.blockchain.add_block(block)
+                next_batch_to_connect += 1
+        return True
+
+    def match_bodies(self, blocks_data, header_batch: list):
+        """
+        Match a BLOCKS response to the requested headers.
+        :return: List of validated MainBlock objects in header order, or None if any body is missing or invalid.
+        """
+        if blocks_data is None:
+            return None
+        bodies_by_hash = {block_data.get("block_hash"): block_data for block_data in blocks_data}
+        blocks = []
+        for header_block in header_batch:
+            block_data = bodies_by_hash.get(header_block.block_hash)
+            block = self.validate_body(block_data, header_block) if block_data is not None else None
+            if block is None:
+                return None
+            blocks.append(block)
+        return blocks
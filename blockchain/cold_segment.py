@@ -0,0 +1,123 @@
+import bz2
+import lzma
+import zlib
+import struct
+
+
+class ColdSegment:
+    """
+    A compressed, read-only block store segment.
+    Every block is compressed as an independent frame so a single block can be read without decompressing
+    the whole segment. The zlib codec primes each frame with a per-segment dictionary built from the
+    segment's own blocks, which captures the repeated keys and transaction data shared between blocks.
+
+    File layout:
+        header      MAGIC, version, codec id, block count, dictionary length
+        dictionary  raw dictionary bytes (zlib only)
+        offsets     block count + 1 unsigned 64-bit frame offsets, relative to the end of the offset table
+        frames      compressed blocks
+
+    references:
+        https://docs.python.org/3/library/zlib.html#zlib.compressobj
+        https://docs.python.org/3/library/lzma.html
+    """
+    MAGIC = b"SSEG"
+    VERSION = 1
+    HEADER = struct.Struct("!4sBBII")
+    OFFSET = struct.Struct("!Q")
+    CODECS = {"zlib": 1, "lzma": 2, "bz2": 3}
+    DICTIONARY_SIZE = 32 * 1024  # zlib only uses the last 32 KiB of a preset dictionary
+    FILE_EXTENSION = ".seg"
+
+    def __init__(self, path: str):
+        """
+        Open a cold segment for random access reads.
+        :param path: The path of the segment file.
+        """
+        self.path = path
+        with open(path, "rb") as segment_file:
+            magic, version, codec_id, self.block_count, dictionary_length = self.HEADER.unpack(segment_file.read(self.HEADER.size))
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError(f"{path} is not a cold block segment.")
+            self.dictionary = segment_file.read(dictionary_length)
+            offsets_size = (self.block_count + 1) * self.OFFSET.size
+            offsets_data = segment_file.read(offsets_size)
+        self.codec = {codec_id: codec for codec, codec_id in self.CODECS.items()}[codec_id]
+        self.offsets = [offset for (offset,) in self.OFFSET.iter_unpack(offsets_data)]
+        self.frames_start = self.HEADER.size + dictionary_length + offsets_size
+
+    @classmethod
+    def build_dictionary(cls, encoded_blocks: list) -> bytes:
+        """
+        Build a preset dictionary from a sample of the segment's blocks.
+        :param encoded_blocks: List of encoded blocks (bytes).
+        """
+        sample = b"".join(encoded_blocks[:16])
+        return sample[-cls.DICTIONARY_SIZE:]
+
+    @classmethod
+    def compress_block(cls, data: bytes, codec: str, dictionary: bytes, level: int) -> bytes:
+        """
+        Compress a single block into an independent frame.
+        """
+        if codec == "zlib":
+            compressor = zlib.compressobj(level, zdict=dictionary) if dictionary else zlib.compressobj(level)
+            return compressor.compress(data) + compressor.flush()
+        if codec == "lzma":
+            return lzma.compress(data, preset=min(level, 9))
+        return bz2.compress(data, compresslevel=max(1, min(level, 9)))
+
+    def decompress_block(self, data: bytes) -> bytes:
+        """
+        Decompress a single frame of this segment.
+        """
+        if self.codec == "zlib":
+            decompressor = zlib.decompressobj(zdict=self.dictionary) if self.dictionary else zlib.decompressobj()
+            return decompressor.decompress(data) + decompressor.flush()
+        if self.codec == "lzma":
+            return lzma.decompress(data)
+        return bz2.decompress(data)
+
+    @classmethod
+    def write(cls, path: str, encoded_blocks: list, codec: str = "zlib", level: int = 6):
+        """
+        Write a cold segment.
+        :param path: The path of the segment file.
+        :param encoded_blocks: List of encoded blocks (bytes), in ascending height.
+        :param codec: The compression codec, one of CODECS.
+        :param level: The compression level.
+        """
+        if codec not in cls.CODECS:
+            raise ValueError(f"Unknown segment codec '{codec}', expected one of {list(cls.CODECS)}.")
+        dictionary = cls.build_dictionary(encoded_blocks) if codec == "zlib" else b""
+        frames = [cls.compress_block(data, codec, dictionary, level) for data in encoded_blocks]
+
+        offsets = [0]
+        for frame in frames:
+            offsets.append(offsets[-1] + len(frame))
+
+        with open(path, "wb") as segment_file:
+            segment_file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, cls.CODECS[codec], len(frames), len(dictionary)))
+            segment_file.write(dictionary)
+            segment_file.write(b"".join(cls.OFFSET.pack(offset) for offset in offsets))
+            segment_file.writelines(frames)
+
+    def read_block(self, position: int) -> bytes:
+        """
+        Read and decompress a single block.
+        :param position: The position of the block in the segment.
+        """
+        start, end = self.offsets[position], self.offsets[position + 1]
+        with open(self.path, "rb") as segment_file:
+            segment_file.seek(self.frames_start + start)
+            return self.decompress_block(segment_file.read(end - start))
+
+    def read_blocks(self, start_position: int = 0):
+        """
+        Iterate over the decompressed blocks from the given position on.
+        :param start_position: The position of the first block to read.
+        """
+        with open(self.path, "rb") as segment_file:
+            segment_file.seek(self.frames_start + self.offsets[start_position])
+            for position in range(start_position, self.block_count):
+                yield self.decompress_block(segment_file.read(self.offsets[position + 1] - self.offsets[position]))
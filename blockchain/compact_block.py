@@ -0,0 +1,252 @@
+import uuid
+import asyncio
+import hashlib
+import logging
+from typing import List
+from network.message import Message
+from network.peer import Peer
+from blockchain.main_block import MainBlock
+from transaction.transaction import Transaction
+from transaction.transaction_manager import TransactionManager
+
+
+class CompactBlock:
+    SHORT_ID_LENGTH = 6  # bytes
+
+    def __init__(self, header: dict, short_ids: List[str]):
+        """
+        Initialize a compact block: a main block header with short transaction IDs instead of the transactions.
+        Receivers rebuild the block from the transactions they already hold and only request the missing ones.
+        :param header: The block header dictionary (MainBlock.to_header_dict), including shard_data and block_hash.
+        :param short_ids: The short IDs of the block's transactions, in block order.
+
+        reference: https://github.com/bitcoin/bips/blob/master/bip-0152.mediawiki
+        """
+        self.header = header
+        self.short_ids = short_ids
+
+    @classmethod
+    def get_short_id(cls, block_hash: str, txid: str) -> str:
+        """
+        Compute the short ID of a transaction: its hash keyed with the block hash, so collisions cannot be
+        precomputed across blocks.
+        :param block_hash: The hash of the block including the transaction.
+        :param txid: The hash of the transaction.
+        :return: The short ID as a hex string.
+        """
+        digest = hashlib.blake2b(bytes.fromhex(txid), digest_size=cls.SHORT_ID_LENGTH, key=bytes.fromhex(block_hash))
+        return digest.hexdigest()
+
+    @classmethod
+    def from_block(cls, block: MainBlock):
+        """
+        Build the compact form of a main block.
+        """
+        short_ids = [cls.get_short_id(block.block_hash, tx.calculate_hash()) for tx in block.transactions]
+        return cls(header=block.to_header_dict(), short_ids=short_ids)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        Convert dictionary data into a CompactBlock.
+        """
+        return cls(header=data.get("header", {}), short_ids=data.get("short_ids", []))
+
+    def to_dict(self) -> dict:
+        """
+        Convert the compact block into a dictionary for JSON serialization.
+        """
+        return {"header": self.header, "short_ids": self.short_ids}
+
+    def get_block_hash(self) -> str:
+        """
+        Get the hash of the block.
+        """
+        return self.header.get("block_hash")
+
+    def verify_header(self) -> bool:
+        """
+        Check that the header hashes to the announced block hash.
+        """
+        return MainBlock.from_dict(self.header).block_hash == self.get_block_hash()
+
+    def match_transactions(self, transactions_by_id: dict):
+        """
+        Fill the block's transaction slots from a pool of known transactions.
+        :param transactions_by_id: The candidate transactions, keyed by their hash.
+        :return: A tuple of the slot list (None for unknown transactions) and the indexes of the missing transactions.
+        """
+        transactions_by_short_id = {self.get_short_id(self.get_block_hash(), txid): tx for txid, tx in transactions_by_id.items()}
+        slots = [transactions_by_short_id.get(short_id) for short_id in self.short_ids]
+        missing_indexes = [index for index, tx in enumerate(slots) if tx is None]
+        return slots, missing_indexes
+
+    def build_block(self, transactions: List[Transaction]):
+        """
+        Build the full block once every transaction slot is filled.
+        :param transactions: The block's transactions, in block order.
+        :return: The MainBlock, or None if the transactions do not match the header (e.g. a short ID collision).
+        """
+        block = MainBlock.from_dict(dict(self.header, transactions=transactions))
+        if block.block_hash != self.get_block_hash():
+            return None
+        if not block.verify_transactions():
+            return None
+        return block
+
+
+class CompactBlockRelay:
+    def __init__(self, host, transaction_manager: TransactionManager, blockchain, node_name: str, peers: List[Peer],
+                 chain_sync=None, request_timeout: float = 5):
+        """
+        Initialize compact main block relay between stakers.
+        Received COMPACT_BLOCK messages are rebuilt from the local transaction pool; missing transactions are
+        requested from the block's origin with GET_BLOCK_TXN, and the full block is fetched through chain sync
+        if reconstruction fails. Rebuilt blocks are queued as MAIN_BLOCK messages.
+        :param host: The Host exchanging the messages.
+        :param transaction_manager: The TransactionManager holding the transaction pool.
+        :param blockchain: The Blockchain object, used to serve transactions of known blocks.
+        :param node_name: The name of this node.
+        :param peers: The peers (other stakers) blocks are received from.
+        :param chain_sync: Optional ChainSync used to fetch full blocks when reconstruction fails.
+        :param request_timeout: Seconds to wait for missing transactions.
+        """
+        self.host = host
+        self.transaction_manager = transaction_manager
+        self.blockchain = blockchain
+        self.node_name = node_name
+        self.peers_by_name = {peer.get_hostname(): peer for peer in peers}
+        self.chain_sync = chain_sync
+        self.request_timeout = request_timeout
+        self.pending_requests = {}  # request_id -> Future resolved with the BLOCK_TXN content
+        self.tasks = set()  # Running complete_block tasks, cancelled by stop()
+        self.stats = {"received": 0, "reconstructed": 0, "transactions_requested": 0, "fallbacks": 0}
+
+        message_handler = host.message_handler
+        message_handler.register_handler("COMPACT_BLOCK", self.handle_compact_block, decoder=CompactBlock.from_dict)
+        message_handler.register_validator("COMPACT_BLOCK", lambda message: message.get_content().verify_header())
+        message_handler.register_handler("GET_BLOCK_TXN", self.handle_get_block_transactions)
+        message_handler.register_handler("BLOCK_TXN", self.handle_block_transactions)
+
+    def create_message(self, block: MainBlock) -> Message:
+        """
+        Create the COMPACT_BLOCK message announcing a block.
+        """
+        return Message(content_type="COMPACT_BLOCK", content=CompactBlock.from_block(block).to_dict(), sender=self.node_name)
+
+    async def handle_compact_block(self, message: Message):
+        """
+        Rebuild a received compact block. Completing a block may need a round trip to the origin, which runs
+        in its own task so the connection keeps being read.
+        """
+        self.stats["received"] += 1
+        compact_block = message.get_content()
+        if compact_block.get_block_hash() in self.blockchain.block_lookup_table:
+            return
+        slots, missing_indexes = compact_block.match_transactions(self.transaction_manager.get_transactions_by_id())
+        if not missing_indexes:
+            await self.deliver_block(compact_block, slots, message.get_sender())
+        else:
+            task = asyncio.create_task(self.complete_block(compact_block, slots, missing_indexes, message.get_sender()))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def stop(self):
+        """
+        Cancel the blocks still waiting for missing transactions.
+        """
+        for task in list(self.tasks):
+            task.cancel()
+
+    async def complete_block(self, compact_block: CompactBlock, slots: list, missing_indexes: list, origin: str):
+        """
+        Request the missing transactions of a compact block from its origin, then deliver the block.
+        """
+        peer = self.peers_by_name.get(origin)
+        if peer is None:
+            logging.warning(f"Cannot request missing transactions from unknown peer {origin}.")
+            return
+
+        self.stats["transactions_requested"] += len(missing_indexes)
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.pending_requests[request_id] = future
+        try:
+            await self.host.send_message(peer, Message.generate_get_block_txn_message(
+                block_hash=compact_block.get_block_hash(), indexes=missing_indexes, request_id=request_id, node_name=self.node_name))
+            response = await asyncio.wait_for(future, timeout=self.request_timeout)
+            for index, tx_data in zip(missing_indexes, response.get("transactions", [])):
+                slots[index] = Transaction.from_dict(tx_data)
+        except asyncio.TimeoutError:
+            logging.warning(f"Missing transactions of block {compact_block.get_block_hash()} not received from {origin} in time.")
+        finally:
+            self.pending_requests.pop(request_id, None)
+        await self.deliver_block(compact_block, slots, origin)
+
+    async def deliver_block(self, compact_block: CompactBlock, slots: list, origin: str):
+        """
+        Build the full block and queue it as a MAIN_BLOCK message, falling back to downloading the
+        full block if the transactions are incomplete or do not match the header.
+        """
+        block = compact_block.build_block(slots) if None not in slots else None
+        if block is None:
+            self.stats["fallbacks"] += 1
+            logging.warning(f"Could not rebuild compact block {compact_block.get_block_hash()}, downloading the full block.")
+            block = await self.download_block(compact_block, origin)
+            if block is None:
+                return
+        else:
+            self.stats["reconstructed"] += 1
+        await self.host.message_handler.add_main_block(Message(content_type="MAIN_BLOCK", content=block, sender=origin))
+
+    async def download_block(self, compact_block: CompactBlock, origin: str):
+        """
+        Download the full block from its origin through chain sync.
+        :return: The validated MainBlock, or None.
+        """
+        peer = self.peers_by_name.get(origin)
+        if self.chain_sync is None or peer is None:
+            return None
+        blocks_data = await self.chain_sync.request_blocks(peer, [compact_block.get_block_hash()])
+        header_block = MainBlock.from_dict(compact_block.header)
+        blocks = self.chain_sync.match_bodies(blocks_data, [header_block])
+        return blocks[0] if blocks else None
+
+    async def handle_get_block_transactions(self, request: Message):
+        """
+        Answer a GET_BLOCK_TXN request with the requested transactions of a known block. Blocks restored from a
+        snapshot hold only their header in memory, so their body is read from the block store through chain sync;
+        requests that cannot be answered completely are ignored and the requester downloads the full block.
+        """
+        content = request.get_content()
+        peer = self.peers_by_name.get(request.get_sender())
+        block = self.blockchain.block_lookup_table.get(content.get("block_hash"))
+        if peer is None or block is None:
+            logging.warning(f"Ignoring GET_BLOCK_TXN from {request.get_sender()} for block {content.get('block_hash')}.")
+            return
+        if self.chain_sync is not None:
+            block_transactions = self.chain_sync.get_block_body(block.block_hash)["transactions"]
+        else:
+            block_transactions = [tx.to_dict() for tx in block.transactions]
+        indexes = content.get("indexes", [])
+        if not all(isinstance(index, int) and 0 <= index < len(block_transactions) for index in indexes):
+            logging.warning(f"Ignoring GET_BLOCK_TXN from {request.get_sender()}: transactions of block {block.block_hash} not available.")
+            return
+        transactions = [block_transactions[index] for index in indexes]
+        await self.host.send_message(peer, Message.generate_block_txn_message(
+            block_hash=block.block_hash, transactions=transactions, request_id=content.get("request_id"), node_name=self.node_name),
+            wait=False)
+
+    async def handle_block_transactions(self, response: Message):
+        """
+        Resolve the pending request answered by a BLOCK_TXN message.
+        """
+        future = self.pending_requests.get(response.get_content().get("request_id"))
+        if future is not None and not future.done():
+            future.set_result(response.get_content())
+
+    def get_stats(self) -> dict:
+        """
+        Get the compact block relay counters.
+        """
+        return dict(self.stats)
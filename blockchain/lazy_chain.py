@@ -0,0 +1,67 @@
+class LazyChain:
+    def __init__(self, genesis_block, blocks: list, load_block):
+        """
+        Initializes a main chain whose older blocks are loaded on first access, e.g. after restoring a snapshot
+        that only holds the most recent headers. Only the genesis block, the recent blocks and the older blocks that
+        were accessed are held, so the memory used at startup does not grow with the chain length.
+        Indexing, slicing and iterating load the blocks they reach; appending, extending and deleting work as on a list.
+        :param genesis_block: The block at height 0.
+        :param blocks: The consecutive most recent blocks, the first one at height `offset`.
+        :param load_block: Function returning the block at a height.
+        """
+        self.offset = blocks[0].index if blocks else 1
+        self.blocks = list(blocks)  # Blocks from height `offset` on
+        self.older_blocks = {0: genesis_block}  # height -> block below `offset`, loaded on first access
+        self.load_block = load_block
+
+    def __len__(self):
+        return self.offset + len(self.blocks)
+
+    def load(self, height: int):
+        """
+        Get the block at a height, loading it if it was not loaded yet.
+        :param height: A non-negative height below the chain length.
+        """
+        if height >= self.offset:
+            return self.blocks[height - self.offset]
+        block = self.older_blocks.get(height)
+        if block is None:
+            block = self.load_block(height)
+            self.older_blocks[height] = block
+        return block
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.load(height) for height in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chain index out of range")
+        return self.load(index)
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice) or index.step not in (None, 1):
+            raise TypeError("only the end of the chain can be deleted")
+        start, stop, _ = index.indices(len(self))
+        if stop != len(self):
+            raise TypeError("only the end of the chain can be deleted")
+        if start >= self.offset:
+            del self.blocks[start - self.offset:]
+        else:
+            self.blocks = []
+            self.offset = start
+            self.older_blocks = {height: block for height, block in self.older_blocks.items() if height < start}
+
+    def append(self, block):
+        self.blocks.append(block)
+
+    def extend(self, blocks):
+        self.blocks.extend(blocks)
+
+    def __iter__(self):
+        for height in range(len(self)):
+            yield self.load(height)
+
+    def __reversed__(self):
+        for height in reversed(range(len(self))):
+            yield self.load(height)
@@ -1,16 +1,25 @@
 import os
+import json
 import asyncio
+import math
 import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from webapp.blockchain_view import start_webserver
 
 from network.host import Host
 from network.message import Message
 from network.peer import Peer
+from network.transport import TcpTransport
 
 from blockchain.shard_miner import ShardMiner
 from blockchain.shard_staker import ShardStaker
+from blockchain.shard_coordinator import ShardCoordinator
 from blockchain.blockchain import Blockchain
+from blockchain.block_store import BlockStore
+from blockchain.chain_sync import ChainSync
+from blockchain.chain_index import ChainIndex
+from blockchain.compact_block import CompactBlockRelay
 from blockchain.shard_block import ShardBlock
 from blockchain.main_block import MainBlock
 
@@ -22,35 +31,106 @@ from _config.app_config import AppConfig
 # ENHANCING BLOCKCHAIN SCALABILITY AND TRANSACTION EFFICIENCY USING SHARDED CHAIN ARCHITECTURE
 
 class BlockchainNode:
-    def __init__(self):
+    def __init__(self, config: AppConfig = None, node_name: str = None, shard_name: str = None, transport=None,
+                 enable_webserver: bool = True):
         """
         Initializes the node with all core components.
+        :param config: Optional AppConfig, loaded from _config/config.json by default.
+        :param node_name: Optional node name, the NODE_NAME environment variable by default.
+        :param shard_name: Optional shard name, the SHARD environment variable by default.
+        :param transport: Optional transport for the peer connections, e.g. a SimulatedTransport; TCP by default.
+        :param enable_webserver: Whether stakers start the Flask webserver.
         """
-        self.config = AppConfig(config_file_path="_config/config.json")
+        self.config = config if config is not None else AppConfig(config_file_path="_config/config.json")
         self.network_config = self.config.get_network_config()
         self.shard_config = self.config.get_shard_config()
         self.stake_info = self.config.get_stake_info()
         self.mining_config = self.config.get_mining_config()
+        self.chain_config = self.config.get_chain_config()
+        self.storage_config = self.config.get_storage_config()
+        self.sync_config = self.config.get_sync_config()
+        self.epoch_config = self.config.get_epoch_config()
+        self.coordinator_config = self.config.get_coordinator_config()
         self.nbits = self.mining_config.get("nbits")
 
-        self.node_name = os.getenv("NODE_NAME")
-        self.shard_name = os.getenv("SHARD")
+        self.node_name = node_name if node_name is not None else os.getenv("NODE_NAME")
+        self.shard_name = shard_name if shard_name is not None else os.getenv("SHARD")
 
+        # Miner peers of every shard, reassigned at runtime by the shard coordinator
+        self.shard_assignment = {shard: [peer for peer in peers if "miner" in peer] for shard, peers in self.shard_config.items()}
+        self.assignment_epoch = 0
+        self.assignment_path = os.path.join(self.storage_config.get("data_dir", "/app/data"), f"{self.node_name}_assignment.json")
+        self.shard_coordinator = None
         self.num_of_miners = self.config.get_number_of_miners(self.shard_name)
         self.miner_id_map = self.generate_miner_id_map()
 
-        self.host = Host(self.network_config)
+        # Pipelined epochs: the next epoch starts while the previous main block is propagated and persisted
+        self.pipelined = self.epoch_config.get("pipelined", False)
+        self.staker_interval = self.epoch_config.get("staker_interval", 3)
+        self.miner_interval = self.epoch_config.get("miner_interval", 1)
+        # Shard block collection window: the staker proposes with the blocks that arrived before the deadline
+        self.collection_deadline = self.epoch_config.get("collection_deadline", 10)
+        self.quorum = self.epoch_config.get("quorum", 1.0)
+        self.adaptive_weights = self.epoch_config.get("adaptive_weights", False)
+        if self.epoch_config.get("mining_executor", "thread") == "process":
+            self.mining_executor = ProcessPoolExecutor(max_workers=1)
+        else:
+            self.mining_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="miner")
+        self.background_tasks = set()
+
+        self.host = Host(self.network_config, transport=transport, node_name=self.node_name)
+        self.host.message_handler.register_decoder("SHARD_BLOCK", ShardBlock.from_dict)
+        self.host.message_handler.register_decoder("MAIN_BLOCK", MainBlock.from_dict)
+        # Blocks whose transactions do not match their root are neither queued nor relayed
+        self.host.message_handler.register_validator("MAIN_BLOCK", lambda message: message.get_content().verify_transactions())
         self.transactions = TransactionManager.load_transactions()
         self.transaction_manager = TransactionManager(transactions=self.transactions, num_miners=self.num_of_miners)
+        # A restarted node continues with the last assignment it applied instead of the config layout
+        self.load_assignment()
 
-        self.blockchain = Blockchain()
+        self.blockchain = Blockchain(fork_choice=self.chain_config.get("fork_choice", "longest"),
+                                     stake_info=self.stake_info,
+                                     max_orphans=self.chain_config.get("max_orphans", 256))
 
+        self.compact_block_relay = None
         if self.node_name.startswith("staker"):
-            flask_thread = threading.Thread(
-                target=start_webserver, args=(self.blockchain, self.node_name), daemon=True
-            )
-            flask_thread.start()
-            logging.info(f"Flask webserver started for {self.node_name}.")
+            self.block_store = BlockStore(node_name=self.node_name,
+                                          data_dir=self.storage_config.get("data_dir", "/app/data"),
+                                          segment_size=self.storage_config.get("segment_size", 1000),
+                                          snapshot_interval=self.storage_config.get("snapshot_interval", 100),
+                                          snapshot_window=self.storage_config.get("snapshot_window", 1000),
+                                          hot_segments=self.storage_config.get("hot_segments", 1),
+                                          cold_codec=self.storage_config.get("cold_codec", "zlib"),
+                                          compression_level=self.storage_config.get("compression_level", 6))
+            self.block_store.restore(self.blockchain)
+            logging.info(f"Node {self.node_name} starting at height {self.blockchain.get_last_block().index}.")
+
+            self.chain_index = None
+            if self.storage_config.get("index_transactions", True):
+                index_path = os.path.join(self.storage_config.get("data_dir", "/app/data"), f"{self.node_name}_index.sqlite")
+                self.chain_index = ChainIndex(db_path=index_path)
+                self.chain_index.sync_with_chain(self.blockchain, block_store=self.block_store)
+            if self.epoch_config.get("background_persistence", False):
+                self.blockchain.start_background_listeners()
+
+            sync_peers = [Peer(*peer.split(":")) for peer in self.config.get_other_stakers(self.node_name)]
+            self.host.gossip.set_topic_peers("stakers", sync_peers)
+            self.chain_sync = ChainSync(host=self.host, blockchain=self.blockchain, node_name=self.node_name,
+                                        sync_peers=sync_peers, block_store=self.block_store, sync_config=self.sync_config)
+
+            if self.sync_config.get("compact_blocks", True):
+                self.compact_block_relay = CompactBlockRelay(host=self.host, transaction_manager=self.transaction_manager,
+                                                             blockchain=self.blockchain, node_name=self.node_name,
+                                                             peers=sync_peers, chain_sync=self.chain_sync,
+                                                             request_timeout=self.sync_config.get("request_timeout", 10))
+
+            if enable_webserver:
+                flask_thread = threading.Thread(
+                    target=start_webserver, args=(self.blockchain, self.node_name, self.chain_index, self.host.get_metrics, self.block_store),
+                    daemon=True
+                )
+                flask_thread.start()
+                logging.info(f"Flask webserver started for {self.node_name}.")
 
     async def start(self):
         """
@@ -95,18 +175,27 @@ class BlockchainNode:
                     control_message = message.get_content()
                 
                 if control_message:
+                    assignment_epoch = self.assignment_epoch
                     mining_allowed = self.process_control_message(control_message)
+                    if self.assignment_epoch != assignment_epoch:
+                        shard_miner.reassign(self.get_miner_id(), self.num_of_miners)
+                        staker_address = self.config.get_staker_for_shard(self.shard_name)
 
                 # Perform mining if allowed
                 if mining_allowed:
-                    shard_block = shard_miner.mine_shard_block()
+                    shard_miner.assign_transactions(control_message.get("weights"))
+                    # Mined off the event loop, so the node keeps reading and answering messages meanwhile
+                    shard_block = await asyncio.get_running_loop().run_in_executor(self.mining_executor, shard_miner.mine_shard_block,
+                                                                                   control_message.get("epoch"),
+                                                                                   control_message.get("attempt"))
                     staker_peer = Peer(*staker_address.split(":"))
                     message = Message(content_type="SHARD_BLOCK", content=shard_block.to_dict(), sender=self.node_name)
 
                     await self.host.send_message(staker_peer, message)
                     mining_allowed = False
                     logging.info(f"Miner {self.node_name} sent shard block to Staker {staker_address}.")
-                    await asyncio.sleep(1)
+                    if self.miner_interval > 0:
+                        await asyncio.sleep(self.miner_interval)
             except Exception as e:
                 logging.error(f"Error in miner operation: {e}")
             
@@ -119,6 +208,15 @@ class BlockchainNode:
         """
         action = control_message.get("action")
         shard = control_message.get("shard")
+        if action == "ASSIGN":
+            # Sent to the miners of both shards involved, so the shard may be another one
+            if control_message.get("epoch", 0) > self.assignment_epoch:
+                self.apply_assignment(control_message["assignment"], control_message.get("epoch", 0))
+            return False
+        if action == "START" and control_message.get("assignment_epoch", 0) > self.assignment_epoch:
+            # A miner that missed an ASSIGN, e.g. while restarting, catches up with the assignment of the staker
+            self.apply_assignment(control_message["assignment"], control_message["assignment_epoch"])
+
         if shard == self.shard_name:
             if action == "START":
                 logging.info(f"Miner {self.node_name} received START message. Mining allowed.")
@@ -126,6 +224,8 @@ class BlockchainNode:
                 
             elif action == "STOP":
                 # logging.info(f"Miner {self.node_name} received STOP message. Mining halted.")
+                if self.node_name in control_message.get("missing", []):
+                    logging.warning(f"Miner {self.node_name} missed the collection deadline of epoch {control_message.get('epoch')}.")
                 return False
                 
     def generate_miner_id_map(self) -> dict:
@@ -133,9 +233,65 @@ class BlockchainNode:
         Generate a mapping of miner node names to zero-based IDs for the current shard.
         :return: A dictionary mapping miner node names to their IDs.
         """
-        shard_peers = self.shard_config.get(self.shard_name, [])
-        miner_peers = [peer.split(":")[0] for peer in shard_peers if "miner" in peer]
+        miner_peers = [peer.split(":")[0] for peer in self.shard_assignment.get(self.shard_name, [])]
         return {miner: idx for idx, miner in enumerate(miner_peers)}
+
+    def apply_assignment(self, assignment: dict, epoch: int, persist: bool = True):
+        """
+        Apply a new assignment of miners to shards: a reassigned miner moves to its new shard, and the miner IDs
+        and transaction partitions of the shard are recomputed.
+        :param assignment: The miner peers ("host:port") of every shard.
+        :param epoch: The epoch the assignment was made at.
+        :param persist: Whether to save the assignment, so the node continues with it after a restart.
+        """
+        self.shard_assignment = {shard: list(miners) for shard, miners in assignment.items()}
+        self.assignment_epoch = epoch
+        if self.node_name.startswith("miner"):
+            for shard, miners in self.shard_assignment.items():
+                if self.node_name in (peer.split(":")[0] for peer in miners) and shard != self.shard_name:
+                    logging.info(f"Miner {self.node_name} reassigned from {self.shard_name} to {shard}.")
+                    self.shard_name = shard
+        self.miner_id_map = self.generate_miner_id_map()
+        self.num_of_miners = len(self.miner_id_map)
+        self.transaction_manager.set_num_miners(self.num_of_miners)
+        if persist:
+            self.save_assignment()
+
+    def save_assignment(self):
+        """
+        Atomically write the current assignment and its epoch to the data directory.
+        """
+        temporary_path = self.assignment_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.assignment_path), exist_ok=True)
+            with open(temporary_path, "w") as assignment_file:
+                json.dump({"epoch": self.assignment_epoch, "assignment": self.shard_assignment}, assignment_file)
+            os.replace(temporary_path, self.assignment_path)
+        except OSError as e:
+            logging.error(f"Could not save the miner assignment of epoch {self.assignment_epoch}: {e}")
+
+    def load_assignment(self):
+        """
+        Apply the assignment saved by save_assignment(), if there is one.
+        """
+        if not os.path.exists(self.assignment_path):
+            return
+        try:
+            with open(self.assignment_path, "r") as assignment_file:
+                saved = json.load(assignment_file)
+            epoch, assignment = saved["epoch"], saved["assignment"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Miner assignment {self.assignment_path} is unreadable, using the configured layout: {e}")
+            return
+        if epoch > self.assignment_epoch:
+            self.apply_assignment(assignment, epoch, persist=False)
+            logging.info(f"Node {self.node_name} restored the miner assignment of epoch {epoch}.")
+
+    def get_quorum(self) -> int:
+        """
+        Get the number of shard blocks needed to propose a main block, from the quorum fraction of the shard's miners.
+        """
+        return max(1, math.ceil(self.quorum * self.num_of_miners))
     
     def get_miner_id(self) -> int:
         """
@@ -152,12 +308,22 @@ class BlockchainNode:
         """
         Run Shard Staker Node.
         """
-        shard_staker = ShardStaker(transaction_manager=self.transaction_manager, blockchain=self.blockchain, node_name=self.node_name)
+        shard_staker = ShardStaker(transaction_manager=self.transaction_manager, blockchain=self.blockchain, node_name=self.node_name,
+                                   block_version=self.chain_config.get("block_version", 1))
         shard_staker.initialize_stakes(self.stake_info)
-        genesis_block = self.blockchain.get_last_block()
-        self.blockchain.write_to_json(node_name=self.node_name, block=genesis_block)
-        current_epoch = genesis_block.index + 1
+        self.shard_coordinator = ShardCoordinator(host=self.host, shard_staker=shard_staker, transaction_manager=self.transaction_manager,
+                                                  node_name=self.node_name, shard_name=self.shard_name,
+                                                  shard_assignment=self.shard_assignment, assignment_epoch=self.assignment_epoch,
+                                                  on_assignment=self.apply_assignment,
+                                                  coordinator_config=self.coordinator_config)
+        self.shard_coordinator.start()
+
+        # Serve and catch up with the other stakers before taking part in staker selection
+        asyncio.create_task(self.chain_sync.serve_requests())
+        asyncio.create_task(self.chain_sync.dispatch_responses())
+        await self.chain_sync.synchronize()
 
+        started_epoch, attempt = None, 0  # The last epoch this staker started, and its attempt
         while True:
             try:
                 # Determine active shard
@@ -171,7 +337,9 @@ class BlockchainNode:
                     
                     message = await self.host.message_handler.get_main_block()  # Wait for main block message
                     is_added, received_main_block = shard_staker.receive_main_block(message, block_sender=selected_staker)
-                    self.blockchain.write_to_json(node_name=self.node_name, block=received_main_block)
+                    if not is_added and self.blockchain.orphan_pool.contains(received_main_block.block_hash):
+                        # The block builds on blocks this node has missed
+                        await self.chain_sync.synchronize()
                     
                     continue
                          
@@ -181,59 +349,135 @@ class BlockchainNode:
                     mining_turn = True                
                     logging.info(f"Shard {self.shard_name} selected for mining.")
                     
-                    shard_peers = self.config.get_peers_for_shard(self.shard_name)
+                    # Epoch boundary: miners may be moved between shards before the epoch starts
+                    await self.shard_coordinator.rebalance(next_epoch)
+                    shard_peers = self.shard_assignment.get(self.shard_name, [])
 
                     # Wait for shard block messages
                     if mining_turn == True:
+                        is_accepted = False
+                        weights = shard_staker.get_miner_weights(self.miner_id_map) if self.adaptive_weights else None
+                        # An epoch started again after a missed quorum gets a new attempt, so late blocks of the
+                        # failed attempt are not collected again
+                        attempt = attempt + 1 if next_epoch == started_epoch else 0
+                        started_epoch = next_epoch
+                        # Built once and encoded once for all miners
+                        control_message = Message.generate_start_message(shard_name=self.shard_name, epoch=next_epoch,
+                                                                         node_name=self.node_name, weights=weights, attempt=attempt,
+                                                                         assignment=self.shard_assignment if self.assignment_epoch else None,
+                                                                         assignment_epoch=self.assignment_epoch or None)
                         for peer in shard_peers:
                             if "miner" in peer:
                                 miner_peer = Peer(*peer.split(":"))
-                                control_message = Message.generate_start_message(shard_name=self.shard_name, epoch=next_epoch, node_name=self.node_name)
                                 await self.host.send_message(miner_peer, control_message)
 
-                        shard_blocks=[]
-                        for _ in range(self.num_of_miners):
-                            message = await self.host.message_handler.get_shard_block()
-                            is_valid, shard_block = shard_staker.process_shard_block(message)
-                            if is_valid:
-                                shard_blocks.append(shard_block)
-                            else:
-                                logging.warning(f"Invalid shard block received: {message}")
+                        shard_blocks, missing_miners = await self.collect_shard_blocks(shard_staker, next_epoch, attempt)
 
-                        if len(shard_blocks) == self.num_of_miners:
+                        if len(shard_blocks) >= self.get_quorum():
                             is_accepted, new_main_block = shard_staker.propose_main_block(shard_blocks=shard_blocks)
-                            self.blockchain.write_to_json(node_name=self.node_name, block=new_main_block)
-                            
-                        
+                        else:
+                            logging.warning(f"Epoch {next_epoch}: {len(shard_blocks)} of {self.num_of_miners} shard blocks arrived, "
+                                            f"quorum is {self.get_quorum()}. No main block proposed.")
+
+                        control_message = Message.generate_stop_message(shard_name=self.shard_name, epoch=next_epoch,
+                                                                        node_name=self.node_name, missing=missing_miners)
                         for peer in shard_peers:
                             if "miner" in peer:
                                 miner_peer = Peer(*peer.split(":")) #Unpack. 
-                                control_message = Message.generate_stop_message(shard_name=self.shard_name, epoch=next_epoch, node_name=self.node_name)
                                 await self.host.send_message(miner_peer, control_message)
 
-                        staker_peers = self.config.get_other_stakers(self.node_name)
                         if is_accepted:
-                            for peer in staker_peers:
-                                staker_peer = Peer(*peer.split(":"))
-                                message = Message(content_type="MAIN_BLOCK", content=new_main_block.to_dict(), sender=self.node_name)
-                                await self.host.send_message(staker_peer, message)
-                                logging.info(f"Staker {self.node_name} sent main block to {peer}.")
-                
+                            if self.pipelined:
+                                # The next epoch is selected from the local chain while the block propagates
+                                self.run_in_background(self.propagate_main_block(new_main_block))
+                            else:
+                                await self.propagate_main_block(new_main_block)
+
                 # Wait before rotating to the next round
-                await asyncio.sleep(3)  
+                if self.staker_interval > 0:
+                    await asyncio.sleep(self.staker_interval)
             except Exception as e:
                 logging.error(f"Error in staker operation: {e}")
 
+    async def collect_shard_blocks(self, shard_staker: ShardStaker, epoch: int, attempt: int = None):
+        """
+        Collect the shard blocks of an epoch until every miner has answered or the collection deadline passes.
+        Blocks of earlier epochs or earlier attempts that arrive late, repeated blocks of a miner and blocks of miners
+        assigned to another shard are discarded.
+        :param shard_staker: The ShardStaker validating the blocks.
+        :param epoch: The epoch announced in the START message.
+        :param attempt: The attempt of the epoch announced in the START message.
+        :return: The valid shard blocks, and the names of the miners whose blocks did not arrive in time.
+        """
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        deadline = started_at + self.collection_deadline
+        shard_blocks = {}
+        while len(shard_blocks) < self.num_of_miners:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(self.host.message_handler.get_shard_block(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+
+            is_valid, shard_block = shard_staker.process_shard_block(message)
+            if not is_valid:
+                logging.warning(f"Invalid shard block received: {message}")
+                continue
+            if (shard_block.epoch != epoch or shard_block.attempt != attempt or shard_block.miner_node_name in shard_blocks
+                    or shard_block.miner_node_name not in self.miner_id_map):
+                logging.info(f"Discarded shard block of epoch {shard_block.epoch} (attempt {shard_block.attempt}) from "
+                             f"{shard_block.miner_node_name} in epoch {epoch} (attempt {attempt}).")
+                continue
+            shard_blocks[shard_block.miner_node_name] = shard_block
+            shard_staker.record_shard_block(shard_block.miner_node_name, loop.time() - started_at, attempts=shard_block.nonce + 1)
+
+        missing_miners = [miner for miner in self.miner_id_map if miner not in shard_blocks]
+        if missing_miners:
+            shard_staker.record_missing_miners(missing_miners, self.collection_deadline)
+            logging.warning(f"Epoch {epoch}: no shard block from {', '.join(missing_miners)} within {self.collection_deadline}s.")
+        # Ordered by miner ID, so the main block does not depend on the arrival order
+        return sorted(shard_blocks.values(), key=lambda block: block.miner_numeric_id), missing_miners
+
+    async def propagate_main_block(self, main_block):
+        """
+        Broadcast a new main block to the other stakers, as a compact block if compact relay is enabled.
+        :param main_block: The MainBlock added by this staker.
+        """
+        if self.compact_block_relay is not None:
+            message = self.compact_block_relay.create_message(main_block)
+        else:
+            message = Message(content_type="MAIN_BLOCK", content=main_block.to_dict(), sender=self.node_name)
+        await self.host.broadcast_message(message, topic="stakers")
+        logging.info(f"Staker {self.node_name} broadcast main block {main_block.index} to the other stakers.")
+
+    def run_in_background(self, coroutine):
+        """
+        Run a coroutine in a task, keeping a reference until it is done.
+        """
+        task = asyncio.create_task(coroutine)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
     async def shutdown(self):
         """
         Shutdown the blockchain node gracefully.
         """
+        if self.shard_coordinator is not None:
+            self.shard_coordinator.stop()
+        if self.compact_block_relay is not None:
+            self.compact_block_relay.stop()
         await self.host.stop()
+        self.blockchain.stop_background_listeners()
+        self.mining_executor.shutdown(wait=False)
         logging.info("Blockchain node stopped.")
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
     node = BlockchainNode()
+    TcpTransport.install_event_loop(node.network_config.get("transport", {}).get("event_loop"))
 
     try:
         asyncio.run(node.start())
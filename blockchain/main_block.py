@@ -4,9 +4,12 @@ from transaction.transaction_manager import TransactionManager
 from transaction.transaction import Transaction
 
 class MainBlock:
-  def __init__(self, index, timestamp, tx_root, previous_hash, staker_signature, nbits, nonce=0, transactions=[], shard_data: dict = None):
+  def __init__(self, index, timestamp, tx_root, previous_hash, staker_signature, nbits, nonce=0, transactions=[], shard_data: dict = None, block_hash: str = None, version: int = 1):
     """
     Initialize a new block.
+    Version 1 blocks commit to their transactions with a Merkle root over all transactions. Version 2 blocks commit
+    with a Merkle root over the ordered Merkle roots of their shard blocks, which the staker has already validated,
+    and record each shard's transaction count so a transaction can still be proven through both tree levels.
     :param index: The index of the block.
     :param timestamp: The timestamp of the block.
     :param tx_root: The Merkle root of the transactions.
@@ -16,6 +19,8 @@ class MainBlock:
     :param nonce: The nonce value for the block (used here for compatability with PoW Sytems).
     :param transactions: List of transactions in the block.
     :param shard_data: Dictionary of shard data for the block.
+    :param block_hash: The already known hash of the block (e.g. from a trusted snapshot), computed if not provided.
+    :param version: The block format version.
     """
     self.index = index
     self.timestamp = timestamp
@@ -24,9 +29,10 @@ class MainBlock:
     self.staker_signature = staker_signature
     self.nbits = nbits
     self.nonce = nonce
+    self.version = version
     self.shard_data = shard_data if shard_data is not None else {}
     self.transactions = transactions if transactions is not None else []
-    self.block_hash = self.compute_hash()
+    self.block_hash = block_hash if block_hash is not None else self.compute_hash()
 
   @classmethod
   def from_dict(cls, block_data):
@@ -47,11 +53,30 @@ class MainBlock:
                nonce = block_data.get("nonce",0),
                shard_data = block_data.get("shard_data",{}),
                transactions = transactions,
+               version = block_data.get("version", 1),
                )
 
+  def to_header_dict(self):
+    """
+    Convert the block header (the block without its transactions) into a dictionary for JSON serialization.
+    """
+    return {
+            "index":self.index,
+            "timestamp":self.timestamp,
+            "previous_hash":self.previous_hash,
+            "tx_root":self.tx_root,
+            "staker_signature":self.staker_signature,
+            "nbits":self.nbits,
+            "nonce":self.nonce,
+            "shard_data":self.shard_data,
+            "block_hash":self.block_hash,
+            "version":self.version,
+            }
+
   def to_dict(self):
     """
     Convert the block object into a dictionary for JSON serialization.
+    Broadcasts serialize the block once: the Message carrying it caches its encoded payload for all recipients.
     """
     return {
             "index":self.index,
@@ -63,6 +88,7 @@ class MainBlock:
             "nonce":self.nonce,
             "shard_data":self.shard_data,
             "block_hash":self.block_hash,
+            "version":self.version,
             "transactions":[tx.to_dict() if hasattr(tx, "to_dict") else tx for tx in self.transactions],
             }
   
@@ -80,7 +106,66 @@ class MainBlock:
       "nonce":self.nonce,
       "shard_data":self.shard_data,
     }
+    # Version 1 blocks keep their original hashes
+    if self.version >= 2:
+      block_content["version"] = self.version
     
     encoded_block_string = json.dumps(block_content, sort_keys=True).encode()
     block_hash = hashlib.sha256(encoded_block_string).hexdigest()
-    return block_hash
\ No newline at end of file
+    return block_hash
+
+  def get_shard_roots(self):
+    """
+    Get the shard entries of the block in tree order, by miner ID.
+    :return: A list of (miner node name, shard data) tuples.
+    """
+    return sorted(self.shard_data.items(), key=lambda item: (item[1].get("miner_numeric_id", 0), item[0]))
+
+  def calculate_tx_root(self):
+    """
+    Calculate the transaction root of the block for its version.
+    """
+    if self.version >= 2:
+      return TransactionManager.calculate_merkle_root_from_hashes([shard["merkle_root"] for _, shard in self.get_shard_roots()])
+    return TransactionManager.calculate_merkle_root(self.transactions)
+
+  def verify_transactions(self):
+    """
+    Check that the block's transactions match its transaction root.
+    For version 2 blocks every shard's slice of the transactions must match the shard's Merkle root.
+    :return: True if the transactions match.
+    """
+    if self.calculate_tx_root() != self.tx_root:
+      return False
+    if self.version < 2:
+      return True
+
+    offset = 0
+    for _, shard in self.get_shard_roots():
+      shard_transactions = self.transactions[offset:offset + shard.get("tx_count", 0)]
+      if TransactionManager.calculate_merkle_root(shard_transactions) != shard["merkle_root"]:
+        return False
+      offset += len(shard_transactions)
+    return offset == len(self.transactions)
+
+  def get_transaction_proof(self, tx_index: int):
+    """
+    Get the Merkle inclusion proof of a transaction against the block's tx_root.
+    For version 2 blocks the proof leads from the transaction to its shard's Merkle root and on to the tx_root.
+    :param tx_index: The position of the transaction in the block.
+    :return: The proof, see TransactionManager.verify_merkle_proof().
+    """
+    tx_hashes = [tx.calculate_hash() for tx in self.transactions]
+    if self.version < 2:
+      return TransactionManager.get_merkle_proof(tx_hashes, tx_index)
+
+    shard_roots = self.get_shard_roots()
+    offset = 0
+    for shard_index, (_, shard) in enumerate(shard_roots):
+      tx_count = shard.get("tx_count", 0)
+      if tx_index < offset + tx_count:
+        shard_proof = TransactionManager.get_merkle_proof(tx_hashes[offset:offset + tx_count], tx_index - offset)
+        root_proof = TransactionManager.get_merkle_proof([shard["merkle_root"] for _, shard in shard_roots], shard_index)
+        return shard_proof + root_proof
+      offset += tx_count
+    raise IndexError(f"Transaction {tx_index} out of range for block {self.index}.")
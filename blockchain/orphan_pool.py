@@ -0,0 +1,64 @@
+import logging
+from collections import OrderedDict
+
+
+class OrphanPool:
+    def __init__(self, max_orphans: int = 256):
+        """
+        Initializes a bounded pool of blocks whose parent is not yet known.
+        Orphans are keyed by their previous_hash so they can be connected as soon as the parent arrives.
+        :param max_orphans: The maximum number of orphan blocks kept in memory.
+        """
+        self.max_orphans = max_orphans
+        self.orphans = OrderedDict()  # block_hash -> block, in arrival order
+        self.orphans_by_parent = {}   # previous_hash -> set of block hashes
+
+    def add_orphan(self, block, block_hash: str) -> bool:
+        """
+        Buffer an orphan block, evicting the oldest orphan when the pool is full.
+        :param block: The orphan block.
+        :param block_hash: The hash of the orphan block.
+        :return: True if the block was buffered, False if it was already known.
+        """
+        if block_hash in self.orphans:
+            return False
+
+        while len(self.orphans) >= self.max_orphans:
+            evicted_hash, evicted_block = self.orphans.popitem(last=False)
+            self.unlink(evicted_block, evicted_hash)
+            logging.warning(f"Orphan pool full, evicted orphan block {evicted_block.index}.")
+
+        self.orphans[block_hash] = block
+        self.orphans_by_parent.setdefault(block.previous_hash, set()).add(block_hash)
+        return True
+
+    def pop_children(self, parent_hash: str) -> list:
+        """
+        Remove and return all orphans whose parent is the given block.
+        :param parent_hash: The hash of the parent block.
+        :return: List of (block_hash, block) tuples.
+        """
+        child_hashes = self.orphans_by_parent.pop(parent_hash, set())
+        return [(child_hash, self.orphans.pop(child_hash)) for child_hash in child_hashes if child_hash in self.orphans]
+
+    def unlink(self, block, block_hash: str):
+        """
+        Remove a block from the parent index.
+        :param block: The block to unlink.
+        :param block_hash: The hash of the block.
+        """
+        siblings = self.orphans_by_parent.get(block.previous_hash)
+        if siblings is not None:
+            siblings.discard(block_hash)
+            if not siblings:
+                del self.orphans_by_parent[block.previous_hash]
+
+    def contains(self, block_hash: str) -> bool:
+        """
+        Check if a block is buffered in the pool.
+        :param block_hash: The hash of the block.
+        """
+        return block_hash in self.orphans
+
+    def __len__(self):
+        return len(self.orphans)
@@ -4,12 +4,17 @@ from typing import List
 from transaction.transaction import Transaction
 
 class ShardBlock:
-    def __init__(self, miner_numeric_id, miner_node_name, merkle_root,timestamp, transactions: List[Transaction], nonce: int=0, nbits: str=None):  
+    def __init__(self, miner_numeric_id, miner_node_name, merkle_root,timestamp, transactions: List[Transaction], nonce: int=0, nbits: str=None,
+                 epoch: int=None, attempt: int=None):  
         """
         Initialize a new block.
         :param miner_numeric_id: The numeric ID of the miner.
         :param merkle_root: The Merkle root of the transactions.
         :param timestamp: The timestamp of the block.
+        :param epoch: The epoch the block was mined for, from the START message. Part of the hash when set,
+                      so a late block cannot be passed off as one of a later epoch.
+        :param attempt: The attempt of the epoch, from the START message. An epoch is started again when its quorum
+                        was missed; hashed when set, so late blocks of the failed attempt are told apart.
         """
         self.miner_numeric_id = miner_numeric_id
         self.miner_node_name = miner_node_name
@@ -18,6 +23,8 @@ class ShardBlock:
         self.transactions = transactions
         self.nbits = nbits if nbits is not None else None
         self.nonce = nonce
+        self.epoch = epoch
+        self.attempt = attempt
 
     @classmethod
     def from_dict(cls, block_data):
@@ -36,6 +43,8 @@ class ShardBlock:
                 nonce = block_data["nonce"],
                 nbits = block_data["nbits"],
                 transactions = transactions,
+                epoch = block_data.get("epoch"),
+                attempt = block_data.get("attempt"),
                 )
 
     def to_dict(self):
@@ -49,6 +58,8 @@ class ShardBlock:
                 "merkle_root":self.merkle_root,
                 "nonce":self.nonce,
                 "nbits":self.nbits,
+                "epoch":self.epoch,
+                "attempt":self.attempt,
                 "transactions":
                     [tx.to_dict() if hasattr(tx, "to_dict") 
                      else tx for tx in self.transactions],
@@ -66,6 +77,10 @@ class ShardBlock:
                 "nonce":self.nonce,
                 "nbits":self.nbits,
             }
+        if self.epoch is not None:
+            block_content["epoch"] = self.epoch
+        if self.attempt is not None:
+            block_content["attempt"] = self.attempt
         
         encoded_block_string = json.dumps(block_content, sort_keys=True).encode()
         block_hash = hashlib.sha256(encoded_block_string).hexdigest()
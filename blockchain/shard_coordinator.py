@@ -0,0 +1,213 @@
+import time
+import asyncio
+import logging
+from network.message import Message
+from network.peer import Peer
+from blockchain.shard_staker import ShardStaker
+from transaction.transaction_manager import TransactionManager
+
+
+class ShardCoordinator:
+    def __init__(self, host, shard_staker: ShardStaker, transaction_manager: TransactionManager, node_name: str, shard_name: str,
+                 shard_assignment: dict, on_assignment, coordinator_config: dict = None, assignment_epoch: int = 0):
+        """
+        Initialize load-aware assignment of miners to shards, run by every staker.
+        Stakers periodically broadcast the load of their shard (SHARD_LOAD): the pending transactions of the
+        shard's partition of the pool and the hashrate measured from their miners' shard blocks. At every
+        `rebalance_interval`-th epoch the selected staker moves one miner from the shard with the least pending
+        transactions per hash to the one with the most, if they differ by more than `imbalance_threshold`, and
+        announces the new assignment with ASSIGN control messages to the other stakers and the miners of both
+        shards. Every load report also carries the reporting staker's assignment and its epoch, so a staker that
+        missed an ASSIGN catches up with the next report.
+        :param host: The Host exchanging the messages.
+        :param shard_staker: The ShardStaker measuring the miners of this shard.
+        :param transaction_manager: The TransactionManager holding the pending transactions of this shard.
+        :param node_name: The name of this staker.
+        :param shard_name: The shard of this staker.
+        :param shard_assignment: The initial miner peers ("host:port") of every shard.
+        :param on_assignment: Function called with every new assignment and its epoch, which applies it to the node.
+        :param coordinator_config: Optional settings (enabled, report_interval, rebalance_interval,
+                                   imbalance_threshold, min_miners).
+        :param assignment_epoch: The epoch of the initial assignment, e.g. restored after a restart; 0 for the config layout.
+        """
+        coordinator_config = coordinator_config if coordinator_config is not None else {}
+        self.host = host
+        self.shard_staker = shard_staker
+        self.transaction_manager = transaction_manager
+        self.node_name = node_name
+        self.shard_name = shard_name
+        self.on_assignment = on_assignment
+        self.enabled = coordinator_config.get("enabled", False)
+        self.report_interval = coordinator_config.get("report_interval", 10)
+        self.rebalance_interval = coordinator_config.get("rebalance_interval", 20)
+        self.imbalance_threshold = coordinator_config.get("imbalance_threshold", 1.5)
+        self.min_miners = coordinator_config.get("min_miners", 1)
+        self.assignment = {shard: list(miners) for shard, miners in shard_assignment.items()}
+        self.assignment_epoch = assignment_epoch
+        self.assigned_at = 0.0  # Local time of the last assignment, older load reports do not reflect it
+        self.shard_loads = {}  # shard name -> last reported load
+        self.task = None
+        self.stats = {"reports_sent": 0, "reports_received": 0, "reassignments": 0, "caught_up": 0}
+
+        if self.enabled:
+            host.message_handler.register_handler("SHARD_LOAD", self.handle_load)
+            host.message_handler.register_handler("CONTROL", self.handle_control)
+
+    def start(self):
+        """
+        Start reporting the load of this shard in the background, if the coordinator is enabled.
+        """
+        if self.enabled and self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        """
+        Stop reporting the load of this shard.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        """
+        Broadcast the load of this shard to the other stakers every report interval.
+        """
+        while True:
+            try:
+                await self.report_load()
+            except Exception as e:
+                logging.error(f"Error reporting the load of {self.shard_name}: {e}")
+            await asyncio.sleep(self.report_interval)
+
+    def get_local_load(self) -> dict:
+        """
+        Get the load of this shard: the pending transactions of its partition of the pool and the summed hashrate of
+        its miners. The pool is partitioned among the shards in the order of their names.
+        Miners without a measurement yet, e.g. just assigned to the shard, count with the average measured hashrate.
+        """
+        shards = sorted(self.assignment)
+        miners = [peer.split(":")[0] for peer in self.assignment.get(self.shard_name, [])]
+        hashrates = [self.shard_staker.get_miner_state(miner)["hashrate"] for miner in miners]
+        measured = [hashrate for hashrate in hashrates if hashrate is not None]
+        average = sum(measured) / len(measured) if measured else 0.0
+        return {
+            "shard": self.shard_name,
+            "pending": len(self.transaction_manager.get_transactions_for_shard(shards.index(self.shard_name), len(shards))),
+            "hashrate": sum(hashrate if hashrate is not None else average for hashrate in hashrates),
+            "miners": len(miners),
+        }
+
+    async def report_load(self):
+        """
+        Record the load of this shard and broadcast it to the other stakers, along with the current assignment.
+        """
+        load = self.get_local_load()
+        self.shard_loads[self.shard_name] = dict(load, received_at=time.time())
+        self.stats["reports_sent"] += 1
+        report = dict(load, assignment_epoch=self.assignment_epoch, assignment=self.assignment)
+        await self.host.broadcast_message(Message.generate_shard_load_message(load=report, node_name=self.node_name), topic="stakers")
+
+    async def handle_load(self, message: Message):
+        """
+        Record the load reported by the staker of another shard, and adopt its assignment if it is newer.
+        """
+        load = dict(message.get_content())
+        assignment_epoch, assignment = load.pop("assignment_epoch", 0), load.pop("assignment", None)
+        if assignment is not None and self.apply_assignment(assignment, assignment_epoch):
+            self.stats["caught_up"] += 1
+        if load.get("shard") in self.assignment and load.get("shard") != self.shard_name:
+            self.shard_loads[load["shard"]] = dict(load, received_at=time.time())
+            self.stats["reports_received"] += 1
+
+    async def handle_control(self, message: Message):
+        """
+        Apply ASSIGN control messages; other control messages go to the control queue as before.
+        """
+        content = message.get_content()
+        if content.get("action") == "ASSIGN":
+            self.apply_assignment(content["assignment"], content.get("epoch", 0))
+        else:
+            await self.host.message_handler.add_control_message(message)
+
+    def apply_assignment(self, assignment: dict, epoch: int) -> bool:
+        """
+        Adopt a miner assignment, unless a newer one is already in place.
+        :return: True if the assignment was applied.
+        """
+        if epoch <= self.assignment_epoch:
+            return False
+        self.assignment = {shard: list(miners) for shard, miners in assignment.items()}
+        self.assignment_epoch = epoch
+        self.assigned_at = time.time()
+        self.on_assignment(self.assignment, epoch)
+        logging.info(f"Staker {self.node_name} applied the miner assignment of epoch {epoch}.")
+        return True
+
+    def plan_rebalance(self):
+        """
+        Choose a miner to move from the shard with the fewest pending transactions per hash to the one with the most.
+        Only shards with a measured hashrate reported since the last assignment are compared, and a miner is only
+        moved if that reduces the imbalance, so miners do not move back and forth between two shards.
+        :return: A tuple (miner peer, from shard, to shard), or None if the shards are balanced.
+        """
+        loads = {
+            shard: load for shard, load in self.shard_loads.items()
+            if shard in self.assignment and load.get("hashrate") and load["received_at"] >= self.assigned_at
+        }
+        pressures = {shard: load["pending"] / load["hashrate"] for shard, load in loads.items()}
+        if len(pressures) < 2:
+            return None
+        busiest = max(pressures, key=pressures.get)
+        idlest = min(pressures, key=pressures.get)
+        if pressures[busiest] < self.imbalance_threshold * pressures[idlest]:
+            return None
+        if len(self.assignment[idlest]) <= self.min_miners:
+            return None
+
+        # Assume the miner takes its share of the shard's hashrate along
+        moved_hashrate = loads[idlest]["hashrate"] / max(1, loads[idlest]["miners"])
+        if moved_hashrate >= loads[idlest]["hashrate"]:
+            return None
+        projected_busiest = loads[busiest]["pending"] / (loads[busiest]["hashrate"] + moved_hashrate)
+        projected_idlest = loads[idlest]["pending"] / (loads[idlest]["hashrate"] - moved_hashrate)
+        projected_imbalance = max(projected_busiest, projected_idlest) / min(projected_busiest, projected_idlest)
+        if projected_imbalance >= pressures[busiest] / pressures[idlest]:
+            return None
+        # The last miner moves, so the remaining miners of the shard keep their IDs
+        return self.assignment[idlest][-1], idlest, busiest
+
+    async def rebalance(self, epoch: int):
+        """
+        At rebalance epochs, move one miner to the most loaded shard and announce the new assignment.
+        Called by the selected staker before it starts the epoch.
+        :param epoch: The epoch being started.
+        :return: True if a miner was reassigned.
+        """
+        if not self.enabled or epoch % self.rebalance_interval != 0 or epoch <= self.assignment_epoch:
+            return False
+        self.shard_loads[self.shard_name] = dict(self.get_local_load(), received_at=time.time())
+        plan = self.plan_rebalance()
+        if plan is None:
+            return False
+
+        miner, from_shard, to_shard = plan
+        assignment = {shard: list(miners) for shard, miners in self.assignment.items()}
+        assignment[from_shard].remove(miner)
+        assignment[to_shard].append(miner)
+
+        self.stats["reassignments"] += 1
+        logging.info(f"Epoch {epoch}: reassigning miner {miner} from {from_shard} to {to_shard}.")
+        message = Message.generate_assign_message(shard_name=to_shard, epoch=epoch, assignment=assignment, node_name=self.node_name)
+        self.apply_assignment(assignment, epoch)
+        await self.host.broadcast_message(message, topic="stakers")
+        # Every miner of both shards recomputes its ID and transaction partition
+        for peer in assignment[from_shard] + assignment[to_shard]:
+            await self.host.send_message(Peer(*peer.split(":")), message)
+        return True
+
+    def get_stats(self) -> dict:
+        """
+        Get the coordinator counters, the current assignment and the last known shard loads.
+        """
+        return dict(self.stats, assignment=self.assignment, assignment_epoch=self.assignment_epoch,
+                    shard_loads={shard: dict(load) for shard, load in self.shard_loads.items()})
@@ -20,6 +20,23 @@ class ShardMiner:
         self.nbits = self.pow.get_current_target_nbits()
         self.alocd_transactions = self.transaction_manager.get_transactions_for_miner(self.miner_numeric_id)
 
+    def assign_transactions(self, weights: List[float]=None):
+        """
+        Recompute this miner's share of the transaction pool.
+        :param weights: Optional share of every miner from the START message, indexed by miner ID; round-robin if None.
+        """
+        if weights is not None and len(weights) != self.transaction_manager.get_num_miners():
+            weights = None
+        self.alocd_transactions = self.transaction_manager.get_transactions_for_miner(self.miner_numeric_id, weights)
+
+    def reassign(self, miner_numeric_id: int, num_miners: int):
+        """
+        Take a new miner ID and shard size after the miners were reassigned, and recompute this miner's share.
+        """
+        self.miner_numeric_id = miner_numeric_id
+        self.transaction_manager.set_num_miners(num_miners)
+        self.assign_transactions()
+
     def process_transactions(self):
         """
         Processes the assigned transactions, calculates the Merkle root, and timestamps it.
@@ -28,13 +45,15 @@ class ShardMiner:
         # Transaction varification logic will be added here
 
         # Calculate the Merkle root
-        merkle_root = self.transaction_manager.get_miner_merkle_root(self.miner_numeric_id)
+        merkle_root = self.transaction_manager.calculate_merkle_root(self.alocd_transactions)
 
         return merkle_root
 
-    def mine_shard_block(self):
+    def mine_shard_block(self, epoch: int=None, attempt: int=None):
         """
         Creates a new block with the processed result.
+        :param epoch: The epoch the block is mined for.
+        :param attempt: The attempt of the epoch the block is mined for.
         :return: A new shard block.
         """
         transactions = self.alocd_transactions
@@ -46,7 +65,9 @@ class ShardMiner:
                                  merkle_root=merkle_root, 
                                  timestamp=timestamp, 
                                  nbits=self.nbits,
-                                 transactions=transactions)
+                                 transactions=transactions,
+                                 epoch=epoch,
+                                 attempt=attempt)
         
         golden_nonce = self.get_golden_nonce(shard_block)
         shard_block.nonce = golden_nonce
@@ -1,22 +1,29 @@
 import uuid
-import hashlib
 import logging
 from typing import List
 from blockchain.shard_block import ShardBlock
 from transaction.transaction_manager import TransactionManager
 from blockchain.blockchain import Blockchain
 from blockchain.main_block import MainBlock
+from blockchain.stake_index import StakeIndex
 
 class ShardStaker:
-    def __init__(self, transaction_manager: TransactionManager, blockchain: Blockchain, node_name: str):
+    LATENCY_SMOOTHING = 0.3  # Weight of the newest latency sample in the per-miner moving average
+    MIN_WEIGHT = 0.1         # Smallest transaction share of a miner relative to an even split
+
+    def __init__(self, transaction_manager: TransactionManager, blockchain: Blockchain, node_name: str, block_version: int = 1):
         """
         Initializes the Staker Node.
         :param transaction_manager: The Transaction Manager object.
         :param blockchain: The Blockchain object.
+        :param block_version: The format version of proposed main blocks, see MainBlock.
         """
         self.shard_block_list = []
         self.blockchain = blockchain
         self.stakes = {}
+        self.block_version = block_version
+        self.stake_index = StakeIndex()
+        self.miner_stats = {}  # miner node name -> {"received", "missed", "latency", "hashrate"}
         self.staker_node_name = node_name
         self.transaction_manager = transaction_manager
         staker_signature = uuid.uuid4().hex
@@ -28,25 +35,27 @@ class ShardStaker:
         :param stake_info: A dictionary of staker IDs and their stakes.
         """
         self.stakes = stake_info
+        self.stake_index = StakeIndex(stake_info)
         
     
     def add_stake(self, staker_id, amount):
         """
         Add a stake to the staker.
         :param staker_id: The ID of the staker.
-        :param amount: The amount to stake.
+        :param amount: The amount to stake, an integer; the resulting stake must not be negative.
         """
-        if staker_id not in self.stakes:
-            self.stakes[staker_id] = amount
-        else:
-            self.stakes[staker_id] += amount
+        # Validated by the index before the stakes are changed
+        self.stake_index.add_stake(staker_id, amount)
+        self.stakes[staker_id] = self.stake_index.get_stake(staker_id)
 
     def select_staker(self):
         """
         Deterministically selects a staker based on their stake and the previous block hash.
+        The hash of the previous block and the sorted staker IDs is taken modulo the total stake, and the first
+        staker in sorted order whose cumulative stake exceeds it is selected, looked up in the stake index.
         :return: The selected staker ID.
         """
-        if not self.stakes or sum(self.stakes.values()) == 0:
+        if self.stake_index.get_total_stake() == 0:
             return None
 
         # Get the hash of the previous block
@@ -54,25 +63,9 @@ class ShardStaker:
         previous_block_hash = previous_block.compute_hash()
         epoch = previous_block.index + 1
 
-        # Sort staker IDs to ensure consistent ordering
-        sorted_stakers = sorted(self.stakes.keys())
-
-        # Combine the previous block hash with sorted staker IDs
-        combined_string = previous_block_hash + ''.join(sorted_stakers)
-        combined_hash = hashlib.sha256(combined_string.encode()).hexdigest()
-
-        # Convert the hash to a deterministic "random" number
-        hash_number = int(combined_hash, 16)
-
-        # Use weighted selection based on stakes
-        total_stake = sum(self.stakes.values())
-        cumulative_weight = 0
-
-        for staker in sorted_stakers:
-            stake_weight = self.stakes[staker]
-            cumulative_weight += stake_weight
-            if hash_number % total_stake < cumulative_weight:
-                return staker, epoch
+        staker = self.stake_index.select(previous_block_hash)
+        if staker is not None:
+            return staker, epoch
 
     
     def validate_shard_block(self, shard_block: ShardBlock):
@@ -98,6 +91,10 @@ class ShardStaker:
         :return: A tuple containing a boolean indicating whether the block was added successfully and the newly added block.
         """
         if shard_blocks:
+            if self.block_version >= 2:
+                # Transactions are ordered like the shard roots in the tx_root tree
+                shard_blocks = sorted(shard_blocks, key=lambda block: (block.miner_numeric_id, block.miner_node_name))
+
             # Collect all transactions from the shard blocks
             combined_transactions = []
             shard_data = {}
@@ -110,10 +107,17 @@ class ShardStaker:
                 "nonce" : shard_block.nonce,
                 "nbits" : shard_block.nbits,
                 }
+                if self.block_version >= 2:
+                    shard_data[shard_block.miner_node_name]["tx_count"] = len(shard_block.transactions)
                 combined_transactions.extend(shard_block.transactions)
 
-            # Calculate a single Merkle root for all transactions
-            transaction_merkle_root = self.transaction_manager.calculate_merkle_root(combined_transactions)
+            if self.block_version >= 2:
+                # The shard roots were verified in validate_shard_block, so only the shard level of the tree is built
+                transaction_merkle_root = self.transaction_manager.calculate_merkle_root_from_hashes(
+                    [shard_block.merkle_root for shard_block in shard_blocks])
+            else:
+                # Calculate a single Merkle root for all transactions
+                transaction_merkle_root = self.transaction_manager.calculate_merkle_root(combined_transactions)
 
             # Create and propose the new main block
             new_block = self.blockchain.create_block(
@@ -121,6 +125,7 @@ class ShardStaker:
                 tx_root=transaction_merkle_root,
                 shard_data=shard_data,
                 transactions=combined_transactions,
+                version=self.block_version,
             )
             return self.blockchain.add_block(new_block), new_block
         else:
@@ -134,6 +139,74 @@ class ShardStaker:
     #     """
     #     return self.shard_block_list.pop()
         
+    def get_miner_state(self, miner: str) -> dict:
+        """
+        Get the collection statistics of a miner, creating them on first use.
+        """
+        return self.miner_stats.setdefault(miner, {"received": 0, "missed": 0, "latency": None, "hashrate": None})
+
+    def record_shard_block(self, miner: str, latency: float, attempts: int = None):
+        """
+        Record that a miner's shard block arrived within the collection window.
+        :param miner: The miner node name.
+        :param latency: Seconds between the START message and the shard block.
+        :param attempts: Optional number of hashes the miner computed for the block (its nonce + 1), to measure its hashrate.
+        """
+        state = self.get_miner_state(miner)
+        state["received"] += 1
+        if state["latency"] is None:
+            state["latency"] = latency
+        else:
+            state["latency"] += self.LATENCY_SMOOTHING * (latency - state["latency"])
+        if attempts is not None and latency > 0:
+            hashrate = attempts / latency
+            if state["hashrate"] is None:
+                state["hashrate"] = hashrate
+            else:
+                state["hashrate"] += self.LATENCY_SMOOTHING * (hashrate - state["hashrate"])
+
+    def record_missing_miners(self, miners: List[str], deadline: float):
+        """
+        Record the miners whose shard blocks did not arrive before the deadline.
+        A missed deadline counts as a latency sample of the full deadline, so a slow miner's share shrinks.
+        :param miners: The miner node names.
+        :param deadline: The collection deadline, in seconds.
+        """
+        for miner in miners:
+            state = self.get_miner_state(miner)
+            state["missed"] += 1
+            latency = state["latency"] if state["latency"] is not None else deadline
+            state["latency"] = latency + self.LATENCY_SMOOTHING * (max(deadline, latency) - latency)
+
+    def get_miner_weights(self, miner_id_map: dict) -> List[float]:
+        """
+        Compute the transaction share of every miner from its recent latency: a miner that answers twice as
+        fast gets twice the transactions. Miners without measurements get the average share, and no miner
+        drops below MIN_WEIGHT of an even split so it keeps producing latency samples.
+        :param miner_id_map: Mapping of miner node names to their IDs.
+        :return: The weights indexed by miner ID, summing to 1, or None if no latency was measured yet.
+        """
+        latencies = {miner: self.get_miner_state(miner)["latency"] for miner in miner_id_map}
+        speeds = {miner: 1 / max(latency, 1e-3) for miner, latency in latencies.items() if latency is not None}
+        if not speeds:
+            return None
+
+        average_speed = sum(speeds.values()) / len(speeds)
+        weights = [0.0] * len(miner_id_map)
+        for miner, miner_id in miner_id_map.items():
+            weights[miner_id] = speeds.get(miner, average_speed)
+        total = sum(weights)
+        floor = self.MIN_WEIGHT / len(weights)
+        weights = [max(weight / total, floor) for weight in weights]
+        total = sum(weights)
+        return [round(weight / total, 4) for weight in weights]
+
+    def get_miner_stats(self) -> dict:
+        """
+        Get a copy of the collection statistics of every miner.
+        """
+        return {miner: dict(state) for miner, state in self.miner_stats.items()}
+
     def get_stacker_signature(self):
         """
         Get the staker signature.
@@ -147,21 +220,25 @@ class ShardStaker:
         """
         if message.get_content_type() == "MAIN_BLOCK":
             message_payload = message.get_content()
-            main_block = MainBlock.from_dict(message_payload)
+            # The content is already a MainBlock when the message handler has a decoder registered
+            main_block = message_payload if isinstance(message_payload, MainBlock) else MainBlock.from_dict(message_payload)
 
             is_added = self.blockchain.add_block(main_block)
 
             if is_added:
                 logging.info(f"Block proposed by {block_sender} added Block {main_block.index} to the blockchain.")
                 return True, main_block
+            elif self.blockchain.orphan_pool.contains(main_block.compute_hash()):
+                logging.info(f"Block {main_block.index} proposed by {block_sender} is waiting for its parent block.")
+                return False, main_block
             else:
                 logging.info(f"Staker {block_sender} rejected the block.")
-                return False
+                return False, main_block
     
     def process_shard_block(self, message):
         if message.get_content_type() == "SHARD_BLOCK":
             message_payload = message.get_content()
-            shard_block = ShardBlock.from_dict(message_payload)
+            shard_block = message_payload if isinstance(message_payload, ShardBlock) else ShardBlock.from_dict(message_payload)
             logging.info(f"Staker {self.staker_node_name} received shard block from {shard_block.miner_node_name}.")
             is_valid = self.validate_shard_block(shard_block)
             if is_valid:
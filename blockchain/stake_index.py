@@ -0,0 +1,121 @@
+import bisect
+import hashlib
+
+
+class StakeIndex:
+    def __init__(self, stakes: dict = None):
+        """
+        Initializes an index of the stakers' stakes for weighted staker selection.
+        Stakers are kept in sorted order with their stakes in a Fenwick tree (binary indexed tree), so a stake update
+        and the weighted selection of a staker take O(log n) instead of a pass over all stakers.
+        The selection is the same as the cumulative walk over the sorted stakers: the first staker whose cumulative
+        stake exceeds the target is selected. Stakes must be non-negative integers, so the incrementally updated
+        sums stay exact and every node selects the same staker however its index was built.
+        :param stakes: A dictionary of staker IDs and their stakes.
+
+        reference: https://en.wikipedia.org/wiki/Fenwick_tree
+        """
+        self.stakers = []  # Staker IDs in sorted order, position i is tree index i + 1
+        self.stakes = {}   # staker ID -> stake
+        self.tree = [0]
+        self.total_stake = 0
+        self.staker_string = b""  # The sorted staker IDs joined, part of the selection hash
+        if stakes:
+            self.rebuild(stakes)
+
+    @staticmethod
+    def check_stake(staker_id: str, amount):
+        """
+        Raise a ValueError unless the stake is a non-negative integer.
+        """
+        if isinstance(amount, bool) or not isinstance(amount, int) or amount < 0:
+            raise ValueError(f"Invalid stake {amount!r} for {staker_id}: stakes must be non-negative integers.")
+
+    def rebuild(self, stakes: dict):
+        """
+        Rebuild the index from a dictionary of stakes in O(n).
+        """
+        for staker_id, amount in stakes.items():
+            self.check_stake(staker_id, amount)
+        self.stakes = dict(stakes)
+        self.stakers = sorted(self.stakes)
+        self.tree = [0] + [self.stakes[staker] for staker in self.stakers]
+        for index in range(1, len(self.tree)):
+            parent = index + (index & -index)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[index]
+        self.total_stake = sum(self.stakes.values())
+        self.staker_string = "".join(self.stakers).encode()
+
+    def update(self, position: int, delta):
+        """
+        Add delta to the stake at a position of the sorted stakers.
+        """
+        index = position + 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def set_stake(self, staker_id: str, amount):
+        """
+        Set the stake of a staker. Updating a known staker takes O(log n); a new staker changes the order of
+        the stakers and rebuilds the index.
+        :param staker_id: The ID of the staker.
+        :param amount: The new stake, a non-negative integer.
+        """
+        self.check_stake(staker_id, amount)
+        if staker_id not in self.stakes:
+            stakes = dict(self.stakes)
+            stakes[staker_id] = amount
+            self.rebuild(stakes)
+            return
+        delta = amount - self.stakes[staker_id]
+        self.stakes[staker_id] = amount
+        self.total_stake += delta
+        self.update(bisect.bisect_left(self.stakers, staker_id), delta)
+
+    def add_stake(self, staker_id: str, amount):
+        """
+        Add to the stake of a staker, adding the staker if it is not known yet.
+        :param amount: The integer amount to add, negative to withdraw; the resulting stake must not be negative.
+        """
+        if isinstance(amount, bool) or not isinstance(amount, int):
+            raise ValueError(f"Invalid stake amount {amount!r} for {staker_id}: stakes must be integers.")
+        self.set_stake(staker_id, self.stakes.get(staker_id, 0) + amount)
+
+    def get_stake(self, staker_id: str):
+        return self.stakes.get(staker_id, 0)
+
+    def get_total_stake(self):
+        return self.total_stake
+
+    def find(self, target):
+        """
+        Find the first staker whose cumulative stake, in sorted order, exceeds the target.
+        :param target: A value in [0, total stake).
+        :return: The staker ID, or None if the target is out of range.
+        """
+        if not 0 <= target < self.total_stake:
+            return None
+        position = 0
+        remaining = target
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            index = position + step
+            # Descend past every prefix whose cumulative stake does not exceed the target
+            if index < len(self.tree) and self.tree[index] <= remaining:
+                position = index
+                remaining -= self.tree[index]
+            step >>= 1
+        return self.stakers[position] if position < len(self.stakers) else None
+
+    def select(self, previous_block_hash: str):
+        """
+        Deterministically select a staker, weighted by stake, from the hash of the previous block.
+        :param previous_block_hash: The hash of the previous block.
+        :return: The selected staker ID, or None if there is no stake.
+        """
+        if not self.stakers or self.total_stake == 0:
+            return None
+        combined_hash = hashlib.sha256(previous_block_hash.encode() + self.staker_string).hexdigest()
+        return self.find(int(combined_hash, 16) % self.total_stake)
@@ -0,0 +1,130 @@
+from blockchain.blockchain import Blockchain
+from blockchain.block_store import BlockStore
+from blockchain.lazy_chain import LazyChain
+from blockchain.main_block import MainBlock
+
+
+def make_block(parent, timestamp="1"):
+    """
+    Build a block on top of a parent block.
+    """
+    return MainBlock(index=parent.index + 1, timestamp=timestamp, tx_root="", previous_hash=parent.block_hash,
+                     staker_signature="staker10:signature", nbits=None)
+
+
+def build_chain(block_store, length):
+    """
+    Restore an empty blockchain from the store and extend it by `length` blocks.
+    """
+    blockchain = Blockchain()
+    block_store.restore(blockchain)
+    for _ in range(length):
+        assert blockchain.add_block(make_block(blockchain.get_last_block()))
+    return blockchain
+
+
+def make_store(tmp_path, **kwargs):
+    options = {"segment_size": 10, "snapshot_interval": 5, "snapshot_window": 4, "cold_codec": None}
+    options.update(kwargs)
+    return BlockStore("staker10", data_dir=str(tmp_path), **options)
+
+
+def test_blocks_are_stored_in_segments(tmp_path):
+    block_store = make_store(tmp_path)
+    blockchain = build_chain(block_store, 24)
+
+    assert block_store.height == 24
+    assert block_store.get_segment_numbers() == [0, 1, 2]
+    assert [block["index"] for block in block_store.read_blocks(start_height=18)] == list(range(18, 25))
+    assert block_store.get_block(13)["block_hash"] == blockchain.chain[13].block_hash
+    assert block_store.get_block(25) is None
+    # A new store finds the height from the last segment
+    assert make_store(tmp_path).height == 24
+
+
+def test_restart_restores_the_snapshot_and_replays_the_newer_blocks(tmp_path):
+    blockchain = build_chain(make_store(tmp_path), 23)
+
+    block_store = make_store(tmp_path)
+    restored_blockchain = Blockchain()
+    block_store.restore(restored_blockchain)
+
+    assert block_store.snapshot_height == 20
+    assert isinstance(restored_blockchain.chain, LazyChain)
+    assert restored_blockchain.chain.offset == 17
+    assert restored_blockchain.tip_hash == blockchain.tip_hash
+    assert len(restored_blockchain.chain) == len(blockchain.chain)
+    # Older headers are only loaded from the store when they are accessed
+    assert 5 not in restored_blockchain.chain.older_blocks
+    assert [block.block_hash for block in restored_blockchain.chain] == [block.block_hash for block in blockchain.chain]
+    assert restored_blockchain.chain[5].block_hash == blockchain.chain[5].block_hash
+
+    # The restored chain keeps growing and persisting
+    restored_blockchain.add_block(make_block(restored_blockchain.get_last_block()))
+    assert block_store.height == 24
+
+
+def test_reorg_truncates_the_store_and_drops_newer_snapshots(tmp_path):
+    block_store = make_store(tmp_path)
+    blockchain = build_chain(block_store, 12)
+    assert block_store.snapshot_height == 10
+
+    fork_point = blockchain.chain[8]
+    side_branch = [make_block(fork_point, timestamp="2")]
+    for _ in range(4):
+        side_branch.append(make_block(side_branch[-1], timestamp="2"))
+    for block in side_branch:
+        blockchain.add_block(block)
+
+    assert blockchain.tip_hash == side_branch[-1].block_hash
+    assert block_store.height == 13
+    assert [block["block_hash"] for block in block_store.read_blocks(start_height=9)] == [block.block_hash for block in side_branch]
+    # The snapshot at height 10 was dropped with the replaced blocks and written again on the new branch
+    assert block_store.snapshot_height == 10
+    assert block_store.read_snapshot()["tip_hash"] == side_branch[1].block_hash
+
+
+def test_blocks_that_no_longer_connect_are_truncated_on_restore(tmp_path):
+    build_chain(make_store(tmp_path, snapshot_interval=0), 6)
+    segment_path = make_store(tmp_path).get_segment_path(0)
+    with open(segment_path, "r") as segment_file:
+        lines = segment_file.readlines()
+    # Changing block 4 changes its hash, so block 5 no longer connects to it
+    lines[4] = lines[4].replace('"timestamp":"1"', '"timestamp":"9"')
+    with open(segment_path, "w") as segment_file:
+        segment_file.writelines(lines)
+
+    block_store = make_store(tmp_path, snapshot_interval=0)
+    blockchain = Blockchain()
+    block_store.restore(blockchain)
+
+    assert len(blockchain.chain) == 5
+    assert block_store.height == 4
+
+
+def test_lazy_chain_loads_older_blocks_on_access():
+    blocks = [make_block(MainBlock(index=-1, timestamp="0", tx_root="", previous_hash="0", staker_signature="", nbits=None))]
+    for _ in range(9):
+        blocks.append(make_block(blocks[-1]))
+    loaded_heights = []
+
+    def load_block(height):
+        loaded_heights.append(height)
+        return blocks[height]
+
+    chain = LazyChain(blocks[0], blocks[6:], load_block)
+    assert len(chain) == 10
+    assert chain[-1] is blocks[9]
+    assert chain[3] is blocks[3]
+    assert chain[2:8] == blocks[2:8]
+    assert loaded_heights == [3, 2, 4, 5]
+    assert list(reversed(chain)) == list(reversed(blocks))
+
+    del chain[8:]
+    chain.append(blocks[8])
+    assert len(chain) == 9
+    del chain[4:]
+    assert chain.offset == 4
+    assert 5 not in chain.older_blocks
+    chain.extend(blocks[4:6])
+    assert chain[:] == blocks[:6]
@@ -0,0 +1,118 @@
+from blockchain.blockchain import Blockchain
+from blockchain.main_block import MainBlock
+
+
+def make_block(parent, staker="staker10", timestamp="1"):
+    """
+    Build a block on top of a parent block.
+    """
+    return MainBlock(index=parent.index + 1, timestamp=timestamp, tx_root="", previous_hash=parent.block_hash,
+                     staker_signature=f"{staker}:signature", nbits=None)
+
+
+def make_branch(parent, length, staker="staker10", timestamp="1"):
+    """
+    Build a branch of blocks on top of a parent block.
+    """
+    blocks = []
+    for _ in range(length):
+        parent = make_block(parent, staker, timestamp)
+        blocks.append(parent)
+    return blocks
+
+
+class RecordingListener:
+    def __init__(self):
+        self.events = []
+
+    def block_connected(self, block):
+        self.events.append(("connected", block.block_hash))
+
+    def block_disconnected(self, block):
+        self.events.append(("disconnected", block.block_hash))
+
+
+def test_orphans_are_connected_when_their_parent_arrives():
+    blockchain = Blockchain()
+    first, second, third = make_branch(blockchain.get_last_block(), 3)
+
+    assert not blockchain.add_block(third)
+    assert not blockchain.add_block(second)
+    assert blockchain.orphan_pool.contains(third.block_hash)
+
+    assert blockchain.add_block(first)
+    assert [block.block_hash for block in blockchain.chain[1:]] == [first.block_hash, second.block_hash, third.block_hash]
+    assert not blockchain.orphan_pool.contains(second.block_hash)
+    assert not blockchain.orphan_pool.contains(third.block_hash)
+
+
+def test_orphan_pool_evicts_the_oldest_orphan():
+    blockchain = Blockchain(max_orphans=2)
+    parent = make_block(blockchain.get_last_block())
+    orphans = [make_block(parent, timestamp=str(timestamp)) for timestamp in range(3)]
+    for orphan in orphans:
+        blockchain.add_block(orphan)
+
+    assert not blockchain.orphan_pool.contains(orphans[0].block_hash)
+    assert blockchain.orphan_pool.contains(orphans[1].block_hash)
+    assert blockchain.orphan_pool.contains(orphans[2].block_hash)
+
+
+def test_longest_branch_wins_and_listeners_see_the_reorg():
+    blockchain = Blockchain()
+    listener = RecordingListener()
+    blockchain.register_listener(listener)
+    genesis_block = blockchain.get_last_block()
+    main_branch = make_branch(genesis_block, 2, timestamp="1")
+    side_branch = make_branch(genesis_block, 3, timestamp="2")
+
+    for block in main_branch + side_branch[:2]:
+        assert blockchain.add_block(block)
+    # A branch of equal length does not replace the tip
+    assert blockchain.tip_hash == main_branch[-1].block_hash
+
+    listener.events.clear()
+    assert blockchain.add_block(side_branch[2])
+    assert blockchain.tip_hash == side_branch[-1].block_hash
+    assert [block.block_hash for block in blockchain.chain[1:]] == [block.block_hash for block in side_branch]
+    assert listener.events == (
+        [("disconnected", block.block_hash) for block in reversed(main_branch)]
+        + [("connected", block.block_hash) for block in side_branch]
+    )
+
+
+def test_reorg_through_orphans():
+    blockchain = Blockchain()
+    genesis_block = blockchain.get_last_block()
+    for block in make_branch(genesis_block, 2, timestamp="1"):
+        blockchain.add_block(block)
+    side_branch = make_branch(genesis_block, 3, timestamp="2")
+
+    # The side branch arrives out of order and only wins once its first block connects it
+    for block in reversed(side_branch):
+        blockchain.add_block(block)
+    assert blockchain.tip_hash == side_branch[-1].block_hash
+    assert len(blockchain.chain) == 4
+    assert blockchain.is_chain_valid()
+
+
+def test_stake_fork_choice_prefers_the_heavier_branch():
+    blockchain = Blockchain(fork_choice="stake", stake_info={"staker10": 10, "staker20": 100})
+    genesis_block = blockchain.get_last_block()
+    light_branch = make_branch(genesis_block, 3, staker="staker10")
+    heavy_branch = make_branch(genesis_block, 1, staker="staker20")
+
+    for block in light_branch + heavy_branch:
+        blockchain.add_block(block)
+    assert blockchain.tip_hash == heavy_branch[-1].block_hash
+    assert len(blockchain.chain) == 2
+
+
+def test_blocks_with_a_wrong_height_are_rejected():
+    blockchain = Blockchain()
+    block = make_block(blockchain.get_last_block())
+    block.index = 5
+    block.block_hash = block.compute_hash()
+
+    assert not blockchain.add_block(block)
+    assert len(blockchain.chain) == 1
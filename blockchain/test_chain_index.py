@@ -0,0 +1,87 @@
+from blockchain.blockchain import Blockchain
+from blockchain.block_store import BlockStore
+from blockchain.chain_index import ChainIndex
+from blockchain.main_block import MainBlock
+from transaction.transaction import Transaction
+
+
+def make_transaction(sender, recipient, amount):
+    tx = Transaction(sender=sender, recipient=recipient, amount=amount, timestamp="1", metadata={})
+    tx.hash_transaction()
+    return tx
+
+
+def make_block(parent, transactions, timestamp="1"):
+    """
+    Build a block with transactions on top of a parent block.
+    """
+    return MainBlock(index=parent.index + 1, timestamp=timestamp, tx_root="", previous_hash=parent.block_hash,
+                     staker_signature="staker10:signature", nbits=None, transactions=transactions)
+
+
+def test_transactions_and_addresses_are_indexed(tmp_path):
+    blockchain = Blockchain()
+    chain_index = ChainIndex(str(tmp_path / "index.db"))
+    chain_index.sync_with_chain(blockchain)
+    first_tx = make_transaction("alice", "bob", 1)
+    second_tx = make_transaction("bob", "carol", 2)
+    third_tx = make_transaction("alice", "alice", 3)
+
+    first_block = make_block(blockchain.get_last_block(), [first_tx])
+    blockchain.add_block(first_block)
+    blockchain.add_block(make_block(first_block, [second_tx, third_tx, first_tx]))
+
+    assert chain_index.get_indexed_height() == 2
+    assert chain_index.get_transaction_locations(first_tx.calculate_hash()) == [{"height": 2, "position": 2}, {"height": 1, "position": 0}]
+    assert chain_index.get_transaction_locations("unknown") == []
+    assert [entry["txid"] for entry in chain_index.get_address_history("bob")] == [first_tx.calculate_hash(), second_tx.calculate_hash(), first_tx.calculate_hash()]
+    # A transaction to oneself is listed once
+    assert [entry["position"] for entry in chain_index.get_address_history("alice")] == [2, 1, 0]
+    assert chain_index.get_address_history("alice", limit=1) == [{"txid": first_tx.calculate_hash(), "height": 2, "position": 2}]
+    assert chain_index.get_address_history("alice", before_height=2) == [{"txid": first_tx.calculate_hash(), "height": 1, "position": 0}]
+    chain_index.close()
+
+
+def test_reorg_rolls_back_the_replaced_blocks(tmp_path):
+    blockchain = Blockchain()
+    chain_index = ChainIndex(str(tmp_path / "index.db"))
+    chain_index.sync_with_chain(blockchain)
+    genesis_block = blockchain.get_last_block()
+    replaced_tx = make_transaction("alice", "bob", 1)
+    blockchain.add_block(make_block(genesis_block, [replaced_tx], timestamp="1"))
+
+    side_block = make_block(genesis_block, [make_transaction("carol", "dave", 2)], timestamp="2")
+    blockchain.add_block(side_block)
+    blockchain.add_block(make_block(side_block, [], timestamp="2"))
+
+    assert chain_index.get_indexed_height() == 2
+    assert chain_index.get_indexed_hash(1) == side_block.block_hash
+    assert chain_index.get_transaction_locations(replaced_tx.calculate_hash()) == []
+    assert chain_index.get_address_history("alice") == []
+    assert len(chain_index.get_address_history("carol")) == 1
+    chain_index.close()
+
+
+def test_sync_catches_up_from_the_block_store(tmp_path):
+    block_store = BlockStore("staker10", data_dir=str(tmp_path), segment_size=10, snapshot_interval=5, snapshot_window=2, cold_codec=None)
+    blockchain = Blockchain()
+    block_store.restore(blockchain)
+    chain_index = ChainIndex(str(tmp_path / "index.db"))
+    chain_index.sync_with_chain(blockchain)
+    for amount in range(1, 7):
+        blockchain.add_block(make_block(blockchain.get_last_block(), [make_transaction("alice", "bob", amount)]))
+    chain_index.close()
+
+    # The node stops before indexing the last blocks, then restarts from the snapshot, whose headers carry no transactions
+    chain_index = ChainIndex(str(tmp_path / "index.db"))
+    with chain_index.lock, chain_index.connection:
+        chain_index.delete_from_height(3)
+    tx_ids = [tx.calculate_hash() for block in blockchain.chain[1:] for tx in block.transactions]
+    restored_blockchain = Blockchain()
+    BlockStore("staker10", data_dir=str(tmp_path), segment_size=10, snapshot_interval=5, snapshot_window=2, cold_codec=None).restore(restored_blockchain)
+    assert not restored_blockchain.chain[4].transactions
+    chain_index.sync_with_chain(restored_blockchain, block_store=block_store)
+
+    assert chain_index.get_indexed_height() == 6
+    assert [entry["txid"] for entry in chain_index.get_address_history("bob")] == list(reversed(tx_ids))
+    chain_index.close()
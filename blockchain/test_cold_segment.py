@@ -0,0 +1,81 @@
+import os
+import json
+import pytest
+from blockchain.blockchain import Blockchain
+from blockchain.block_store import BlockStore
+from blockchain.cold_segment import ColdSegment
+from blockchain.main_block import MainBlock
+
+ENCODED_BLOCKS = [json.dumps({"index": index, "transactions": ["tx"] * (index % 7)}).encode() for index in range(40)]
+
+
+def make_store(tmp_path, **kwargs):
+    options = {"segment_size": 10, "snapshot_interval": 0, "hot_segments": 1, "cold_codec": "zlib"}
+    options.update(kwargs)
+    return BlockStore("staker10", data_dir=str(tmp_path), **options)
+
+
+def build_chain(block_store, length):
+    """
+    Restore an empty blockchain from the store and extend it by `length` blocks.
+    """
+    blockchain = Blockchain()
+    block_store.restore(blockchain)
+    for _ in range(length):
+        parent = blockchain.get_last_block()
+        assert blockchain.add_block(MainBlock(index=parent.index + 1, timestamp="1", tx_root="", previous_hash=parent.block_hash,
+                                              staker_signature="staker10:signature", nbits=None))
+    return blockchain
+
+
+@pytest.mark.parametrize("codec", sorted(ColdSegment.CODECS))
+def test_segment_round_trip(tmp_path, codec):
+    path = str(tmp_path / f"segment{ColdSegment.FILE_EXTENSION}")
+    ColdSegment.write(path, ENCODED_BLOCKS, codec=codec)
+    cold_segment = ColdSegment(path)
+
+    assert cold_segment.codec == codec
+    assert cold_segment.block_count == len(ENCODED_BLOCKS)
+    assert list(cold_segment.read_blocks()) == ENCODED_BLOCKS
+    assert list(cold_segment.read_blocks(start_position=33)) == ENCODED_BLOCKS[33:]
+    assert [cold_segment.read_block(position) for position in (39, 0, 17)] == [ENCODED_BLOCKS[39], ENCODED_BLOCKS[0], ENCODED_BLOCKS[17]]
+
+
+def test_unknown_codecs_and_files_are_rejected(tmp_path):
+    path = str(tmp_path / "segment.seg")
+    with pytest.raises(ValueError):
+        ColdSegment.write(path, ENCODED_BLOCKS, codec="zstd")
+    with open(path, "wb") as segment_file:
+        segment_file.write(b"\x00" * ColdSegment.HEADER.size)
+    with pytest.raises(ValueError):
+        ColdSegment(path)
+
+
+def test_full_segments_behind_the_hot_ones_are_compressed(tmp_path):
+    block_store = make_store(tmp_path)
+    blockchain = build_chain(block_store, 34)
+
+    # Segments 0 and 1 are full and older than the hot segment 2, segment 3 is being written
+    assert block_store.is_cold(0) and block_store.is_cold(1)
+    assert not block_store.is_cold(2) and not block_store.is_cold(3)
+    assert not os.path.exists(block_store.get_segment_path(0))
+    assert [block["block_hash"] for block in block_store.read_blocks(start_height=5)] == [block.block_hash for block in blockchain.chain[5:]]
+    assert block_store.get_block(14)["block_hash"] == blockchain.chain[14].block_hash
+    assert make_store(tmp_path).height == 34
+
+
+def test_truncating_a_cold_segment_decompresses_it(tmp_path):
+    block_store = make_store(tmp_path)
+    build_chain(block_store, 34)
+
+    block_store.truncate(15)
+    assert block_store.height == 14
+    assert not block_store.is_cold(1)
+    assert block_store.get_segment_numbers() == [0, 1]
+    assert [block["index"] for block in block_store.read_blocks(start_height=8)] == list(range(8, 15))
+
+
+def test_stores_without_a_codec_stay_hot(tmp_path):
+    block_store = make_store(tmp_path, cold_codec=None)
+    build_chain(block_store, 34)
+    assert not any(block_store.is_cold(segment_number) for segment_number in block_store.get_segment_numbers())
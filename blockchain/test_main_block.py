@@ -0,0 +1,68 @@
+import pytest
+from blockchain.main_block import MainBlock
+from transaction.transaction import Transaction
+from transaction.transaction_manager import TransactionManager
+
+
+def make_transactions(count, sender="alice"):
+    transactions = []
+    for amount in range(count):
+        tx = Transaction(sender=sender, recipient="bob", amount=amount, timestamp="1", metadata={})
+        tx.hash_transaction()
+        transactions.append(tx)
+    return transactions
+
+
+def make_block(shard_transactions, version=2):
+    """
+    Build a block from the transactions of each shard, in miner ID order.
+    """
+    shard_data = {
+        f"miner{miner_id}_1": {"merkle_root": TransactionManager.calculate_merkle_root(transactions),
+                               "miner_numeric_id": miner_id, "tx_count": len(transactions)}
+        for miner_id, transactions in enumerate(shard_transactions)
+    }
+    transactions = [tx for transactions in shard_transactions for tx in transactions]
+    block = MainBlock(index=1, timestamp="1", tx_root="", previous_hash="0" * 64, staker_signature="staker10:signature",
+                      nbits=None, transactions=transactions, shard_data=shard_data, version=version)
+    block.tx_root = block.calculate_tx_root()
+    return block
+
+
+def test_version_2_root_commits_to_the_shard_roots():
+    shard_transactions = [make_transactions(3, "alice"), make_transactions(1, "carol"), make_transactions(4, "dave")]
+    block = make_block(shard_transactions)
+
+    assert block.tx_root == TransactionManager.calculate_merkle_root_from_hashes(
+        [TransactionManager.calculate_merkle_root(transactions) for transactions in shard_transactions])
+    assert block.verify_transactions()
+
+
+def test_version_2_blocks_reject_transactions_moved_between_shards():
+    shard_transactions = [make_transactions(3, "alice"), make_transactions(2, "carol")]
+    block = make_block(shard_transactions)
+    block.transactions = block.transactions[1:] + block.transactions[:1]
+    assert not block.verify_transactions()
+
+    block = make_block(shard_transactions)
+    block.transactions = block.transactions[:-1]
+    assert not block.verify_transactions()
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_every_transaction_proves_against_the_tx_root(version):
+    block = make_block([make_transactions(3, "alice"), make_transactions(1, "carol"), make_transactions(5, "dave")], version=version)
+    assert block.verify_transactions()
+    for tx_index, tx in enumerate(block.transactions):
+        proof = block.get_transaction_proof(tx_index)
+        assert TransactionManager.verify_merkle_proof(tx.calculate_hash(), proof, block.tx_root)
+    with pytest.raises(IndexError):
+        block.get_transaction_proof(len(block.transactions))
+
+
+def test_version_1_hashes_are_unchanged():
+    block = make_block([make_transactions(2)], version=1)
+    block_data = block.to_dict()
+    del block_data["version"]
+    assert MainBlock.from_dict(block_data).compute_hash() == block.compute_hash()
+    assert make_block([make_transactions(2)], version=2).compute_hash() != block.compute_hash()
@@ -0,0 +1,86 @@
+import random
+import hashlib
+import pytest
+from blockchain.blockchain import Blockchain
+from blockchain.shard_staker import ShardStaker
+from blockchain.stake_index import StakeIndex
+from transaction.transaction_manager import TransactionManager
+
+
+def select_linear(stakes: dict, previous_block_hash: str):
+    """
+    The staker selection before the stake index: a cumulative walk over the sorted stakers.
+    """
+    sorted_stakers = sorted(stakes.keys())
+    combined_hash = hashlib.sha256((previous_block_hash + "".join(sorted_stakers)).encode()).hexdigest()
+    hash_number = int(combined_hash, 16)
+    total_stake = sum(stakes.values())
+    cumulative_weight = 0
+    for staker in sorted_stakers:
+        cumulative_weight += stakes[staker]
+        if hash_number % total_stake < cumulative_weight:
+            return staker
+
+
+def random_hash(rng: random.Random) -> str:
+    return "%064x" % rng.getrandbits(256)
+
+
+def test_selection_matches_the_linear_scan():
+    rng = random.Random(7)
+    for _ in range(50):
+        # Zero stakes and a single staker are included
+        stakes = {f"staker{number}": rng.choice([0, 1, 5, rng.randint(1, 10 ** 6)]) for number in range(rng.randint(1, 40))}
+        if sum(stakes.values()) == 0:
+            stakes["staker0"] = 1
+        stake_index = StakeIndex(stakes)
+        for _ in range(20):
+            previous_block_hash = random_hash(rng)
+            assert stake_index.select(previous_block_hash) == select_linear(stakes, previous_block_hash)
+
+
+def test_selection_matches_the_linear_scan_after_updates():
+    rng = random.Random(11)
+    stakes = {f"staker{number}0": rng.randint(1, 1000) for number in range(1, 8)}
+    stake_index = StakeIndex(stakes)
+    for _ in range(200):
+        staker_id = f"staker{rng.randint(1, 12)}0"
+        amount = rng.randint(-stakes.get(staker_id, 0), 500)
+        stake_index.add_stake(staker_id, amount)
+        stakes[staker_id] = stakes.get(staker_id, 0) + amount
+        if sum(stakes.values()) == 0:
+            continue
+        previous_block_hash = random_hash(rng)
+        assert stake_index.get_total_stake() == sum(stakes.values())
+        assert stake_index.select(previous_block_hash) == select_linear(stakes, previous_block_hash)
+
+
+def test_find_walks_the_cumulative_stakes():
+    stake_index = StakeIndex({"a": 2, "b": 0, "c": 3})
+    assert [stake_index.find(target) for target in range(5)] == ["a", "a", "c", "c", "c"]
+    assert stake_index.find(-1) is None
+    assert stake_index.find(5) is None
+
+
+@pytest.mark.parametrize("amount", [-1, 1.5, True, "10"])
+def test_invalid_stakes_are_rejected(amount):
+    stake_index = StakeIndex({"a": 1})
+    with pytest.raises(ValueError):
+        stake_index.set_stake("a", amount)
+    assert stake_index.get_stake("a") == 1
+
+
+def test_shard_staker_selects_like_the_linear_scan():
+    stakes = {"staker10": 110, "staker20": 120, "staker30": 130}
+    blockchain = Blockchain()
+    shard_staker = ShardStaker(transaction_manager=TransactionManager([], 1), blockchain=blockchain, node_name="staker10")
+    shard_staker.initialize_stakes(dict(stakes))
+    shard_staker.add_stake("staker40", 50)
+    stakes["staker40"] = 50
+
+    for _ in range(10):
+        selected_staker, epoch = shard_staker.select_staker()
+        previous_block = blockchain.get_last_block()
+        assert selected_staker == select_linear(stakes, previous_block.compute_hash())
+        assert epoch == previous_block.index + 1
+        blockchain.add_block(blockchain.create_block(staker_signature=shard_staker.staker_signature, tx_root=""))
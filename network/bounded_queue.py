@@ -0,0 +1,84 @@
+import asyncio
+import logging
+
+
+class BoundedQueue:
+    """
+    An asyncio queue with a maximum size and a policy for messages arriving when it is full:
+        block        wait for space, which holds back the messages of this type from the sender's connection and
+                     eventually stops reading from it (backpressure)
+        drop         discard the new message
+        drop_oldest  discard the oldest queued message to make room for the new one
+
+    reference: https://docs.python.org/3/library/asyncio-queue.html
+    """
+    POLICIES = ("block", "drop", "drop_oldest")
+
+    def __init__(self, name: str, maxsize: int = 1024, policy: str = "block"):
+        """
+        Initialize a bounded queue.
+        :param name: The name of the queue, used in logs and statistics.
+        :param maxsize: The maximum number of queued messages.
+        :param policy: The overflow policy, one of POLICIES.
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}', expected one of {list(self.POLICIES)}.")
+        self.name = name
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.high_water = 0
+        self.dropped = 0
+        self.blocked = 0
+
+    async def put(self, item) -> bool:
+        """
+        Add a message to the queue, applying the overflow policy if the queue is full.
+        :param item: The message to add.
+        :return: True if the message was queued, False if it was dropped.
+        """
+        if self.queue.full():
+            if self.policy == "drop":
+                self.record_drop()
+                return False
+            if self.policy == "drop_oldest":
+                self.queue.get_nowait()
+                self.record_drop()
+            else:
+                self.blocked += 1
+
+        await self.queue.put(item)
+        self.high_water = max(self.high_water, self.queue.qsize())
+        return True
+
+    def record_drop(self):
+        """
+        Count a dropped message, logging the first drop and every thousandth after it.
+        """
+        self.dropped += 1
+        if self.dropped % 1000 == 1:
+            logging.warning(f"Queue {self.name} full, {self.dropped} message(s) dropped so far.")
+
+    async def get(self):
+        """
+        Remove and return the next message, waiting until one is available.
+        """
+        return await self.queue.get()
+
+    def qsize(self) -> int:
+        """
+        Get the number of queued messages.
+        """
+        return self.queue.qsize()
+
+    def get_stats(self) -> dict:
+        """
+        Get the queue size, high-water mark and overflow counters.
+        """
+        return {
+            "size": self.queue.qsize(),
+            "maxsize": self.queue.maxsize,
+            "policy": self.policy,
+            "high_water": self.high_water,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+        }
@@ -0,0 +1,271 @@
+import struct
+from network.message import Message
+
+try:
+    import msgpack  # Optional C-accelerated implementation of the same format
+except ImportError:
+    msgpack = None
+
+
+class MsgPack:
+    """
+    Pure Python encoder and decoder for the subset of MessagePack used by messages:
+    nil, booleans, integers, floats, strings, binary, arrays and maps.
+
+    reference: https://github.com/msgpack/msgpack/blob/master/spec.md
+    """
+
+    @classmethod
+    def pack(cls, obj) -> bytes:
+        """
+        Encode an object.
+        """
+        chunks = []
+        cls.pack_into(obj, chunks)
+        return b"".join(chunks)
+
+    @classmethod
+    def pack_into(cls, obj, chunks: list):
+        """
+        Encode an object, appending the encoded chunks to a list.
+        """
+        if obj is None:
+            chunks.append(b"\xc0")
+        elif obj is True:
+            chunks.append(b"\xc3")
+        elif obj is False:
+            chunks.append(b"\xc2")
+        elif isinstance(obj, int):
+            chunks.append(cls.pack_int(obj))
+        elif isinstance(obj, float):
+            chunks.append(struct.pack(">Bd", 0xcb, obj))
+        elif isinstance(obj, str):
+            data = obj.encode("utf-8")
+            chunks.append(cls.pack_length(len(data), 0xa0, 31, 0xd9, 0xda, 0xdb))
+            chunks.append(data)
+        elif isinstance(obj, (bytes, bytearray)):
+            chunks.append(cls.pack_length(len(obj), None, 0, 0xc4, 0xc5, 0xc6))
+            chunks.append(bytes(obj))
+        elif isinstance(obj, (list, tuple)):
+            chunks.append(cls.pack_length(len(obj), 0x90, 15, None, 0xdc, 0xdd))
+            for item in obj:
+                cls.pack_into(item, chunks)
+        elif isinstance(obj, dict):
+            chunks.append(cls.pack_length(len(obj), 0x80, 15, None, 0xde, 0xdf))
+            for key, value in obj.items():
+                cls.pack_into(key, chunks)
+                cls.pack_into(value, chunks)
+        else:
+            raise TypeError(f"Cannot encode object of type {type(obj).__name__}")
+
+    @staticmethod
+    def pack_int(value: int) -> bytes:
+        """
+        Encode an integer in the smallest format that holds it.
+        """
+        if 0 <= value < 0x80:
+            return struct.pack("B", value)
+        if -0x20 <= value < 0:
+            return struct.pack("b", value)
+        if value >= 0:
+            for code, fmt, limit in ((0xcc, ">BB", 0xff), (0xcd, ">BH", 0xffff), (0xce, ">BI", 0xffffffff), (0xcf, ">BQ", 0xffffffffffffffff)):
+                if value <= limit:
+                    return struct.pack(fmt, code, value)
+        else:
+            for code, fmt, limit in ((0xd0, ">Bb", 0x80), (0xd1, ">Bh", 0x8000), (0xd2, ">Bi", 0x80000000), (0xd3, ">Bq", 0x8000000000000000)):
+                if value >= -limit:
+                    return struct.pack(fmt, code, value)
+        raise OverflowError(f"Integer {value} does not fit in 64 bits")
+
+    @staticmethod
+    def pack_length(length: int, fix_code, fix_limit: int, code8, code16: int, code32: int) -> bytes:
+        """
+        Encode the header of a string, binary, array or map of the given length.
+        """
+        if fix_code is not None and length <= fix_limit:
+            return struct.pack("B", fix_code | length)
+        if code8 is not None and length <= 0xff:
+            return struct.pack(">BB", code8, length)
+        if length <= 0xffff:
+            return struct.pack(">BH", code16, length)
+        return struct.pack(">BI", code32, length)
+
+    @classmethod
+    def unpack(cls, data: bytes):
+        """
+        Decode an object.
+        """
+        obj, offset = cls.unpack_from(memoryview(data), 0)
+        if offset != len(data):
+            raise ValueError(f"{len(data) - offset} trailing bytes after the encoded object")
+        return obj
+
+    @classmethod
+    def unpack_from(cls, data: memoryview, offset: int):
+        """
+        Decode the object starting at an offset.
+        :return: A tuple of the object and the offset following it.
+        """
+        code = data[offset]
+        offset += 1
+        if code < 0x80:
+            return code, offset
+        if code >= 0xe0:
+            return code - 0x100, offset
+        if 0xa0 <= code <= 0xbf:
+            return cls.unpack_str(data, offset, code & 0x1f)
+        if 0x90 <= code <= 0x9f:
+            return cls.unpack_array(data, offset, code & 0x0f)
+        if 0x80 <= code <= 0x8f:
+            return cls.unpack_map(data, offset, code & 0x0f)
+        if code == 0xc0:
+            return None, offset
+        if code == 0xc2:
+            return False, offset
+        if code == 0xc3:
+            return True, offset
+        if code in cls.SCALARS:
+            value_format = cls.SCALARS[code]
+            return struct.unpack_from(value_format, data, offset)[0], offset + struct.calcsize(value_format)
+        if code in cls.LENGTHS:
+            kind, length_format = cls.LENGTHS[code]
+            length = struct.unpack_from(length_format, data, offset)[0]
+            offset += struct.calcsize(length_format)
+            if kind == "str":
+                return cls.unpack_str(data, offset, length)
+            if kind == "bin":
+                return bytes(data[offset:offset + length]), offset + length
+            if kind == "array":
+                return cls.unpack_array(data, offset, length)
+            return cls.unpack_map(data, offset, length)
+        raise ValueError(f"Unsupported MessagePack type code 0x{code:02x}")
+
+    @staticmethod
+    def unpack_str(data: memoryview, offset: int, length: int):
+        """
+        Decode a UTF-8 string of the given length.
+        """
+        return str(data[offset:offset + length], "utf-8"), offset + length
+
+    @classmethod
+    def unpack_array(cls, data: memoryview, offset: int, length: int):
+        """
+        Decode an array of the given length.
+        """
+        items = []
+        for _ in range(length):
+            item, offset = cls.unpack_from(data, offset)
+            items.append(item)
+        return items, offset
+
+    @classmethod
+    def unpack_map(cls, data: memoryview, offset: int, length: int):
+        """
+        Decode a map of the given length.
+        Keys must be strings or binary, as with the msgpack package's default strict_map_key, so both
+        implementations accept the same messages.
+        """
+        items = {}
+        for _ in range(length):
+            key, offset = cls.unpack_from(data, offset)
+            if not isinstance(key, (str, bytes)):
+                raise ValueError(f"Map key of type {type(key).__name__} is not allowed")
+            value, offset = cls.unpack_from(data, offset)
+            items[key] = value
+        return items, offset
+
+    SCALARS = {
+        0xca: ">f", 0xcb: ">d",
+        0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q",
+        0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q",
+    }
+    LENGTHS = {
+        0xd9: ("str", ">B"), 0xda: ("str", ">H"), 0xdb: ("str", ">I"),
+        0xc4: ("bin", ">B"), 0xc5: ("bin", ">H"), 0xc6: ("bin", ">I"),
+        0xdc: ("array", ">H"), 0xdd: ("array", ">I"),
+        0xde: ("map", ">H"), 0xdf: ("map", ">I"),
+    }
+
+
+class WireCodec:
+    """
+    Message encodings that peers can negotiate during the handshake.
+    The codec ID is carried in the high 4 bits of the frame flags, 0 meaning JSON. HELLO frames are always JSON.
+    The msgpack codec uses the msgpack package when it is installed and the pure Python MsgPack otherwise;
+    both produce the same bytes, so peers can mix them.
+    """
+    CODECS = {"json": 0, "msgpack": 1}
+    CODEC_NAMES = {codec_id: codec for codec, codec_id in CODECS.items()}
+    FLAG_SHIFT = 4
+
+    @classmethod
+    def get_default_codecs(cls) -> list:
+        """
+        Get the codecs offered when none are configured, in order of preference.
+        The pure Python msgpack encoder is more compact but slower than the stdlib JSON module, so msgpack is
+        only preferred when the C extension is installed.
+        """
+        return ["msgpack", "json"] if msgpack is not None else ["json", "msgpack"]
+
+    @classmethod
+    def negotiate(cls, offered_codecs: list, supported_codecs: list) -> str:
+        """
+        Choose the first offered codec that is also supported locally.
+        :param offered_codecs: The codecs offered by the peer, in order of preference.
+        :param supported_codecs: The codecs enabled on this node.
+        :return: The chosen codec name, "json" if there is no common codec.
+        """
+        for codec in offered_codecs:
+            if codec in cls.CODECS and codec in supported_codecs:
+                return codec
+        return "json"
+
+    @classmethod
+    def get_flags(cls, codec: str) -> int:
+        """
+        Get the frame flag bits announcing a codec.
+        """
+        return cls.CODECS[codec] << cls.FLAG_SHIFT
+
+    @classmethod
+    def get_codec(cls, flags: int) -> str:
+        """
+        Get the codec announced in the frame flags.
+        """
+        codec = cls.CODEC_NAMES.get(flags >> cls.FLAG_SHIFT)
+        if codec is None:
+            raise ValueError(f"Unknown wire codec ID {flags >> cls.FLAG_SHIFT}")
+        return codec
+
+    @classmethod
+    def encode(cls, codec: str, message: Message) -> bytes:
+        """
+        Encode a message, reusing the encoding cached on the message for the same codec.
+        :param codec: The codec name.
+        :param message: The Message to encode.
+        """
+        payload = message.encoded_payloads.get(codec)
+        if payload is None:
+            if codec == "msgpack":
+                payload = msgpack.packb(message.to_dict(), use_bin_type=True) if msgpack is not None else MsgPack.pack(message.to_dict())
+            else:
+                payload = message.to_json().encode()
+            message.encoded_payloads[codec] = payload
+        return payload
+
+    @classmethod
+    def decode(cls, codec: str, data: bytes) -> Message:
+        """
+        Decode a message.
+        :param codec: The codec name.
+        :param data: The encoded message.
+        """
+        if codec == "msgpack":
+            if msgpack is not None:
+                data = msgpack.unpackb(data, raw=False)
+            else:
+                data = MsgPack.unpack(data)
+            if not isinstance(data, dict):
+                raise ValueError("Decoded message is not a dictionary")
+            return Message.from_dict(data)
+        return Message.from_json(data)
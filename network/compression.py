@@ -0,0 +1,80 @@
+import bz2
+import lzma
+import zlib
+from network.framing import FrameError
+
+
+class Compression:
+    """
+    Payload compression codecs that peers can negotiate during the handshake.
+    The codec ID is carried in the low 4 bits of the frame flags, 0 meaning an uncompressed payload.
+
+    references:
+        https://docs.python.org/3/library/zlib.html
+        https://docs.python.org/3/library/lzma.html
+        https://docs.python.org/3/library/bz2.html
+    """
+    CODECS = {"none": 0, "zlib": 1, "bz2": 2, "lzma": 3}
+    CODEC_NAMES = {codec_id: codec for codec, codec_id in CODECS.items()}
+    FLAG_MASK = 0x0F
+
+    @classmethod
+    def negotiate(cls, offered_codecs: list, supported_codecs: list) -> str:
+        """
+        Choose the first offered codec that is also supported locally.
+        :param offered_codecs: The codecs offered by the peer, in order of preference.
+        :param supported_codecs: The codecs enabled on this node.
+        :return: The chosen codec name, "none" if there is no common codec.
+        """
+        for codec in offered_codecs:
+            if codec in cls.CODECS and codec in supported_codecs:
+                return codec
+        return "none"
+
+    @classmethod
+    def compress(cls, codec: str, data: bytes, level: int = 6) -> bytes:
+        """
+        Compress a payload.
+        :param codec: The codec name.
+        :param data: The payload bytes.
+        :param level: The compression level.
+        """
+        if codec == "zlib":
+            return zlib.compress(data, level)
+        if codec == "bz2":
+            return bz2.compress(data, compresslevel=max(1, min(level, 9)))
+        if codec == "lzma":
+            return lzma.compress(data, preset=min(level, 9))
+        return data
+
+    @classmethod
+    def decompress(cls, flags: int, data: bytes, max_size: int = None) -> bytes:
+        """
+        Decompress a payload according to the codec ID in the frame flags.
+        The output is decompressed incrementally and never beyond `max_size` + 1 bytes, so a small frame cannot
+        expand into an arbitrarily large payload.
+        :param flags: The frame flags.
+        :param data: The (possibly compressed) payload bytes.
+        :param max_size: The maximum size of the decompressed payload, unlimited if None.
+        :raises FrameError: If the payload exceeds `max_size`, is truncated or is corrupted.
+        """
+        codec = cls.CODEC_NAMES.get(flags & cls.FLAG_MASK)
+        if codec is None:
+            raise ValueError(f"Unknown compression codec ID {flags & cls.FLAG_MASK}")
+        if codec == "none":
+            return data
+
+        try:
+            if codec == "zlib":
+                decompressor = zlib.decompressobj()
+                payload = decompressor.decompress(data, max_size + 1 if max_size is not None else 0)
+            else:
+                decompressor = bz2.BZ2Decompressor() if codec == "bz2" else lzma.LZMADecompressor()
+                payload = decompressor.decompress(data, max_length=max_size + 1 if max_size is not None else -1)
+        except (zlib.error, lzma.LZMAError, OSError, EOFError) as e:
+            raise FrameError(f"Corrupted {codec} payload: {e}")
+        if max_size is not None and len(payload) > max_size:
+            raise FrameError(f"Decompressed payload exceeds the maximum size of {max_size} bytes")
+        if not decompressor.eof:
+            raise FrameError(f"Truncated {codec} payload")
+        return payload
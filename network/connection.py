@@ -0,0 +1,91 @@
+import asyncio
+from network.compression import Compression
+
+
+class PeerConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, codec: str = "none", threshold: int = 1024, level: int = 6,
+                 identity: str = None, dialer: str = None, wire_codec: str = "json"):
+        """
+        Initialize a connection to a peer with its negotiated payload compression.
+        :param reader: The StreamReader object.
+        :param writer: The StreamWriter object.
+        :param codec: The compression codec negotiated for frames sent on this connection.
+        :param threshold: Payloads smaller than this many bytes are sent uncompressed.
+        :param level: The compression level.
+        :param identity: The identity ("host:port") of the remote peer, known after the handshake.
+        :param dialer: The identity of the peer that opened the connection.
+        :param wire_codec: The message encoding negotiated for frames sent on this connection.
+        """
+        self.reader = reader
+        self.writer = writer
+        self.identity = identity
+        self.dialer = dialer
+        self.wire_codec = wire_codec
+        self.closed = asyncio.Event()
+        self.codec = codec
+        self.threshold = threshold
+        self.level = level
+        self.inbound_lanes = {}  # content type -> (asyncio.Queue of incoming messages, handler task)
+        self.inbound_bytes = 0   # Payload bytes read but not handled yet, in the lanes of non-priority types
+        self.inbound_space = asyncio.Event()  # Set when a lane takes a message, freeing inbound buffer space
+        self.stats = {
+            "payload_bytes_out": 0,
+            "wire_bytes_out": 0,
+            "payload_bytes_in": 0,
+            "wire_bytes_in": 0,
+            "frames_out": 0,
+            "writes": 0,
+        }
+
+    def close(self):
+        """
+        Close the connection and wake up the tasks waiting for it to close.
+        """
+        if not self.closed.is_set():
+            self.closed.set()
+            self.writer.close()
+
+    def compress_payload(self, payload: bytes):
+        """
+        Compress an outgoing payload if it is above the threshold and compression pays off.
+        :param payload: The payload bytes.
+        :return: A tuple of the payload to send and the frame flags.
+        """
+        wire_payload, flags = payload, 0
+        if self.codec != "none" and len(payload) >= self.threshold:
+            compressed_payload = Compression.compress(self.codec, payload, self.level)
+            if len(compressed_payload) < len(payload):
+                wire_payload, flags = compressed_payload, Compression.CODECS[self.codec]
+
+        self.record_payload_out(len(payload), len(wire_payload))
+        return wire_payload, flags
+
+    def record_payload_out(self, payload_size: int, wire_size: int):
+        """
+        Count an outgoing payload, also for frames reused from a cache.
+        """
+        self.stats["payload_bytes_out"] += payload_size
+        self.stats["wire_bytes_out"] += wire_size
+
+    def decompress_payload(self, wire_payload: bytes, flags: int, max_size: int = None) -> bytes:
+        """
+        Decompress an incoming payload.
+        :param wire_payload: The payload bytes as received.
+        :param flags: The frame flags.
+        :param max_size: The maximum size of the decompressed payload, see Compression.decompress().
+        """
+        payload = Compression.decompress(flags, wire_payload, max_size=max_size)
+        self.stats["payload_bytes_in"] += len(payload)
+        self.stats["wire_bytes_in"] += len(wire_payload)
+        return payload
+
+    def get_compression_stats(self) -> dict:
+        """
+        Get the payload and wire byte counters and the compression ratios (payload / wire) in both directions.
+        """
+        stats = dict(self.stats)
+        stats["codec"] = self.codec
+        stats["wire_codec"] = self.wire_codec
+        stats["ratio_out"] = stats["payload_bytes_out"] / stats["wire_bytes_out"] if stats["wire_bytes_out"] else 1.0
+        stats["ratio_in"] = stats["payload_bytes_in"] / stats["wire_bytes_in"] if stats["wire_bytes_in"] else 1.0
+        return stats
@@ -0,0 +1,523 @@
+import random
+import asyncio
+import logging
+from collections import deque
+from network.message import Message
+from network.peer import Peer
+from network.framing import Frame, FrameError
+from network.compression import Compression
+from network.codec import WireCodec
+from network.connection import PeerConnection
+from network.transport import TcpTransport
+
+
+class ConnectionManager:
+    def __init__(self, host, network_config: dict, transport=None):
+        """
+        Initialize the pool of persistent, bidirectional peer connections.
+        Every peer identity ("host:port") has at most one connection, used in both directions. When both peers
+        dial each other, the connection dialed by the peer with the smaller identity is kept on both sides.
+        Dropped connections are redialed with jittered exponential backoff. Every peer has a bounded outbound
+        queue drained by a single writer task, which keeps messages in order, holds them while the peer is
+        unreachable and coalesces queued frames into one write per drain.
+        :param host: The Host receiving the messages read from the connections.
+        :param network_config: The network configuration.
+        :param transport: Optional transport opening and accepting connections, by default a TcpTransport
+                          with the profile of network_config.transport.
+        """
+        self.host = host
+        self.transport = transport if transport is not None else TcpTransport(network_config.get("transport"))
+        self.peer_manager = host.peer_manager
+        self.max_frame_size = network_config.get("max_frame_size", 16 * 1024 * 1024)
+        self.handshake_timeout = network_config.get("handshake_timeout", 5)
+
+        compression_config = network_config.get("compression", {})
+        self.compression_codecs = compression_config.get("codecs", ["zlib"])
+        self.compression_threshold = compression_config.get("threshold", 1024)
+        self.compression_level = compression_config.get("level", 6)
+        self.wire_codecs = network_config.get("wire_codecs", WireCodec.get_default_codecs())
+
+        reconnect_config = network_config.get("reconnect", {})
+        self.base_delay = reconnect_config.get("base_delay", 0.5)
+        self.max_delay = reconnect_config.get("max_delay", 30)
+        self.jitter = reconnect_config.get("jitter", 0.5)
+        self.connect_timeout = reconnect_config.get("connect_timeout", 15)
+        self.send_buffer_size = network_config.get("send_buffer_size", 256)
+        # Peers learned at runtime, e.g. from incoming connections, are forgotten after this many failed dials
+        self.max_dial_failures = network_config.get("discovery", {}).get("max_dial_failures", 5)
+
+        outbound_config = network_config.get("outbound", {})
+        self.flush_latency = outbound_config.get("flush_latency", 0.001)
+        self.batch_size = outbound_config.get("batch_size", 64)
+
+        inbound_config = network_config.get("inbound", {})
+        self.inbound_buffer_size = inbound_config.get("buffer_size", 8 * 1024 * 1024)
+        self.priority_types = set(inbound_config.get("priority_types", Frame.PRIORITY_TYPES))
+
+        self.connections = {}        # peer identity -> PeerConnection
+        self.outbound_queues = {}    # peer identity -> deque of (content_type, Message) waiting to be written
+        self.outbound_events = {}    # peer identity -> Event set while the outbound queue is not empty
+        self.outbound_space_events = {}  # peer identity -> Event set when the writer makes room in a full queue
+        self.connected_events = {}   # peer identity -> Event set while the peer is connected
+        self.dial_tasks = {}         # peer identity -> connection maintenance task
+        self.writer_tasks = {}       # peer identity -> outbound writer task
+        self.dropped_messages = 0
+
+    def get_identity(self) -> str:
+        """
+        Get the identity of this node.
+        """
+        return str(self.peer_manager.this_peer)
+
+    async def connect_to_peers(self):
+        """
+        Dial all peers concurrently and keep the connections alive.
+        Waits until every peer is connected, or until the connect timeout elapses.
+        """
+        for peer in self.peer_manager.get_peers():
+            self.maintain_connection(peer)
+
+        waiters = [asyncio.create_task(self.get_connected_event(str(peer)).wait()) for peer in self.peer_manager.get_peers()]
+        if waiters:
+            _, pending = await asyncio.wait(waiters, timeout=self.connect_timeout)
+            for waiter in pending:
+                waiter.cancel()
+            if pending:
+                logging.warning(f"{len(pending)} peer(s) not connected yet, reconnecting in the background.")
+
+    def maintain_connection(self, peer: Peer, max_failures: int = None):
+        """
+        Start the maintenance task of a peer, if it is not running yet.
+        :param peer: The peer to keep connected.
+        :param max_failures: Optional number of consecutive failed dials after which the peer is given up and
+                             removed from the peer table, e.g. for peers learned from other peers.
+        """
+        identity = str(peer)
+        if identity not in self.dial_tasks:
+            self.dial_tasks[identity] = asyncio.create_task(self.dial_peer(peer, max_failures))
+
+    def forget_peer(self, peer: Peer):
+        """
+        Stop dialing a peer, drop its queued messages and remove it from the peer table.
+        :param peer: The peer to forget.
+        """
+        identity = str(peer)
+        self.dial_tasks.pop(identity, None)
+        writer_task = self.writer_tasks.pop(identity, None)
+        if writer_task is not None:
+            writer_task.cancel()
+        outbound_queue = self.outbound_queues.pop(identity, None)
+        if outbound_queue:
+            self.record_dropped(identity, len(outbound_queue))
+        self.outbound_events.pop(identity, None)
+        self.outbound_space_events.pop(identity, None)
+        self.peer_manager.remove_peer(peer)
+
+    def get_connected_event(self, identity: str) -> asyncio.Event:
+        """
+        Get the event that is set while a peer is connected.
+        """
+        if identity not in self.connected_events:
+            self.connected_events[identity] = asyncio.Event()
+        return self.connected_events[identity]
+
+    async def dial_peer(self, peer: Peer, max_failures: int = None):
+        """
+        Keep a connection to the peer open, redialing with jittered exponential backoff after failures.
+        The peer with the larger identity waits briefly before dialing, so the connection dialed by the
+        smaller identity is usually the only one opened.
+        :param peer: The peer to dial.
+        :param max_failures: Optional number of consecutive failed dials after which the peer is forgotten.
+        """
+        identity = str(peer)
+        delay = self.base_delay
+        failures = 0
+        if identity < self.get_identity():
+            await asyncio.sleep(self.base_delay)
+
+        while True:
+            connection = self.connections.get(identity)
+            if connection is not None:
+                await connection.closed.wait()
+                self.unregister_connection(connection)
+                delay = self.base_delay
+                continue
+
+            try:
+                reader, writer = await self.transport.open_connection(peer.get_hostname(), int(peer.get_port()))
+                connection = await self.perform_handshake(identity, reader, writer)
+                if self.register_connection(connection):
+                    logging.info(f"Connected to peer {peer} (compression: {connection.codec})")
+                    asyncio.create_task(self.read_frames(connection))
+                delay = self.base_delay
+                failures = 0
+            except Exception as e:
+                failures += 1
+                if max_failures is not None and failures >= max_failures and not self.is_connected(identity):
+                    logging.warning(f"Giving up on {peer} after {failures} failed dial(s): {e}")
+                    self.forget_peer(peer)
+                    return
+                sleep_time = delay * (1 + random.uniform(-self.jitter, self.jitter))
+                logging.warning(f"Failed to connect to {peer}, retrying in {sleep_time:.1f} seconds: {e}")
+                await asyncio.sleep(sleep_time)
+                delay = min(delay * 2, self.max_delay)
+
+    async def perform_handshake(self, identity: str, reader, writer) -> PeerConnection:
+        """
+        Offer the local compression and wire codecs to the accepting peer and wait for its choice.
+        :param identity: The identity of the dialed peer.
+        :param reader: The StreamReader object.
+        :param writer: The StreamWriter object.
+        :return: The PeerConnection, compressing frames with the negotiated codec.
+        """
+        hello = Message.generate_hello_message(content={
+            "peer": self.get_identity(),
+            "codecs": self.compression_codecs,
+            "threshold": self.compression_threshold,
+            "wire_codecs": self.wire_codecs
+        }, node_name=self.peer_manager.this_peer.get_hostname())
+        writer.write(Frame.encode(hello))
+        await writer.drain()
+
+        frame = await asyncio.wait_for(Frame.read(reader, self.max_frame_size), timeout=self.handshake_timeout)
+        if frame is None or frame.content_type != "HELLO":
+            writer.close()
+            raise ConnectionError("Handshake rejected")
+
+        reply = Message.from_json(frame.payload).get_content()
+        codec = reply.get("codec") if reply.get("codec") in self.compression_codecs else "none"
+        threshold = reply.get("threshold", self.compression_threshold)
+        wire_codec = reply.get("wire_codec") if reply.get("wire_codec") in self.wire_codecs else "json"
+        return PeerConnection(reader, writer, codec=codec, threshold=threshold, level=self.compression_level,
+                              identity=identity, dialer=self.get_identity(), wire_codec=wire_codec)
+
+    async def answer_handshake(self, connection: PeerConnection, frame: Frame):
+        """
+        Identify a connecting peer, choose the compression and wire codecs from the ones it offered and send the choice back.
+        :param connection: The incoming PeerConnection.
+        :param frame: The HELLO frame received from the peer.
+        """
+        offer = Message.from_json(frame.payload).get_content()
+        if not offer.get("peer"):
+            raise FrameError("HELLO frame without a peer identity")
+        connection.identity = offer.get("peer")
+        connection.dialer = connection.identity
+        connection.codec = Compression.negotiate(offer.get("codecs", []), self.compression_codecs)
+        connection.threshold = max(offer.get("threshold", 0), self.compression_threshold)
+        connection.wire_codec = WireCodec.negotiate(offer.get("wire_codecs", []), self.wire_codecs)
+        reply = Message.generate_hello_message(content={
+            "peer": self.get_identity(),
+            "codec": connection.codec,
+            "threshold": connection.threshold,
+            "wire_codec": connection.wire_codec
+        }, node_name=self.peer_manager.this_peer.get_hostname())
+        connection.writer.write(Frame.encode(reply))
+        await connection.writer.drain()
+
+    def register_connection(self, connection: PeerConnection) -> bool:
+        """
+        Register a handshaked connection, deduplicating links to the same peer.
+        Of two connections to a peer dialed by both sides, the one dialed by the smaller identity wins on both sides.
+        A new connection from the same dialer replaces the old one, which may be half-open, e.g. after a restart.
+        :param connection: The new connection.
+        :return: True if the connection was kept, False if it was closed as a duplicate.
+        """
+        identity = connection.identity
+        existing_connection = self.connections.get(identity)
+        if existing_connection is not None and not existing_connection.closed.is_set():
+            if existing_connection.dialer < connection.dialer:
+                connection.close()
+                return False
+            existing_connection.close()
+
+        self.connections[identity] = connection
+        self.get_connected_event(identity).set()
+        self.peer_manager.set_alive(identity, True)
+        self.get_outbound_queue(identity)
+        return True
+
+    def unregister_connection(self, connection: PeerConnection):
+        """
+        Forget a closed connection.
+        :param connection: The closed connection.
+        """
+        connection.close()
+        if self.connections.get(connection.identity) is connection:
+            del self.connections[connection.identity]
+            self.get_connected_event(connection.identity).clear()
+            self.peer_manager.set_alive(connection.identity, False)
+            if connection.identity in self.outbound_space_events:
+                # Senders waiting for room fall back to dropping the oldest message while disconnected
+                self.outbound_space_events[connection.identity].set()
+
+    async def listen_for_connections(self):
+        """
+        Listen for incoming connections on the local address.
+        """
+        server = await self.transport.start_server(self.handle_incoming_connection, "0.0.0.0", int(self.peer_manager.this_peer.port))
+        logging.info(f"Listening for incoming connections at {self.peer_manager.this_peer}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_incoming_connection(self, reader, writer):
+        """
+        Handle an incoming connection: identify the peer through its HELLO frame, then read its frames.
+        :param reader: The StreamReader object.
+        :param writer: The StreamWriter object.
+        reference: https://docs.python.org/3/library/asyncio-stream.html#asyncio.StreamReader
+        """
+        peer_address = writer.get_extra_info("peername")
+        connection = PeerConnection(reader, writer)
+        try:
+            frame = await asyncio.wait_for(Frame.read(reader, self.max_frame_size), timeout=self.handshake_timeout)
+            if frame is None or frame.content_type != "HELLO":
+                raise FrameError("Expected a HELLO frame")
+            await self.answer_handshake(connection, frame)
+        except Exception as e:
+            logging.warning(f"Handshake with {peer_address} failed: {e}")
+            connection.close()
+            return
+
+        if self.register_connection(connection):
+            # Learn the peer and redial it if the connection drops later. Only configured peers are redialed
+            # indefinitely, and a full peer table learns no more peers from claimed identities.
+            peer = Peer(*connection.identity.rsplit(":", 1))
+            if self.peer_manager.add_peer(peer):
+                self.peer_manager.set_alive(connection.identity, True)
+                self.maintain_connection(peer, max_failures=self.max_dial_failures)
+            await self.read_frames(connection)
+
+    async def read_frames(self, connection: PeerConnection):
+        """
+        Read frames from a connection and queue the messages on the inbound lane of their content type until the
+        connection closes. The reader never waits for a message to be handled, only for room in a full lane.
+        :param connection: The connection to read from.
+        """
+        while True:
+            try:
+                frame = await Frame.read(connection.reader, self.max_frame_size)
+                if frame is None:
+                    logging.info(f"Connection closed by {connection.identity}")
+                    break
+                payload = connection.decompress_payload(frame.payload, frame.flags, max_size=self.max_frame_size)
+                wire_codec = WireCodec.get_codec(frame.flags)
+                self.host.metrics.record_in(connection.identity, frame.content_type, Frame.HEADER.size + len(frame.payload))
+                # While the lane of this type is full, the socket is not read and TCP flow control slows the sender
+                await self.queue_inbound(connection, frame.content_type, payload, wire_codec)
+            except FrameError as e:
+                # The stream cannot be resynchronized after a bad frame
+                logging.error(f"Invalid frame from {connection.identity}, closing connection: {e}")
+                break
+            except Exception as e:
+                if not connection.closed.is_set():
+                    logging.error(f"Error reading from {connection.identity}: {e}")
+                break
+        self.close_inbound_lanes(connection)
+        self.unregister_connection(connection)
+
+    async def queue_inbound(self, connection: PeerConnection, content_type: str, payload: bytes, wire_codec: str):
+        """
+        Queue an incoming message on the inbound lane of its content type, starting the lane on first use.
+        Every lane passes its messages to the Host in order from its own task, so a content type whose message
+        queue is full (policy "block") only holds back the messages of that type. The reader waits while the
+        messages buffered in the lanes exceed `buffer_size` bytes, which slows the sender through TCP flow control;
+        the priority types, small control and heartbeat messages, are not counted and never wait.
+        :param connection: The connection the message was read from.
+        :param content_type: The content type from the frame header.
+        :param payload: The decompressed message payload.
+        :param wire_codec: The encoding of the payload.
+        """
+        if content_type not in connection.inbound_lanes:
+            lane = asyncio.Queue()
+            connection.inbound_lanes[content_type] = (lane, asyncio.create_task(self.handle_inbound(connection, content_type, lane)))
+        lane, _ = connection.inbound_lanes[content_type]
+        if content_type not in self.priority_types:
+            while connection.inbound_bytes >= self.inbound_buffer_size:
+                connection.inbound_space.clear()
+                await connection.inbound_space.wait()
+            connection.inbound_bytes += len(payload)
+        lane.put_nowait((payload, wire_codec))
+
+    async def handle_inbound(self, connection: PeerConnection, content_type: str, lane: asyncio.Queue):
+        """
+        Pass the messages of an inbound lane to the Host in order, until the lane is closed.
+        :param connection: The connection the messages were read from.
+        :param content_type: The content type of the lane.
+        :param lane: The queue of (payload, wire codec) tuples, None once the connection is closed.
+        """
+        while True:
+            item = await lane.get()
+            if item is None:
+                break
+            payload, wire_codec = item
+            if content_type not in self.priority_types:
+                connection.inbound_bytes -= len(payload)
+                connection.inbound_space.set()
+            await self.host.handle_message(connection.identity, content_type, payload, wire_codec)
+
+    def close_inbound_lanes(self, connection: PeerConnection):
+        """
+        Stop the inbound lanes of a closed connection once they have handled the messages already read.
+        :param connection: The closed connection.
+        """
+        for lane, _ in connection.inbound_lanes.values():
+            lane.put_nowait(None)
+
+    async def send(self, identity: str, content_type: str, message: Message, wait: bool = True):
+        """
+        Queue a message for a peer. The peer's writer task sends it once the peer is connected.
+        While the peer is connected and its queue is full, waits for the writer to make room; while it is
+        disconnected, or if `wait` is False, the oldest queued message is dropped instead.
+        Handlers of incoming messages send their replies without waiting, so a peer that does not read
+        cannot hold up the handling of its own messages.
+        :param identity: The identity of the peer.
+        :param content_type: The content type of the message.
+        :param message: The Message, encoded by the writer task with the codec negotiated for the connection.
+        :param wait: Wait for room in a full queue while the peer is connected.
+        :return: True if the peer is connected, False if the message waits for a reconnection.
+        """
+        outbound_queue = self.get_outbound_queue(identity)
+        while wait and len(outbound_queue) == outbound_queue.maxlen and self.is_connected(identity):
+            self.outbound_space_events[identity].clear()
+            await self.outbound_space_events[identity].wait()
+        if len(outbound_queue) == outbound_queue.maxlen:
+            self.record_dropped(identity)
+        outbound_queue.append((content_type, message))
+        self.outbound_events[identity].set()
+        return self.is_connected(identity)
+
+    def record_dropped(self, identity: str, count: int = 1):
+        """
+        Count dropped outbound messages, logging the first drop and every hundredth after it.
+        :param identity: The identity of the peer.
+        :param count: The number of dropped messages.
+        """
+        previous_drops = self.dropped_messages
+        self.dropped_messages += count
+        if (previous_drops - 1) // 100 != (self.dropped_messages - 1) // 100:
+            logging.warning(f"Dropped outbound message(s) to {identity}, {self.dropped_messages} message(s) dropped so far.")
+
+    def requeue(self, identity: str, batch: list):
+        """
+        Put a batch that could not be sent back at the front of a peer's outbound queue, in order.
+        If the queue filled up meanwhile, the oldest messages of the batch are dropped and counted,
+        like messages queued while the peer is disconnected.
+        :param identity: The identity of the peer.
+        :param batch: The (content_type, Message) tuples taken from the front of the queue.
+        """
+        outbound_queue = self.outbound_queues[identity]
+        overflow = len(outbound_queue) + len(batch) - outbound_queue.maxlen
+        if overflow > 0:
+            self.record_dropped(identity, overflow)
+            batch = batch[overflow:]
+        outbound_queue.extendleft(reversed(batch))
+        self.outbound_events[identity].set()
+
+    def is_connected(self, identity: str) -> bool:
+        """
+        Check whether a peer has an open connection.
+        """
+        connection = self.connections.get(identity)
+        return connection is not None and not connection.closed.is_set()
+
+    def get_outbound_depths(self) -> dict:
+        """
+        Get the number of messages waiting in the outbound queue of every peer.
+        """
+        return {identity: len(outbound_queue) for identity, outbound_queue in list(self.outbound_queues.items())}
+
+    def get_outbound_queue(self, identity: str) -> deque:
+        """
+        Get the outbound queue of a peer, starting its writer task on first use.
+        """
+        if identity not in self.outbound_queues:
+            self.outbound_queues[identity] = deque(maxlen=self.send_buffer_size)
+            self.outbound_events[identity] = asyncio.Event()
+            self.outbound_space_events[identity] = asyncio.Event()
+            self.writer_tasks[identity] = asyncio.create_task(self.write_outbound(identity))
+        return self.outbound_queues[identity]
+
+    async def write_outbound(self, identity: str):
+        """
+        Drain the outbound queue of a peer. Waits up to `flush_latency` for a batch to fill, then writes up to
+        `batch_size` frames with a single write and drain. A batch lost with the connection is put back at the
+        front of the queue and sent again after reconnecting; a batch failing for any other reason is dropped
+        and logged, and the writer keeps running.
+        :param identity: The identity of the peer.
+        """
+        outbound_queue = self.outbound_queues[identity]
+        outbound_event = self.outbound_events[identity]
+        while True:
+            await outbound_event.wait()
+            connection = self.connections.get(identity)
+            if connection is None or connection.closed.is_set():
+                await self.get_connected_event(identity).wait()
+                continue
+
+            if len(outbound_queue) < self.batch_size and self.flush_latency > 0:
+                await asyncio.sleep(self.flush_latency)
+            batch = [outbound_queue.popleft() for _ in range(min(self.batch_size, len(outbound_queue)))]
+            if not outbound_queue:
+                outbound_event.clear()
+            self.outbound_space_events[identity].set()
+
+            try:
+                frames = []
+                frame_types = []
+                for content_type, message in batch:
+                    frame = self.encode_frame(connection, content_type, message)
+                    if frame is not None:
+                        frames.append(frame)
+                        frame_types.append(content_type)
+                if frames:
+                    connection.writer.write(b"".join(frames))
+                    await connection.writer.drain()
+                    connection.stats["frames_out"] += len(frames)
+                    connection.stats["writes"] += 1
+                    for content_type, frame in zip(frame_types, frames):
+                        self.host.metrics.record_out(identity, content_type, len(frame))
+            except (ConnectionError, OSError) as e:
+                logging.warning(f"Connection to {identity} lost while sending, requeueing {len(batch)} message(s): {e}")
+                self.requeue(identity, batch)
+                self.unregister_connection(connection)
+            except Exception as e:
+                logging.error(f"Failed to send {len(batch)} message(s) to {identity}, dropping them: {e}")
+                self.record_dropped(identity, len(batch))
+
+    def encode_frame(self, connection: PeerConnection, content_type: str, message: Message):
+        """
+        Encode, compress and frame a message for a connection.
+        The frame is cached on the message, so broadcasting to peers with the same wire settings
+        serializes and compresses the message only once.
+        :return: The frame bytes, or None if the message cannot be sent.
+        """
+        frame_key = (connection.wire_codec, connection.codec, connection.threshold, connection.level)
+        cached_frame = message.encoded_frames.get(frame_key)
+        if cached_frame is not None:
+            frame, payload_size, wire_size = cached_frame
+            connection.record_payload_out(payload_size, wire_size)
+            return frame
+
+        try:
+            payload = WireCodec.encode(connection.wire_codec, message)
+        except Exception as e:
+            logging.error(f"Dropping {content_type} message to {connection.identity}, encoding failed: {e}")
+            return None
+        wire_payload, flags = connection.compress_payload(payload)
+        if len(wire_payload) > self.max_frame_size:
+            logging.error(f"Dropping {content_type} message to {connection.identity}: {len(wire_payload)} bytes exceeds the maximum frame size")
+            return None
+        frame = Frame.pack(content_type, wire_payload, flags | WireCodec.get_flags(connection.wire_codec))
+        message.encoded_frames[frame_key] = (frame, len(payload), len(wire_payload))
+        return frame
+
+    async def close(self):
+        """
+        Stop redialing and close all connections.
+        """
+        for task in list(self.dial_tasks.values()) + list(self.writer_tasks.values()):
+            task.cancel()
+        for identity, connection in list(self.connections.items()):
+            connection.close()
+            await connection.writer.wait_closed()
+            logging.info(f"Closed connection to {identity}")
@@ -0,0 +1,96 @@
+import struct
+import asyncio
+from network.message import Message
+
+
+class FrameError(Exception):
+    """
+    Raised when a frame cannot be read from or written to a stream.
+    """
+
+
+class Frame:
+    """
+    Length-prefixed binary framing of messages on a stream.
+
+    Frame layout (network byte order):
+        version       1 byte, the framing version
+        content type  1 byte, index into CONTENT_TYPES (0 if the type is only known from the body)
+        flags         1 byte, payload encoding options (low 4 bits: compression codec ID)
+        reserved      1 byte
+        length        4 bytes, the payload length
+        payload       the JSON encoded message, possibly compressed
+
+    The content type in the header lets the receiver route a frame without parsing its body.
+
+    references:
+        https://docs.python.org/3/library/struct.html
+        https://docs.python.org/3/library/asyncio-stream.html#asyncio.StreamReader.readexactly
+    """
+    VERSION = 1
+    HEADER = struct.Struct("!BBBxI")
+    CONTENT_TYPES = ["", "SHARD_BLOCK", "MAIN_BLOCK", "CONTROL", "TRANSACTION", "GET_HEADERS", "HEADERS", "GET_BLOCKS", "BLOCKS", "HELLO", "GOSSIP", "COMPACT_BLOCK", "GET_BLOCK_TXN", "BLOCK_TXN", "PING", "PONG", "GET_ADDR", "ADDR", "SHARD_LOAD"]
+    CONTENT_TYPE_CODES = {content_type: code for code, content_type in enumerate(CONTENT_TYPES)}
+    # Small control and heartbeat messages, which are never held back behind other traffic
+    PRIORITY_TYPES = ("CONTROL", "PING", "PONG", "GET_ADDR", "ADDR", "SHARD_LOAD")
+
+    def __init__(self, content_type: str, payload: bytes, flags: int = 0):
+        """
+        Initialize a frame.
+        :param content_type: The content type of the framed message, or None if unknown.
+        :param payload: The payload bytes.
+        :param flags: The frame flags.
+        """
+        self.content_type = content_type
+        self.payload = payload
+        self.flags = flags
+
+    @classmethod
+    def encode(cls, message: Message) -> bytes:
+        """
+        Encode a message into an uncompressed frame.
+        :param message: The message to frame.
+        :return: The frame bytes, header and payload.
+        """
+        return cls.pack(message.get_content_type(), message.to_json().encode())
+
+    @classmethod
+    def pack(cls, content_type: str, payload: bytes, flags: int = 0) -> bytes:
+        """
+        Build a frame from an already encoded payload.
+        :param content_type: The content type of the framed message.
+        :param payload: The payload bytes.
+        :param flags: The frame flags.
+        :return: The frame bytes, header and payload.
+        """
+        content_type_code = cls.CONTENT_TYPE_CODES.get(content_type, 0)
+        return cls.HEADER.pack(cls.VERSION, content_type_code, flags, len(payload)) + payload
+
+    @classmethod
+    async def read(cls, reader: asyncio.StreamReader, max_frame_size: int):
+        """
+        Read the next frame from a stream.
+        :param reader: The StreamReader to read from.
+        :param max_frame_size: The maximum accepted payload length.
+        :return: The Frame, or None if the stream was closed between frames.
+        """
+        try:
+            header = await reader.readexactly(cls.HEADER.size)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise FrameError("Stream closed inside a frame header")
+
+        version, content_type_code, flags, length = cls.HEADER.unpack(header)
+        if version != cls.VERSION:
+            raise FrameError(f"Unsupported frame version {version}")
+        if length > max_frame_size:
+            raise FrameError(f"Frame of {length} bytes exceeds the maximum frame size of {max_frame_size} bytes")
+
+        try:
+            payload = await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            raise FrameError("Stream closed inside a frame payload")
+
+        content_type = cls.CONTENT_TYPES[content_type_code] if content_type_code < len(cls.CONTENT_TYPES) else ""
+        return cls(content_type=content_type or None, payload=payload, flags=flags)
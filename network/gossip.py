@@ -0,0 +1,182 @@
+import json
+import time
+import random
+import hashlib
+import logging
+from collections import OrderedDict
+from network.message import Message
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        """
+        Initialize a token bucket rate limiter.
+        :param rate: The number of tokens added per second.
+        :param burst: The maximum number of tokens in the bucket.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def consume(self) -> bool:
+        """
+        Take a token from the bucket.
+        :return: True if a token was available, False if the caller is over the rate limit.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Gossip:
+    def __init__(self, host, gossip_config: dict = None):
+        """
+        Initialize gossip-based broadcasting.
+        Instead of sending a message to every peer, the origin sends it to `fanout` random peers of a topic and every
+        peer relays it once to `fanout` others, so a message reaches all peers in O(log n) hops while each node only
+        sends O(fanout) copies. Messages are identified by the hash of their content and deduplicated with a bounded
+        LRU cache of seen message IDs; relaying is rate limited with a token bucket. A message is only relayed once it
+        was decoded, validated and handled locally, so invalid messages are not amplified.
+        :param host: The Host sending and receiving the messages.
+        Of the `fanout` relay targets, `latency_peers` are the candidates with the lowest measured RTT and the rest
+        are picked at random, which keeps the spread of the message unpredictable while favouring fast links.
+        :param gossip_config: Optional gossip settings (enabled, fanout, latency_peers, max_hops, seen_cache_size,
+                              relay_rate, relay_burst).
+        """
+        gossip_config = gossip_config if gossip_config is not None else {}
+        self.host = host
+        self.enabled = gossip_config.get("enabled", False)
+        self.fanout = gossip_config.get("fanout", 3)
+        self.latency_peers = min(gossip_config.get("latency_peers", 1), self.fanout)
+        self.max_hops = gossip_config.get("max_hops", 6)
+        self.seen_cache_size = gossip_config.get("seen_cache_size", 4096)
+        self.relay_limiter = TokenBucket(rate=gossip_config.get("relay_rate", 50), burst=gossip_config.get("relay_burst", 100))
+        self.topics = {}  # topic -> list of Peer objects
+        self.seen_messages = OrderedDict()  # message ID -> None, in least recently seen order
+        self.stats = {"published": 0, "delivered": 0, "relayed": 0, "duplicates": 0, "rate_limited": 0, "rejected": 0}
+
+        host.message_handler.register_handler("GOSSIP", self.handle_gossip)
+
+    def set_topic_peers(self, topic: str, peers: list):
+        """
+        Set the peers that take part in a topic.
+        :param topic: The topic name, e.g. "stakers".
+        :param peers: List of Peer objects.
+        """
+        self.topics[topic] = list(peers)
+
+    def get_topic_peers(self, topic: str = None) -> list:
+        """
+        Get the peers of a topic, or all known peers if no topic is given.
+        """
+        if topic is None:
+            return self.host.peer_manager.get_peers()
+        return self.topics.get(topic, [])
+
+    @staticmethod
+    def get_message_id(message: Message) -> str:
+        """
+        Compute the ID of a message from the hash of its type and content, so the same message relayed
+        by different peers has the same ID.
+        """
+        encoded_message = json.dumps({"content_type": message.get_content_type(), "content": message.get_content()}, sort_keys=True)
+        return hashlib.sha256(encoded_message.encode()).hexdigest()
+
+    def mark_seen(self, message_id: str) -> bool:
+        """
+        Record a message ID in the seen-cache, evicting the least recently seen ID when the cache is full.
+        :return: True if the message had not been seen before.
+        """
+        if message_id in self.seen_messages:
+            self.seen_messages.move_to_end(message_id)
+            return False
+        self.seen_messages[message_id] = None
+        if len(self.seen_messages) > self.seen_cache_size:
+            self.seen_messages.popitem(last=False)
+        return True
+
+    async def publish(self, message: Message, topic: str = None):
+        """
+        Publish a message to the peers of a topic.
+        Without gossip enabled, the message is sent to every peer of the topic directly.
+        :param message: The message to publish.
+        :param topic: The topic name, or None for all peers.
+        """
+        peers = self.get_topic_peers(topic)
+        if not self.enabled:
+            for peer in peers:
+                await self.host.send_message(peer, message)
+            return
+
+        message_id = self.get_message_id(message)
+        self.mark_seen(message_id)
+        self.stats["published"] += 1
+        envelope = Message.generate_gossip_message(message=message, message_id=message_id, topic=topic,
+                                                   hops=self.max_hops, node_name=str(self.host.peer_manager.this_peer))
+        await self.forward(envelope, peers, exclude={message.get_sender()})
+
+    async def forward(self, envelope: Message, peers: list, exclude: set, wait: bool = True):
+        """
+        Send a gossip envelope to the `latency_peers` fastest peers and to random peers, `fanout` peers in total.
+        :param envelope: The GOSSIP message.
+        :param peers: The candidate peers.
+        :param exclude: Identities ("host:port") or host names of peers known to have the message already.
+        :param wait: Wait while a peer's outbound queue is full; relays from the message handler do not.
+        """
+        candidates = [peer for peer in peers if str(peer) not in exclude and peer.get_hostname() not in exclude]
+        candidates = self.host.peer_manager.rank_peers(candidates)
+        targets = candidates[:self.latency_peers]
+        remaining = candidates[self.latency_peers:]
+        targets += random.sample(remaining, min(self.fanout - len(targets), len(remaining)))
+        for peer in targets:
+            await self.host.send_message(peer, envelope, wait=wait)
+
+    async def handle_gossip(self, envelope: Message):
+        """
+        Deliver a gossiped message locally the first time it is seen and, if the local handler accepted it, relay it
+        to other peers of its topic.
+        :param envelope: The GOSSIP message.
+        """
+        content = envelope.get_content()
+        message = Message.from_dict(content["message"])
+        message_id = self.get_message_id(message)
+        if message_id != content.get("message_id"):
+            logging.warning(f"Dropping gossip from {envelope.get_sender()} with a mismatched message ID.")
+            return
+        if not self.mark_seen(message_id):
+            self.stats["duplicates"] += 1
+            return
+
+        # The relayed copy keeps the encoded content, the delivered one is decoded in place
+        relayed_message = Message.from_dict(content["message"])
+        try:
+            accepted = await self.host.message_handler.dispatch_message(envelope.get_sender(), message)
+        except Exception as e:
+            logging.warning(f"Dropping gossip from {envelope.get_sender()} that failed to decode: {e}")
+            accepted = False
+        if not accepted:
+            self.stats["rejected"] += 1
+            return
+        self.stats["delivered"] += 1
+
+        hops = content.get("hops", 0) - 1
+        if hops > 0:
+            if self.relay_limiter.consume():
+                self.stats["relayed"] += 1
+                relay = Message.generate_gossip_message(message=relayed_message, message_id=message_id, topic=content.get("topic"),
+                                                        hops=hops, node_name=str(self.host.peer_manager.this_peer))
+                await self.forward(relay, self.get_topic_peers(content.get("topic")),
+                                   exclude={envelope.get_sender(), relayed_message.get_sender()}, wait=False)
+            else:
+                self.stats["rate_limited"] += 1
+
+    def get_stats(self) -> dict:
+        """
+        Get the gossip counters.
+        """
+        return dict(self.stats)
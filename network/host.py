@@ -4,90 +4,60 @@ from network.peer_manager import PeerManager
 from network.message import Message
 from network.peer import Peer
 from network.message_handler import MessageHandler
+from network.connection_manager import ConnectionManager
+from network.gossip import Gossip
+from network.metrics import NetworkMetrics, Heartbeat
+from network.peer_discovery import PeerDiscovery
 
 
 class Host:
-    def __init__(self, network_config: dict):
+    def __init__(self, network_config: dict, transport=None, node_name: str = None):
         """
         Initialize the Host with peer management.
         :param network_config: The network configuration.
+        :param transport: Optional transport for the peer connections, e.g. a SimulatedTransport; TCP by default.
+        :param node_name: Optional host name of this node, the NODE_NAME environment variable by default.
         """
         peers_list = network_config.get("peers", [])
-        self.peer_manager = PeerManager(peers_list)
-        self.message_handler = MessageHandler()
-        self.peer_connections = {}
+        discovery_config = network_config.get("discovery", {})
+        self.peer_manager = PeerManager(peers_list, port=network_config.get("port"), max_peers=discovery_config.get("max_peers"),
+                                        node_name=node_name)
+        self.metrics = NetworkMetrics()
+        self.message_handler = MessageHandler(network_config.get("queues"), network_config.get("decoding"), self.metrics)
+        self.connection_manager = ConnectionManager(self, network_config, transport)
+        self.peer_connections = self.connection_manager.connections
+        self.gossip = Gossip(self, network_config.get("gossip"))
+        self.listen_task = None
+        self.heartbeat = Heartbeat(self, network_config.get("metrics", {}).get("heartbeat_interval", 5))
+        self.discovery = PeerDiscovery(self, discovery_config)
 
     async def start(self):
         """
         Start the host, establish connections to peers, and listen for incoming connections.
         """
-        asyncio.create_task(self.listen_for_connections())
-        await self.connect_to_peers()
+        self.listen_task = asyncio.create_task(self.connection_manager.listen_for_connections())
+        await self.connection_manager.connect_to_peers()
+        self.heartbeat.start()
+        self.discovery.start()
 
-    async def connect_to_peers(self):
-        """
-        Connect to all peers listed in the PeerManager with retries.
-        """
-        for peer in self.peer_manager.get_peers():
-            retries = 3
-            while retries > 0:
-                try:
-                    reader, writer = await asyncio.open_connection(peer.get_hostname(), int(peer.get_port()))
-                    self.peer_connections[str(peer)] = (reader, writer)
-                    logging.info(f"Connected to peer {peer}")
-                    break
-                except Exception as e:
-                    retries -= 1
-                    logging.warning(f"Failed to connect to {peer}, retrying in 5 seconds ({3 - retries}/3)")
-                    await asyncio.sleep(5)
-            else:
-                logging.error(f"Failed to connect to {peer} after 3 retries.")
-
-    async def listen_for_connections(self):
-        """
-        Listen for incoming connections on the local address.
-        """
-        server = await asyncio.start_server(self.handle_incoming_connection, "0.0.0.0", int(self.peer_manager.this_peer.port))
-        logging.info(f"Listening for incoming connections at {self.peer_manager.this_peer}")
-        async with server:
-            await server.serve_forever()
-
-    async def handle_incoming_connection(self, reader, writer):
-        """
-        Handle an incoming connection from a peer.
-        :param reader: The StreamReader object.
-        :param writer: The StreamWriter object.
-        reference: https://docs.python.org/3/library/asyncio-stream.html#asyncio.StreamReader
-        """
-        peer_address = writer.get_extra_info("peername")
-        # logging.info(f"Incoming connection from {peer_address}")
-        self.peer_connections[peer_address] = (reader, writer)
-
-        while True:
-            try:    
-                data = await reader.readline()
-                if not data:
-                    logging.info(f"Connection closed by {peer_address}")
-                    break
-                message = data.decode().strip()
-                asyncio.create_task(self.handle_message(peer_address, message))
-            except Exception as e:
-                logging.error(f"Error processing message from {peer_address}: {e}")
-                break
-
-    async def handle_message(self, sender: str, message: str):
+    async def handle_message(self, sender: str, content_type: str, payload: bytes, wire_codec: str = "json"):
         """
         Handle an incoming message from a peer.
-        :param sender: The address of the sender.
-        :param message: The message content.
+        :param sender: The identity of the sender.
+        :param content_type: The content type from the frame header.
+        :param payload: The decompressed message payload.
+        :param wire_codec: The encoding of the payload, from the frame flags.
         """
-        await self.message_handler.handle_message(sender=sender, message=message)
+        await self.message_handler.handle_message(sender=sender, message=payload, content_type=content_type, wire_codec=wire_codec)
 
-    async def send_message(self, peer: Peer, message: Message):
+    async def send_message(self, peer: Peer, message: Message, wait: bool = True):
         """
-        Send a message to a peer.
+        Send a message to a peer. The message is queued on the peer's outbound queue and written by its writer task,
+        in order; messages to a peer that is not connected are sent once the connection is reestablished.
         :param peer: The peer to send the message to.
         :param message: The message to send.
+        :param wait: Wait while the peer's outbound queue is full, see ConnectionManager.send(). Handlers of incoming
+                     messages reply with wait=False.
 
         References: 
         https://docs.python.org/3/library/asyncio-stream.html#asyncio.StreamWriter.write
@@ -96,42 +66,60 @@ class Host:
 
         """
         try:
-            if str(peer) not in self.peer_connections:
-                raise Exception(f"No active connection to {peer}")
-            
             if not message or not isinstance(message, Message):
                 raise ValueError("Message is invalid or None")
-            
-            _, writer = self.peer_connections[str(peer)]
-            
-            serialized_message = message.to_json()
-            if not serialized_message.strip():
-                raise ValueError("Serialized message is empty")
-            
-            encoded_message = serialized_message.encode() + b"\n"
-            
-            writer.write(encoded_message)
-            await writer.drain()
-            
-            logging.info(f"Message sent to {peer}, Message Type: {message.content_type}")
+
+            if await self.connection_manager.send(str(peer), message.get_content_type(), message, wait=wait):
+                logging.debug(f"Message queued to {peer}, Message Type: {message.content_type}")
+            else:
+                logging.debug(f"Message to {peer} queued until reconnected, Message Type: {message.content_type}")
         except Exception as e:
             logging.error(f"Failed to send message to {peer}: {e}")
 
-    async def broadcast_message(self, message: Message):
+    async def broadcast_message(self, message: Message, topic: str = None):
         """
-        Broadcast a message to all connected peers.
+        Broadcast a message to all peers, or to the peers of a topic.
+        Relayed through gossip when it is enabled, otherwise sent to every peer directly.
         :param message: The message to broadcast.
+        :param topic: Optional gossip topic, e.g. "stakers".
         """
-        for peer in self.peer_manager.get_peers():
-            asyncio.create_task(self.send_message(peer, message))
+        await self.gossip.publish(message, topic)
 
     async def stop(self):
         """
         Stop the host and clean up resources.
         """
         logging.info("Stopping host...")
-        # Close all peer connections
-        for peer, (reader, writer) in self.peer_connections.items():
-            writer.close()
-            await writer.wait_closed()
-            logging.info(f"Closed connection to {peer}")
\ No newline at end of file
+        self.heartbeat.stop()
+        self.discovery.stop()
+        if self.listen_task is not None:
+            self.listen_task.cancel()
+        await self.connection_manager.close()
+        self.message_handler.close()
+
+    def get_compression_stats(self) -> dict:
+        """
+        Get the compression statistics of every peer connection.
+        :return: A dictionary mapping connections to their byte counters and compression ratios.
+        """
+        return {str(peer): connection.get_compression_stats() for peer, connection in list(self.peer_connections.items())}
+
+    def get_queue_stats(self) -> dict:
+        """
+        Get the size, high-water mark and drop counters of the incoming message queues.
+        """
+        return self.message_handler.get_queue_stats()
+
+    def get_metrics(self) -> dict:
+        """
+        Get a snapshot of the network metrics: bytes and messages in and out per peer and per content type,
+        peer round trip times and liveness, outbound and incoming queue depths and the gossip and discovery counters.
+        Safe to call from another thread, e.g. the webserver.
+        """
+        snapshot = self.metrics.snapshot()
+        snapshot["outbound_queues"] = self.connection_manager.get_outbound_depths()
+        snapshot["incoming_queues"] = self.get_queue_stats()
+        snapshot["peer_states"] = self.peer_manager.get_peer_states()
+        snapshot["gossip"] = self.gossip.get_stats()
+        snapshot["discovery"] = self.discovery.get_stats()
+        return snapshot
@@ -6,10 +6,16 @@ class Message:
         :param content_type: The type of content in the message (BK for Block, TX for transaction).
         :param content: The content of the message.
         :param sender: The sender of the message.
+
+        A message is encoded and framed once per wire format and the bytes are reused for every recipient,
+        so a message must not be modified after it has been sent.
         """
         self.content_type = content_type
         self.content = content
         self.sender = sender
+        self.received_from = None   # Identity of the connection the message was received on, set by the MessageHandler
+        self.encoded_payloads = {}  # wire codec -> encoded message
+        self.encoded_frames = {}    # (wire codec, compression codec, threshold, level) -> (frame, payload size, wire size)
 
     def get_content(self):
         """
@@ -60,14 +66,14 @@ class Message:
         """
         if sender:
             return cls(data["content_type"], data["content"], sender)
-        return cls(data["content_type"], data["content"])
+        return cls(data["content_type"], data["content"], data.get("sender"))
     
     @classmethod
-    def from_json(cls, json_data: str):
+    def from_json(cls, json_data):
         """
         Creates a Message object from a JSON string.
 
-        :param: json_data (str): A JSON string containing the message data.
+        :param: json_data (str | bytes): A JSON string, or its UTF-8 encoded bytes, containing the message data.
 
         :Returns: (Message) The constructed Message object.
         """
@@ -80,28 +86,189 @@ class Message:
             raise ValueError(f"Invalid JSON string: {e}")
 
     @classmethod
-    def generate_start_message(cls, shard_name: str, epoch: int, node_name: str):
+    def generate_start_message(cls, shard_name: str, epoch: int, node_name: str, weights: list = None, attempt: int = None,
+                               assignment: dict = None, assignment_epoch: int = None):
         """
         Generate a START message.
+        :param weights: Optional transaction share of every miner, indexed by miner ID.
+        :param attempt: Optional attempt of the epoch, counting the restarts of an epoch whose quorum was missed.
+        :param assignment: Optional current miner peers ("host:port") of every shard, for miners that missed an ASSIGN.
+        :param assignment_epoch: The epoch the assignment was made at, required with an assignment.
         """
-        return Message(content_type="CONTROL", content={
+        content = {
             "action": "START",
             "shard": shard_name,
             "epoch": epoch
-        }, sender=node_name)
+        }
+        if attempt is not None:
+            content["attempt"] = attempt
+        if weights is not None:
+            content["weights"] = weights
+        if assignment is not None:
+            content["assignment_epoch"] = assignment_epoch
+            content["assignment"] = assignment
+        return Message(content_type="CONTROL", content=content, sender=node_name)
     
     @classmethod
-    def generate_stop_message(cls, shard_name: str, epoch: int, node_name: str):
+    def generate_stop_message(cls, shard_name: str, epoch: int, node_name: str, missing: list = None):
         """
         Generate a STOP message.
+        :param missing: Optional names of the miners whose shard blocks did not arrive before the deadline.
         """
-        return Message(content_type="CONTROL", content={
+        content = {
             "action": "STOP",
             "shard": shard_name,
             "epoch": epoch
+        }
+        if missing:
+            content["missing"] = missing
+        return Message(content_type="CONTROL", content=content, sender=node_name)
+
+    @classmethod
+    def generate_assign_message(cls, shard_name: str, epoch: int, assignment: dict, node_name: str):
+        """
+        Generate an ASSIGN message announcing the miner peers of every shard from the given epoch on.
+        :param shard_name: The shard that receives a miner.
+        :param assignment: The miner peers ("host:port") of every shard.
+        """
+        return Message(content_type="CONTROL", content={
+            "action": "ASSIGN",
+            "shard": shard_name,
+            "epoch": epoch,
+            "assignment": assignment
         }, sender=node_name)
 
-    
+    @classmethod
+    def generate_shard_load_message(cls, load: dict, node_name: str):
+        """
+        Generate a SHARD_LOAD message reporting the pending transactions and measured hashrate of a shard,
+        along with the miner assignment known to the reporting staker.
+        """
+        return cls(content_type="SHARD_LOAD", content=load, sender=node_name)
+
+    @classmethod
+    def generate_hello_message(cls, content: dict, node_name: str):
+        """
+        Generate a HELLO handshake message.
+        The connecting peer offers its compression codecs and threshold, the accepting peer answers with its choice.
+        """
+        return Message(content_type="HELLO", content=content, sender=node_name)
+
+    @classmethod
+    def generate_get_headers_message(cls, locator: list, max_headers: int, request_id: str, node_name: str):
+        """
+        Generate a GET_HEADERS message requesting the main chain headers following the first known locator hash.
+        """
+        return Message(content_type="GET_HEADERS", content={
+            "request_id": request_id,
+            "locator": locator,
+            "max_headers": max_headers
+        }, sender=node_name)
+
+    @classmethod
+    def generate_headers_message(cls, headers: list, request_id: str, node_name: str):
+        """
+        Generate a HEADERS message answering a GET_HEADERS request.
+        """
+        return Message(content_type="HEADERS", content={
+            "request_id": request_id,
+            "headers": headers
+        }, sender=node_name)
+
+    @classmethod
+    def generate_get_blocks_message(cls, block_hashes: list, request_id: str, node_name: str):
+        """
+        Generate a GET_BLOCKS message requesting full blocks by hash.
+        """
+        return Message(content_type="GET_BLOCKS", content={
+            "request_id": request_id,
+            "block_hashes": block_hashes
+        }, sender=node_name)
+
+    @classmethod
+    def generate_blocks_message(cls, blocks: list, request_id: str, node_name: str):
+        """
+        Generate a BLOCKS message answering a GET_BLOCKS request.
+        """
+        return Message(content_type="BLOCKS", content={
+            "request_id": request_id,
+            "blocks": blocks
+        }, sender=node_name)
+
+    @classmethod
+    def generate_get_block_txn_message(cls, block_hash: str, indexes: list, request_id: str, node_name: str):
+        """
+        Generate a GET_BLOCK_TXN message requesting the transactions of a compact block that are missing locally.
+        :param block_hash: The hash of the block.
+        :param indexes: The positions of the missing transactions in the block.
+        :param request_id: The ID matching the BLOCK_TXN response to the request.
+        """
+        return Message(content_type="GET_BLOCK_TXN", content={
+            "request_id": request_id,
+            "block_hash": block_hash,
+            "indexes": indexes
+        }, sender=node_name)
+
+    @classmethod
+    def generate_block_txn_message(cls, block_hash: str, transactions: list, request_id: str, node_name: str):
+        """
+        Generate a BLOCK_TXN message answering a GET_BLOCK_TXN request.
+        """
+        return Message(content_type="BLOCK_TXN", content={
+            "request_id": request_id,
+            "block_hash": block_hash,
+            "transactions": transactions
+        }, sender=node_name)
+
+    @classmethod
+    def generate_gossip_message(cls, message, message_id: str, topic: str, hops: int, node_name: str):
+        """
+        Wrap a message in a GOSSIP envelope to be relayed between peers.
+        :param message: The gossiped Message.
+        :param message_id: The content-hash ID of the gossiped message.
+        :param topic: The topic of the message, or None for all peers.
+        :param hops: The number of hops the message may still be relayed.
+        """
+        return cls(content_type="GOSSIP", content={
+            "message_id": message_id,
+            "topic": topic,
+            "hops": hops,
+            "message": message.to_dict()
+        }, sender=node_name)
+
+    @classmethod
+    def generate_ping_message(cls, peer: str, nonce: str, sent_at: float, node_name: str):
+        """
+        Generate a PING heartbeat message.
+        :param peer: The identity of the pinged peer, echoed back in the PONG.
+        :param nonce: A random value identifying the heartbeat.
+        :param sent_at: The local monotonic time the PING was sent at.
+        :param node_name: The identity of this node, which the PONG is sent to.
+        """
+        return cls(content_type="PING", content={"peer": peer, "nonce": nonce, "sent_at": sent_at}, sender=node_name)
+
+    @classmethod
+    def generate_pong_message(cls, ping_content: dict, node_name: str):
+        """
+        Generate the PONG answering a PING, echoing its content.
+        """
+        return cls(content_type="PONG", content=dict(ping_content), sender=node_name)
+
+    @classmethod
+    def generate_get_addr_message(cls, node_name: str):
+        """
+        Generate a GET_ADDR message requesting the addresses of the peers known to the receiver.
+        :param node_name: The identity of this node, which the ADDR answer is sent to.
+        """
+        return cls(content_type="GET_ADDR", content={}, sender=node_name)
+
+    @classmethod
+    def generate_addr_message(cls, addresses: list, node_name: str):
+        """
+        Generate an ADDR message listing peer addresses in the format "host:port".
+        """
+        return cls(content_type="ADDR", content={"addresses": addresses}, sender=node_name)
+
     def __str__(self):
         """
         Get a string representation of the message.
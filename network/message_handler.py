@@ -1,58 +1,210 @@
+import time
 import logging
 import json
-from network.message import Message
 import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from network.message import Message
+from network.codec import WireCodec
+from network.framing import Frame
+from network.bounded_queue import BoundedQueue
 
 
 class MessageHandler:
-    def __init__(self):
+    # Queue settings used when the queue config does not override them
+    DEFAULT_QUEUE_CONFIG = {
+        "default": {"maxsize": 1024, "policy": "block"},
+        "transactions": {"maxsize": 10000, "policy": "drop_oldest"},
+        "other_messages": {"maxsize": 64, "policy": "drop"},
+        "sync_requests": {"maxsize": 64, "policy": "drop"},  # Requesters retry after a timeout
+    }
+
+    def __init__(self, queue_config: dict = None, decode_config: dict = None, metrics=None):
         """
-        Initialize the Message Handler with message queues.
+        Initialize the Message Handler with bounded message queues and the default handler registry.
+        :param queue_config: Optional queue settings: a "default" entry and per-queue entries, each with a maxsize and
+                             an overflow policy (block, drop, drop_oldest).
+        :param decode_config: Optional decoding settings: offload_threshold (payload bytes above which messages are
+                              decoded off the event loop), executor ("thread" or "process"), workers and
+                              priority_types (content types always decoded on the event loop).
+        :param metrics: Optional NetworkMetrics counting the handled messages and their decode time per content type.
         Refernce: https://docs.python.org/3/library/asyncio-queue.html
         """
-        self.shard_blocks = asyncio.Queue()
-        self.main_blocks = asyncio.Queue()
-        self.transactions = asyncio.Queue()
-        self.control_message = asyncio.Queue()
-        self.message_queue = asyncio.Queue()
-        self.other_messages = asyncio.Queue()
+        self.queue_config = queue_config if queue_config is not None else {}
+        self.metrics = metrics
+        self.shard_blocks = self.create_queue("shard_blocks")
+        self.main_blocks = self.create_queue("main_blocks")
+        self.transactions = self.create_queue("transactions")
+        self.control_message = self.create_queue("control_message")
+        self.message_queue = self.create_queue("message_queue")
+        self.other_messages = self.create_queue("other_messages")
+        self.sync_requests = self.create_queue("sync_requests")
+        self.sync_responses = self.create_queue("sync_responses")
+
+        decode_config = decode_config if decode_config is not None else {}
+        self.offload_threshold = decode_config.get("offload_threshold", 64 * 1024)
+        workers = decode_config.get("workers", 2)
+        self.priority_types = set(decode_config.get("priority_types", Frame.PRIORITY_TYPES))
+        if decode_config.get("executor", "thread") == "process":
+            self.decode_executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.decode_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decoder")
+
+        self.handlers = {}  # content type -> (decoder, async handler)
+        self.validators = {}  # content type -> function checking a decoded message before it is handled
+        self.register_handler("SHARD_BLOCK", self.add_shard_block)
+        self.register_handler("MAIN_BLOCK", self.add_main_block)
+        self.register_handler("CONTROL", self.add_control_message)
+        self.register_handler("TRANSACTION", self.add_transaction)
+        for content_type in ("GET_HEADERS", "GET_BLOCKS"):
+            self.register_handler(content_type, self.add_sync_request)
+        for content_type in ("HEADERS", "BLOCKS"):
+            self.register_handler(content_type, self.add_sync_response)
+
+    def create_queue(self, name: str) -> BoundedQueue:
+        """
+        Create a bounded queue with the configured size and overflow policy.
+        :param name: The name of the queue.
+        """
+        settings = dict(self.DEFAULT_QUEUE_CONFIG["default"])
+        settings.update(self.queue_config.get("default", {}))
+        settings.update(self.DEFAULT_QUEUE_CONFIG.get(name, {}))
+        settings.update(self.queue_config.get(name, {}))
+        return BoundedQueue(name, maxsize=settings["maxsize"], policy=settings["policy"])
+
+    def get_queue_stats(self) -> dict:
+        """
+        Get the size, high-water mark and drop counters of every queue.
+        """
+        queues = [self.shard_blocks, self.main_blocks, self.transactions, self.control_message,
+                  self.message_queue, self.other_messages, self.sync_requests, self.sync_responses]
+        return {queue.name: queue.get_stats() for queue in queues}
+
+    def register_handler(self, content_type: str, handler, decoder=None):
+        """
+        Register the handler of a content type.
+        :param content_type: The content type of the messages.
+        :param handler: Coroutine function called with each decoded Message.
+        :param decoder: Optional function turning the message content into an object, e.g. ShardBlock.from_dict.
+                        Must be picklable when decoding runs in a process pool.
+        """
+        self.handlers[content_type] = (decoder, handler)
+
+    def register_decoder(self, content_type: str, decoder):
+        """
+        Set the decoder of an already registered content type, keeping its handler.
+        :param content_type: The content type of the messages.
+        :param decoder: Function turning the message content into an object.
+        """
+        _, handler = self.handlers[content_type]
+        self.handlers[content_type] = (decoder, handler)
+
+    def register_validator(self, content_type: str, validator):
+        """
+        Register a check of decoded messages of a content type. Messages failing it are dropped before their handler
+        is called, and gossiped messages failing it are not relayed.
+        :param content_type: The content type of the messages.
+        :param validator: Function called with each decoded Message, returning True if the message is valid.
+        """
+        self.validators[content_type] = validator
+
+    def is_valid(self, sender: str, parsed_message: Message) -> bool:
+        """
+        Check a decoded message with the validator registered for its content type, if any.
+        """
+        validator = self.validators.get(parsed_message.get_content_type())
+        if validator is not None and not validator(parsed_message):
+            logging.warning(f"Dropping invalid {parsed_message.get_content_type()} message from {sender}.")
+            return False
+        return True
+
+    @staticmethod
+    def decode_message(message, decoder=None, wire_codec: str = "json") -> Message:
+        """
+        Parse an encoded message and decode its content.
+        Runs on the event loop for small payloads and in the decode executor for large ones.
+        :param message: The encoded message (str | bytes).
+        :param decoder: Optional function applied to the message content.
+        :param wire_codec: The encoding of the message, one of WireCodec.CODECS.
+        :return: The Message object, its content replaced by the decoded object if a decoder is given.
+        """
+        parsed_message = WireCodec.decode(wire_codec, message)
+        if decoder is not None:
+            parsed_message.content = decoder(parsed_message.get_content())
+        return parsed_message
 
-    async def handle_message(self, sender: str, message: str):
+    async def handle_message(self, sender: str, message, content_type: str = None, wire_codec: str = "json"):
         """
-        Handle incoming messages from peers. 
+        Handle incoming messages from peers: decode them and pass them to the handler registered for their type.
+        Payloads above the offload threshold are decoded in the decode executor, so large blocks do not stall
+        the event loop. Control and heartbeat messages are always decoded on the event loop, so they never wait
+        in the executor behind large blocks. Waits while the target queue is full if its policy is "block", which holds back the
+        messages of this content type from the sender's connection (see ConnectionManager.queue_inbound).
 
         :param: sender (str): The address of the sender.
-        :param: message (str): The message content.
+        :param: message (str | bytes): The encoded message.
+        :param: content_type (str): The content type from the frame header, read from the message if not provided.
+        :param: wire_codec (str): The encoding of the message, JSON by default.
         """
+        failed = False
+        decode_start = time.perf_counter()
+        decode_time = 0.0
         try:
-            # Parse the message into a Message object
-            parsed_message = Message.from_json(message)
-            content_type = parsed_message.get_content_type()
-            if content_type == "SHARD_BLOCK":
-                # logging.info(f"Received {content_type} from {sender}")
-                await self.add_shard_block(parsed_message)
-
-            elif content_type == "MAIN_BLOCK":
-                # logging.info(f"Received {content_type} from {sender}")
-                await self.add_main_block(parsed_message)
-            
-            elif content_type == "CONTROL":
-                # logging.info(f"Received {content_type} from {sender}")
-                await self.add_control_message(parsed_message)
-
-            elif content_type == "TRANSACTION":
-                # logging.info(f"Received {content_type} from {sender}")
-                await self.add_transaction(parsed_message)
+            decoder, handler = self.handlers.get(content_type, (None, None))
+            if len(message) >= self.offload_threshold and content_type not in self.priority_types:
+                loop = asyncio.get_running_loop()
+                parsed_message = await loop.run_in_executor(self.decode_executor, self.decode_message, message, decoder, wire_codec)
+            else:
+                parsed_message = self.decode_message(message, decoder, wire_codec)
+            decode_time = time.perf_counter() - decode_start
+            parsed_message.received_from = sender
 
+            if handler is None:
+                # Frames without a known content type in the header are routed by the message body
+                await self.dispatch_message(sender, parsed_message)
+            elif self.is_valid(sender, parsed_message):
+                await handler(parsed_message)
             else:
-                logging.warning(f"Unknown message type from {sender}: {content_type}")
-                await self.other_messages.put(parsed_message)
+                failed = True
 
         except json.JSONDecodeError as e:
+            failed = True
             logging.error(f"Invalid JSON message from {sender}: {e}")
 
         except Exception as e:
+            failed = True
             logging.error(f"Failed to handle message from {sender}: {e}")
+
+        if self.metrics is not None:
+            self.metrics.record_handled(content_type, decode_time, failed)
+
+    async def dispatch_message(self, sender: str, parsed_message: Message) -> bool:
+        """
+        Decode a parsed message and pass it to the handler registered for its content type.
+        Used for messages unwrapped from other messages, such as gossip envelopes.
+        :param sender: The address of the sender.
+        :param parsed_message: The Message object, its content not decoded yet.
+        :return: True if the message was handled, False if its type is unknown or it failed validation.
+        """
+        content_type = parsed_message.get_content_type()
+        if parsed_message.received_from is None:
+            parsed_message.received_from = sender
+        decoder, handler = self.handlers.get(content_type, (None, None))
+        if handler is None:
+            logging.warning(f"Unknown message type from {sender}: {content_type}")
+            await self.other_messages.put(parsed_message)
+            return False
+        if decoder is not None:
+            parsed_message.content = decoder(parsed_message.get_content())
+        if not self.is_valid(sender, parsed_message):
+            return False
+        await handler(parsed_message)
+        return True
+
+    def close(self):
+        """
+        Shut down the decode executor.
+        """
+        self.decode_executor.shutdown(wait=False)
     
     async def add_to_queue(self, message):
         """
@@ -102,14 +254,14 @@ class MessageHandler:
         Add a control message to the Queue.
         :params: control_message: The control message to add.
         """
-        await self.shard_blocks.put(content)
+        await self.control_message.put(content)
     
     
     async def get_control_message(self):
         """
         Get the latest control message.
         """
-        control_message = await self.shard_blocks.get()
+        control_message = await self.control_message.get()
         return control_message
     
     
@@ -126,3 +278,31 @@ class MessageHandler:
         """
         transaction = await self.transactions.get()
         return transaction
+
+    async def add_sync_request(self, request):
+        """
+        Add a chain sync request (GET_HEADERS, GET_BLOCKS) to the Queue.
+        :params: request (Message): The sync request to add.
+        """
+        await self.sync_requests.put(request)
+
+    async def get_sync_request(self):
+        """
+        Get the next chain sync request.
+        """
+        request = await self.sync_requests.get()
+        return request
+
+    async def add_sync_response(self, response):
+        """
+        Add a chain sync response (HEADERS, BLOCKS) to the Queue.
+        :params: response (Message): The sync response to add.
+        """
+        await self.sync_responses.put(response)
+
+    async def get_sync_response(self):
+        """
+        Get the next chain sync response.
+        """
+        response = await self.sync_responses.get()
+        return response
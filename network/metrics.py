@@ -0,0 +1,189 @@
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from network.message import Message
+
+
+class NetworkMetrics:
+    RTT_SMOOTHING = 0.2  # Weight of the newest sample in the smoothed RTT
+
+    def __init__(self):
+        """
+        Initialize the network counters: bytes and messages in and out per peer and per content type,
+        and the round trip time of every peer measured with PING/PONG heartbeats.
+        Counters are updated on the event loop and read through snapshot(), e.g. from the webserver thread.
+        """
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.peers = {}          # peer identity -> counters
+        self.content_types = {}  # content type -> counters
+
+    @staticmethod
+    def create_counters() -> dict:
+        """
+        Create an empty set of traffic counters.
+        """
+        return {"bytes_in": 0, "bytes_out": 0, "messages_in": 0, "messages_out": 0}
+
+    def get_peer_counters(self, identity: str) -> dict:
+        """
+        Get the counters of a peer, creating them on first use. Must be called with the lock held.
+        """
+        if identity not in self.peers:
+            self.peers[identity] = dict(self.create_counters(), rtt=None, last_rtt=None, pings_sent=0, pongs_received=0, last_seen=None)
+        return self.peers[identity]
+
+    def get_content_type_counters(self, content_type: str) -> dict:
+        """
+        Get the counters of a content type, creating them on first use. Must be called with the lock held.
+        """
+        content_type = content_type or "UNKNOWN"
+        if content_type not in self.content_types:
+            self.content_types[content_type] = self.create_counters()
+        return self.content_types[content_type]
+
+    def record_in(self, identity: str, content_type: str, size: int):
+        """
+        Count a frame received from a peer.
+        :param identity: The identity of the peer.
+        :param content_type: The content type of the frame.
+        :param size: The frame size on the wire, in bytes.
+        """
+        with self.lock:
+            for counters in (self.get_peer_counters(identity), self.get_content_type_counters(content_type)):
+                counters["bytes_in"] += size
+                counters["messages_in"] += 1
+            self.peers[identity]["last_seen"] = time.time()
+
+    def record_out(self, identity: str, content_type: str, size: int):
+        """
+        Count a frame written to a peer.
+        :param identity: The identity of the peer.
+        :param content_type: The content type of the frame.
+        :param size: The frame size on the wire, in bytes.
+        """
+        with self.lock:
+            for counters in (self.get_peer_counters(identity), self.get_content_type_counters(content_type)):
+                counters["bytes_out"] += size
+                counters["messages_out"] += 1
+
+    def record_ping(self, identity: str):
+        """
+        Count a heartbeat sent to a peer.
+        """
+        with self.lock:
+            self.get_peer_counters(identity)["pings_sent"] += 1
+
+    def record_rtt(self, identity: str, rtt: float):
+        """
+        Record a round trip time measured with a PING/PONG exchange, smoothed with an exponential moving average.
+        :param identity: The identity of the peer.
+        :param rtt: The round trip time, in seconds.
+        """
+        with self.lock:
+            counters = self.get_peer_counters(identity)
+            counters["pongs_received"] += 1
+            counters["last_rtt"] = rtt
+            counters["rtt"] = rtt if counters["rtt"] is None else (1 - self.RTT_SMOOTHING) * counters["rtt"] + self.RTT_SMOOTHING * rtt
+
+    def record_handled(self, content_type: str, decode_time: float, failed: bool = False):
+        """
+        Count a message handled by the MessageHandler.
+        :param content_type: The content type of the message.
+        :param decode_time: The time spent decoding the message, in seconds.
+        :param failed: Whether decoding or handling the message failed.
+        """
+        with self.lock:
+            counters = self.get_content_type_counters(content_type)
+            counters["handled"] = counters.get("handled", 0) + 1
+            counters["failed"] = counters.get("failed", 0) + int(failed)
+            counters["decode_time"] = counters.get("decode_time", 0.0) + decode_time
+
+    def get_rtt(self, identity: str):
+        """
+        Get the smoothed round trip time of a peer in seconds, or None if it was never measured.
+        """
+        with self.lock:
+            return self.peers.get(identity, {}).get("rtt")
+
+    def snapshot(self) -> dict:
+        """
+        Get a copy of all counters.
+        """
+        with self.lock:
+            return {
+                "uptime": time.time() - self.started_at,
+                "peers": {identity: dict(counters) for identity, counters in self.peers.items()},
+                "content_types": {content_type: dict(counters) for content_type, counters in self.content_types.items()},
+            }
+
+
+class Heartbeat:
+    def __init__(self, host, interval: float = 5):
+        """
+        Initialize the PING/PONG heartbeats measuring the round trip time of every connected peer.
+        PING frames go through the peer's outbound queue like any other message, so the measured RTT includes
+        queueing delays and shows peers that are slow to drain.
+        :param host: The Host exchanging the heartbeats; RTTs are recorded in host.metrics and host.peer_manager.
+        :param interval: Seconds between two heartbeats to the same peer, 0 to disable them.
+        """
+        self.host = host
+        self.interval = interval
+        self.task = None
+
+        host.message_handler.register_handler("PING", self.handle_ping)
+        host.message_handler.register_handler("PONG", self.handle_pong)
+
+    def start(self):
+        """
+        Start sending heartbeats in the background.
+        """
+        if self.interval > 0 and self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        """
+        Stop sending heartbeats.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        """
+        Send a PING to every connected peer every interval.
+        """
+        connection_manager = self.host.connection_manager
+        while True:
+            await asyncio.sleep(self.interval)
+            for identity in list(connection_manager.connections):
+                if connection_manager.is_connected(identity):
+                    ping = Message.generate_ping_message(peer=identity, nonce=uuid.uuid4().hex, sent_at=time.monotonic(),
+                                                         node_name=connection_manager.get_identity())
+                    self.host.metrics.record_ping(identity)
+                    await connection_manager.send(identity, "PING", ping)
+
+    async def handle_ping(self, ping: Message):
+        """
+        Answer a PING with a PONG echoing its content.
+        The answer goes to the connection the PING came in on, not to the sender named in the PING.
+        """
+        if ping.received_from is None:
+            return
+        pong = Message.generate_pong_message(ping.get_content(), node_name=self.host.connection_manager.get_identity())
+        await self.host.connection_manager.send(ping.received_from, "PONG", pong, wait=False)
+
+    async def handle_pong(self, pong: Message):
+        """
+        Record the round trip time of an answered PING. The send time was set by this node, so clocks need not be in sync.
+        """
+        content = pong.get_content()
+        try:
+            if content["peer"] != pong.received_from:
+                raise ValueError(f"PONG for {content['peer']} received on another connection")
+            self.host.metrics.record_rtt(content["peer"], time.monotonic() - float(content["sent_at"]))
+            self.host.peer_manager.set_rtt(content["peer"], self.host.metrics.get_rtt(content["peer"]))
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning(f"Ignoring invalid PONG from {pong.get_sender()}: {e}")
@@ -0,0 +1,102 @@
+import time
+import random
+import asyncio
+import logging
+from network.message import Message
+from network.peer import Peer
+
+
+class PeerDiscovery:
+    def __init__(self, host, discovery_config: dict = None):
+        """
+        Initialize peer discovery through address exchange.
+        Every interval, the node asks a few connected peers for the addresses they know (GET_ADDR) and dials
+        the new peers found in the answers (ADDR), so the network can grow past the configured peer list.
+        Only ADDR messages answering an outstanding GET_ADDR on the same connection are accepted, and learned
+        peers that cannot be dialed `max_dial_failures` times in a row are forgotten again.
+        :param host: The Host exchanging the messages.
+        :param discovery_config: Optional discovery settings (enabled, interval, fanout, max_addresses, max_dial_failures).
+        """
+        discovery_config = discovery_config if discovery_config is not None else {}
+        self.host = host
+        self.enabled = discovery_config.get("enabled", False)
+        self.interval = discovery_config.get("interval", 30)
+        self.fanout = discovery_config.get("fanout", 3)
+        self.max_addresses = discovery_config.get("max_addresses", 100)
+        self.max_dial_failures = discovery_config.get("max_dial_failures", 5)
+        self.pending_requests = {}  # peer identity -> time the outstanding GET_ADDR was sent
+        self.task = None
+        self.stats = {"requests_sent": 0, "addresses_received": 0, "peers_learned": 0, "unsolicited": 0}
+
+        host.message_handler.register_handler("GET_ADDR", self.handle_get_addresses)
+        host.message_handler.register_handler("ADDR", self.handle_addresses)
+
+    def start(self):
+        """
+        Start exchanging addresses in the background, if discovery is enabled.
+        """
+        if self.enabled and self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        """
+        Stop exchanging addresses.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        """
+        Ask up to `fanout` random connected peers for their addresses every interval.
+        """
+        connection_manager = self.host.connection_manager
+        while True:
+            peers = self.host.peer_manager.get_alive_peers()
+            for peer in random.sample(peers, min(self.fanout, len(peers))):
+                self.stats["requests_sent"] += 1
+                self.pending_requests[str(peer)] = time.monotonic()
+                await connection_manager.send(str(peer), "GET_ADDR", Message.generate_get_addr_message(node_name=connection_manager.get_identity()))
+            await asyncio.sleep(self.interval)
+
+    async def handle_get_addresses(self, request: Message):
+        """
+        Answer a GET_ADDR request with this node's address and the addresses of its connected peers.
+        The answer goes to the connection the request came in on, not to the sender named in the request.
+        """
+        requester = request.received_from
+        if requester is None:
+            return
+        addresses = [str(peer) for peer in self.host.peer_manager.get_alive_peers() if str(peer) != requester]
+        addresses = [self.host.connection_manager.get_identity()] + random.sample(addresses, min(self.max_addresses - 1, len(addresses)))
+        await self.host.connection_manager.send(requester, "ADDR", Message.generate_addr_message(
+            addresses=addresses, node_name=self.host.connection_manager.get_identity()), wait=False)
+
+    async def handle_addresses(self, response: Message):
+        """
+        Add the peers listed in an ADDR message to the peer table and keep connections to the new ones.
+        Only accepted as the answer to a GET_ADDR sent to the same peer within the last interval.
+        """
+        requested_at = self.pending_requests.pop(response.received_from, None)
+        if requested_at is None or time.monotonic() - requested_at > self.interval:
+            self.stats["unsolicited"] += 1
+            logging.warning(f"Ignoring unsolicited ADDR from {response.received_from}.")
+            return
+        addresses = response.get_content().get("addresses", [])[:self.max_addresses]
+        self.stats["addresses_received"] += len(addresses)
+        for address in addresses:
+            host, _, port = str(address).rpartition(":")
+            if not host or not port.isdigit():
+                logging.warning(f"Ignoring invalid address {address} from {response.received_from}.")
+                continue
+            peer = Peer(host, port)
+            if self.host.peer_manager.add_peer(peer):
+                self.stats["peers_learned"] += 1
+                logging.info(f"Discovered peer {peer} through {response.received_from}.")
+                self.host.connection_manager.maintain_connection(peer, max_failures=self.max_dial_failures)
+
+    def get_stats(self) -> dict:
+        """
+        Get the discovery counters.
+        """
+        return dict(self.stats)
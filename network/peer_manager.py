@@ -1,26 +1,47 @@
 import os
+import time
 import threading
 from network.peer import Peer
 
 
 class PeerManager:
-    def __init__(self, peers_list: list):
+    def __init__(self, peers_list: list, port=None, max_peers: int = None, node_name: str = None):
         """
         Initialize the PeerManager with a list of peers.
+        Peers are indexed by their identity ("host:port") and carry a liveness flag and the measured round trip
+        time, which are used to rank peers by latency. Peers learned through address exchange are added at runtime.
         :params: peers_list (list): A list of peers in the format "host:port".
+        :params: port: The port this node listens on; the NODE_PORT environment variable takes precedence, default 5000.
+        :params: max_peers (int): Optional limit on the number of known peers. Configured peers always count.
+        :params: node_name (str): Optional host name of this node, taken from the environment if not given.
 
         reference: https://docs.python.org/3/library/threading.html#lock-objects
         """
         self.lock = threading.Lock()  # For thread-safe operations
-        
+        self.max_peers = max_peers
+
         # Uncomment this line if not using with docker
         # hostname = socket.gethostname()
-        
+
         # If using with docker, Get the node name from the environment, default to "node"
-        node_name = os.environ.get("NODE_NAME", "node")
-        
-        self.this_peer = Peer(node_name, "5000")  # Determine own address
-        self.peers = [Peer(*peer.split(":")) for peer in peers_list if peer != str(self.this_peer)]
+        if node_name is None:
+            node_name = os.environ.get("NODE_NAME", "node")
+        port = os.environ.get("NODE_PORT", port if port is not None else 5000)
+
+        self.this_peer = Peer(node_name, str(port))  # Determine own address
+        self.peers = {}        # peer identity -> Peer, in insertion order
+        self.peer_states = {}  # peer identity -> {"alive", "rtt", "last_seen", "static"}
+        for peer in peers_list:
+            if peer != str(self.this_peer):
+                self.insert_peer(Peer(*peer.rsplit(":", 1)), static=True)
+
+    def insert_peer(self, peer: Peer, static: bool = False):
+        """
+        Add a peer to the peer table. Must be called with the lock held.
+        """
+        identity = str(peer)
+        self.peers[identity] = peer
+        self.peer_states[identity] = {"alive": False, "rtt": None, "last_seen": None, "static": static}
 
     def add_peer(self, peer: Peer) -> bool:
         """
@@ -31,10 +52,12 @@ class PeerManager:
         :Returns: bool: True if the peer was added, False otherwise.
         """
         with self.lock:
-            if peer not in self.peers and peer != self.this_peer:
-                self.peers.append(peer)
-                return True
-            return False
+            if str(peer) in self.peers or peer == self.this_peer:
+                return False
+            if self.max_peers is not None and len(self.peers) >= self.max_peers:
+                return False
+            self.insert_peer(peer)
+            return True
 
     def remove_peer(self, peer: Peer) -> bool:
         """
@@ -44,8 +67,9 @@ class PeerManager:
         :Returns: bool: True if the peer was removed, False otherwise.
         """
         with self.lock:
-            if peer in self.peers:
-                self.peers.remove(peer)
+            if str(peer) in self.peers:
+                del self.peers[str(peer)]
+                del self.peer_states[str(peer)]
                 return True
             return False
 
@@ -58,7 +82,7 @@ class PeerManager:
         reference: https://docs.python.org/3/library/threading.html#lock-objects
         """
         with self.lock:
-            return list(self.peers)
+            return list(self.peers.values())
 
     def find_peer(self, host: str, port: str) -> Peer:
         """
@@ -69,14 +93,73 @@ class PeerManager:
         :Returns: Peer: The matching Peer object, or None if not found.
         """
         with self.lock:
-            for peer in self.peers:
-                if peer.host == host and peer.port == port:
-                    return peer
-            return None
+            return self.peers.get(f"{host}:{port}")
+
+    def set_alive(self, identity: str, alive: bool):
+        """
+        Record whether a peer currently has an open connection.
+
+        :params: identity (str): The identity of the peer.
+        :params: alive (bool): True when the peer connected, False when it disconnected.
+        """
+        with self.lock:
+            state = self.peer_states.get(identity)
+            if state is not None:
+                state["alive"] = alive
+                if alive:
+                    state["last_seen"] = time.time()
+
+    def set_rtt(self, identity: str, rtt: float):
+        """
+        Record the measured round trip time of a peer.
+
+        :params: identity (str): The identity of the peer.
+        :params: rtt (float): The smoothed round trip time, in seconds.
+        """
+        with self.lock:
+            state = self.peer_states.get(identity)
+            if state is not None:
+                state["rtt"] = rtt
+                state["last_seen"] = time.time()
+
+    def get_peer_states(self) -> dict:
+        """
+        Get a copy of the liveness and RTT of every peer, keyed by identity.
+        """
+        with self.lock:
+            return {identity: dict(state) for identity, state in self.peer_states.items()}
+
+    def get_alive_peers(self) -> list:
+        """
+        Get the peers that currently have an open connection.
+        """
+        with self.lock:
+            return [peer for identity, peer in self.peers.items() if self.peer_states[identity]["alive"]]
+
+    def rank_peers(self, peers: list = None) -> list:
+        """
+        Order peers by latency: connected peers with the lowest measured RTT first, then connected peers
+        without a measurement, then unreachable peers. Peers with equal rank keep their order.
+
+        :params: peers (list): The Peer objects to rank, all known peers if not given.
+        :Returns: list: The ranked Peer objects.
+        """
+        with self.lock:
+            peers = list(self.peers.values()) if peers is None else list(peers)
+
+            def get_rank(peer: Peer):
+                state = self.peer_states.get(str(peer), {})
+                if not state.get("alive"):
+                    return (2, 0)
+                if state.get("rtt") is None:
+                    return (1, 0)
+                return (0, state["rtt"])
+
+            return sorted(peers, key=get_rank)
 
     def __str__(self):
         """
         Get a string representation of the peer list.
         """
         with self.lock:
-            return ", ".join([str(peer) for peer in self.peers])
\ No newline at end of file
+            return ", ".join(self.peers)
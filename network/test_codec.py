@@ -0,0 +1,89 @@
+import json
+import pytest
+from network.codec import MsgPack, WireCodec
+from network.message import Message
+from blockchain.blockchain import Blockchain
+from transaction.transaction_manager import TransactionManager
+
+SAMPLES = [
+    None, True, False, 0, 1, 127, 128, 255, 256, 65535, 65536, 2 ** 32, 2 ** 64 - 1,
+    -1, -32, -33, -128, -129, -32768, -32769, -2 ** 31, -2 ** 63,
+    0.0, 1.5, -2.25, 1e300,
+    "", "a", "é" * 40, "x" * 300, "y" * 70000,
+    b"", b"\x00\xff", b"z" * 300,
+    [], list(range(20)), list(range(70000)),
+    {}, {"a": 1}, {f"key{number}": number for number in range(20)},
+    {"nested": [{"list": [1, 2, {"deep": None}]}, "text", 3.5]},
+]
+
+
+def build_block_message() -> Message:
+    """
+    A MAIN_BLOCK message with the genesis transactions.
+    """
+    blockchain = Blockchain()
+    transactions = blockchain.get_last_block().transactions
+    block = blockchain.create_block(staker_signature="staker10:signature",
+                                    tx_root=TransactionManager.calculate_merkle_root(transactions),
+                                    shard_data={"miner1_1": {"merkle_root": "ab" * 32, "miner_numeric_id": 0, "tx_count": 1}},
+                                    transactions=transactions)
+    return Message(content_type="MAIN_BLOCK", content=block.to_dict(), sender="staker10")
+
+
+@pytest.mark.parametrize("obj", SAMPLES)
+def test_msgpack_round_trip(obj):
+    assert MsgPack.unpack(MsgPack.pack(obj)) == obj
+
+
+def test_msgpack_decodes_tuples_as_lists():
+    assert MsgPack.unpack(MsgPack.pack((1, (2, 3)))) == [1, [2, 3]]
+
+
+@pytest.mark.parametrize("data", [b"\xc1", b"\x01\x02", b"\xa3ab"])
+def test_msgpack_rejects_invalid_data(data):
+    with pytest.raises((ValueError, IndexError)):
+        MsgPack.unpack(data)
+
+
+def test_msgpack_rejects_non_string_map_keys():
+    with pytest.raises(ValueError):
+        MsgPack.unpack(MsgPack.pack({1: "one"}))
+
+
+@pytest.mark.parametrize("codec", sorted(WireCodec.CODECS))
+def test_wire_codecs_round_trip_messages(codec):
+    message = build_block_message()
+    decoded = WireCodec.decode(codec, WireCodec.encode(codec, message))
+    assert decoded.to_dict() == json.loads(message.to_json())
+    assert WireCodec.get_codec(WireCodec.get_flags(codec)) == codec
+
+
+def test_wire_codecs_cache_the_encoding():
+    message = build_block_message()
+    assert WireCodec.encode("msgpack", message) is WireCodec.encode("msgpack", message)
+
+
+def test_negotiate_falls_back_to_json():
+    assert WireCodec.negotiate(["msgpack", "json"], ["json", "msgpack"]) == "msgpack"
+    assert WireCodec.negotiate(["msgpack"], ["json"]) == "json"
+    assert WireCodec.negotiate(["unknown"], ["unknown", "msgpack"]) == "json"
+
+
+def test_pure_and_c_msgpack_are_interchangeable():
+    msgpack = pytest.importorskip("msgpack")
+    message = build_block_message()
+    for obj in SAMPLES + [message.to_dict()]:
+        if isinstance(obj, tuple):
+            continue
+        encoded = msgpack.packb(obj, use_bin_type=True)
+        assert MsgPack.pack(obj) == encoded
+        assert MsgPack.unpack(encoded) == msgpack.unpackb(encoded, raw=False)
+
+
+def test_pure_and_c_msgpack_reject_the_same_map_keys():
+    msgpack = pytest.importorskip("msgpack")
+    encoded = msgpack.packb({1: "one"}, use_bin_type=True)
+    with pytest.raises(ValueError):
+        msgpack.unpackb(encoded, raw=False)
+    with pytest.raises(ValueError):
+        MsgPack.unpack(encoded)
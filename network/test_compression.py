@@ -0,0 +1,46 @@
+import zlib
+import pytest
+from network.compression import Compression
+from network.framing import FrameError
+
+PAYLOAD = b'{"content_type": "MAIN_BLOCK", "content": {"transactions": []}}' * 100
+CODECS = [codec for codec in Compression.CODECS if codec != "none"]
+
+
+@pytest.mark.parametrize("codec", list(Compression.CODECS))
+def test_round_trip(codec):
+    compressed = Compression.compress(codec, PAYLOAD)
+    assert Compression.decompress(Compression.CODECS[codec], compressed, max_size=len(PAYLOAD)) == PAYLOAD
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_payload_above_the_limit_is_rejected(codec):
+    compressed = Compression.compress(codec, PAYLOAD)
+    with pytest.raises(FrameError):
+        Compression.decompress(Compression.CODECS[codec], compressed, max_size=len(PAYLOAD) - 1)
+
+
+def test_decompression_stops_at_the_limit():
+    # A few KiB that would expand to 64 MiB
+    bomb = zlib.compress(b"\x00" * (64 * 1024 * 1024), 9)
+    with pytest.raises(FrameError):
+        Compression.decompress(Compression.CODECS["zlib"], bomb, max_size=1024 * 1024)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_truncated_and_corrupted_payloads_are_rejected(codec):
+    compressed = Compression.compress(codec, PAYLOAD)
+    with pytest.raises(FrameError):
+        Compression.decompress(Compression.CODECS[codec], compressed[:len(compressed) // 2])
+    with pytest.raises(FrameError):
+        Compression.decompress(Compression.CODECS[codec], b"\xff" * 64)
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        Compression.decompress(0x0F, PAYLOAD)
+
+
+def test_negotiate():
+    assert Compression.negotiate(["lzma", "zlib"], ["zlib", "lzma"]) == "lzma"
+    assert Compression.negotiate(["bz2"], ["zlib"]) == "none"
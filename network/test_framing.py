@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from network.framing import Frame, FrameError
+from network.message import Message
+
+
+def read_frames(data: bytes, max_frame_size: int = 1024) -> list:
+    """
+    Read every frame from a stream holding the given bytes.
+    """
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        frames = []
+        while True:
+            frame = await Frame.read(reader, max_frame_size)
+            if frame is None:
+                return frames
+            frames.append(frame)
+    return asyncio.run(read())
+
+
+def test_frames_round_trip():
+    messages = [Message("CONTROL", {"action": "START", "epoch": 1}, "staker10"), Message("UNKNOWN_TYPE", {"x": 1}, "peer")]
+    frames = read_frames(b"".join(Frame.encode(message) for message in messages))
+
+    assert [frame.content_type for frame in frames] == ["CONTROL", None]
+    assert [Message.from_json(frame.payload).to_dict() for frame in frames] == [message.to_dict() for message in messages]
+
+
+def test_flags_are_kept():
+    frame, = read_frames(Frame.pack("MAIN_BLOCK", b"payload", flags=0x13))
+    assert (frame.content_type, frame.payload, frame.flags) == ("MAIN_BLOCK", b"payload", 0x13)
+
+
+def test_frame_at_the_size_limit_is_accepted():
+    frame, = read_frames(Frame.pack("BLOCKS", b"x" * 1024), max_frame_size=1024)
+    assert len(frame.payload) == 1024
+
+
+def test_oversized_frame_is_rejected_before_its_payload_is_read():
+    header = Frame.HEADER.pack(Frame.VERSION, 0, 0, 1025)
+    with pytest.raises(FrameError):
+        read_frames(header, max_frame_size=1024)
+
+
+@pytest.mark.parametrize("data", [
+    Frame.HEADER.pack(Frame.VERSION, 0, 0, 10)[:5],            # Closed inside the header
+    Frame.HEADER.pack(Frame.VERSION, 0, 0, 10) + b"short",     # Closed inside the payload
+    Frame.HEADER.pack(Frame.VERSION + 1, 0, 0, 0),             # Unknown framing version
+])
+def test_broken_frames_are_rejected(data):
+    with pytest.raises(FrameError):
+        read_frames(data)
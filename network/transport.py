@@ -0,0 +1,377 @@
+import random
+import socket
+import asyncio
+import logging
+
+
+class TcpTransport:
+    # Socket and stream settings of the transport profiles; a config can pick one and override single settings
+    PROFILES = {
+        "default": {"tcp_nodelay": True, "send_buffer": None, "receive_buffer": None, "stream_limit": 64 * 1024,
+                    "backlog": 100, "keepalive": False},
+        # Small control messages: no Nagle delay, keepalive to detect dead peers
+        "low_latency": {"tcp_nodelay": True, "send_buffer": None, "receive_buffer": None, "stream_limit": 64 * 1024,
+                        "backlog": 100, "keepalive": True},
+        # Block transfers: large kernel buffers and stream buffer so a block is read without stalling the sender
+        "throughput": {"tcp_nodelay": True, "send_buffer": 4 * 1024 * 1024, "receive_buffer": 4 * 1024 * 1024,
+                       "stream_limit": 4 * 1024 * 1024, "backlog": 512, "keepalive": True},
+    }
+
+    def __init__(self, transport_config: dict = None):
+        """
+        Initialize the TCP transport with a profile of socket options, stream buffer limit and server backlog.
+        asyncio already enables TCP_NODELAY on its TCP sockets; profiles can turn it off to let Nagle's
+        algorithm merge small writes.
+        :param transport_config: Optional settings: profile (default, low_latency, throughput) and overrides of
+                                 tcp_nodelay, send_buffer, receive_buffer (bytes, None for the OS default),
+                                 stream_limit, backlog and keepalive.
+        """
+        transport_config = transport_config if transport_config is not None else {}
+        self.profile = transport_config.get("profile", "default")
+        if self.profile not in self.PROFILES:
+            raise ValueError(f"Unknown transport profile {self.profile}, expected one of {', '.join(self.PROFILES)}")
+        self.settings = dict(self.PROFILES[self.profile])
+        self.settings.update({key: value for key, value in transport_config.items() if key in self.settings})
+
+    def configure_socket(self, sock):
+        """
+        Apply the profile's socket options to a socket.
+        """
+        if sock is None:
+            return
+        try:
+            if sock.family in (socket.AF_INET, socket.AF_INET6):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.settings["tcp_nodelay"]))
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, int(self.settings["keepalive"]))
+            if self.settings["send_buffer"]:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.settings["send_buffer"])
+            if self.settings["receive_buffer"]:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.settings["receive_buffer"])
+        except OSError as e:
+            logging.warning(f"Could not apply the {self.profile} transport profile to a socket: {e}")
+
+    async def open_connection(self, host: str, port: int):
+        """
+        Open a connection to a peer.
+        :return: A (StreamReader, StreamWriter) tuple.
+        """
+        reader, writer = await asyncio.open_connection(host, port, limit=self.settings["stream_limit"])
+        self.configure_socket(writer.get_extra_info("socket"))
+        return reader, writer
+
+    async def start_server(self, client_connected_cb, host: str, port: int):
+        """
+        Start accepting connections, calling client_connected_cb(reader, writer) for each of them.
+        Buffer sizes are set on the listening sockets, so accepted connections inherit them from the start.
+        :return: The asyncio Server.
+        """
+        async def handle_connection(reader, writer):
+            self.configure_socket(writer.get_extra_info("socket"))
+            await client_connected_cb(reader, writer)
+
+        server = await asyncio.start_server(handle_connection, host, port, limit=self.settings["stream_limit"],
+                                            backlog=self.settings["backlog"])
+        for sock in server.sockets:
+            self.configure_socket(sock)
+        return server
+
+    @staticmethod
+    def install_event_loop(event_loop: str = None):
+        """
+        Select the event loop implementation used by the next asyncio.run.
+        :param event_loop: "asyncio" (default) or "uvloop"; falls back to asyncio if uvloop is not installed.
+        :return: The name of the installed event loop.
+        """
+        if event_loop == "uvloop":
+            try:
+                import uvloop
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+                return "uvloop"
+            except ImportError:
+                logging.warning("uvloop is not installed, using the default asyncio event loop.")
+        asyncio.set_event_loop_policy(None)
+        return "asyncio"
+
+
+class SimulatedNetwork:
+    def __init__(self, latency: float = 0.01, bandwidth: float = None, loss: float = 0.0, jitter: float = 0.0,
+                 retransmit_timeout: float = 0.2, buffer_size: int = 256 * 1024, seed: int = None):
+        """
+        Initialize an in-memory network connecting many Hosts in one process.
+        Connections behave like TCP streams: data arrives in order and once, after the link latency and the time
+        needed to send it at the link bandwidth. A lost segment is not dropped but delayed by the retransmission
+        timeout, holding back the data behind it. Hosts in different partitions cannot connect, and partitioning
+        the network resets the connections between them.
+        :param latency: The default one-way latency of a link, in seconds.
+        :param bandwidth: The default bandwidth of a link in bytes per second, None for unlimited.
+        :param loss: The default probability that a write is lost and retransmitted.
+        :param jitter: The maximum random latency added to a write, in seconds.
+        :param retransmit_timeout: The delay added to a lost write, in seconds.
+        :param buffer_size: The bytes a writer can queue on a link before drain() waits.
+        :param seed: Optional seed of the random generator, for reproducible runs.
+        """
+        self.default_link = {"latency": latency, "bandwidth": bandwidth, "loss": loss, "jitter": jitter}
+        self.retransmit_timeout = retransmit_timeout
+        self.buffer_size = buffer_size
+        self.random = random.Random(seed)
+        self.links = {}        # (source host, destination host) -> link settings overriding the defaults
+        self.servers = {}      # "host:port" -> client_connected_cb of the listening Host
+        self.partitions = []   # list of sets of host names that can only reach each other
+        self.connections = []  # list of (writer, writer) pairs of open connections
+        self.stats = {"connections": 0, "refused": 0, "resets": 0, "writes": 0, "bytes": 0, "retransmissions": 0}
+
+    def create_transport(self, host: str):
+        """
+        Create the transport of a Host attached to this network.
+        :param host: The host name of the node, e.g. "staker10".
+        """
+        return SimulatedTransport(self, host)
+
+    def set_link(self, source: str, destination: str, **settings):
+        """
+        Override the settings (latency, bandwidth, loss, jitter) of the link between two hosts, in both directions.
+        """
+        for link in ((source, destination), (destination, source)):
+            self.links.setdefault(link, {}).update(settings)
+
+    def get_link(self, source: str, destination: str) -> dict:
+        """
+        Get the settings of the link from one host to another.
+        """
+        return dict(self.default_link, **self.links.get((source, destination), {}))
+
+    def partition(self, *groups):
+        """
+        Split the network into groups of hosts that can only reach each other, resetting the connections between
+        groups. Hosts not listed in any group can reach every host.
+        :param groups: Iterables of host names.
+        """
+        self.partitions = [set(group) for group in groups]
+        for writer, remote_writer in list(self.connections):
+            if not self.is_reachable(writer.host, remote_writer.host):
+                self.stats["resets"] += 1
+                writer.abort()
+                remote_writer.abort()
+        logging.info(f"Network partitioned into {len(self.partitions)} group(s).")
+
+    def heal(self):
+        """
+        Remove all partitions.
+        """
+        self.partitions = []
+        logging.info("Network partitions healed.")
+
+    def is_reachable(self, source: str, destination: str) -> bool:
+        """
+        Check whether two hosts are in the same partition.
+        """
+        for group in self.partitions:
+            if (source in group) != (destination in group):
+                return False
+        return True
+
+
+class SimulatedPipe:
+    def __init__(self, network: SimulatedNetwork, source: str, destination: str, reader: asyncio.StreamReader):
+        """
+        Initialize one direction of a simulated connection, delivering the written data to the remote reader.
+        """
+        self.network = network
+        self.source = source
+        self.destination = destination
+        self.reader = reader
+        self.busy_until = 0.0     # Loop time at which the link has sent all the data written so far
+        self.last_delivery = 0.0  # Loop time of the latest scheduled delivery, keeping the data in order
+        self.eof = False
+
+    def send(self, data: bytes):
+        """
+        Schedule the delivery of written data after its transmission time, latency and any retransmission.
+        """
+        loop = asyncio.get_running_loop()
+        link = self.network.get_link(self.source, self.destination)
+        now = loop.time()
+        transmission_time = len(data) / link["bandwidth"] if link["bandwidth"] else 0
+        self.busy_until = max(now, self.busy_until) + transmission_time
+        delay = link["latency"] + self.network.random.uniform(0, link["jitter"])
+        if link["loss"] and self.network.random.random() < link["loss"]:
+            self.network.stats["retransmissions"] += 1
+            delay += self.network.retransmit_timeout
+        self.last_delivery = max(self.last_delivery + 1e-9, self.busy_until + delay)
+        loop.call_at(self.last_delivery, self.deliver, data)
+        self.network.stats["writes"] += 1
+        self.network.stats["bytes"] += len(data)
+
+    def deliver(self, data: bytes):
+        """
+        Hand delivered data to the remote reader.
+        """
+        if not self.eof:
+            self.reader.feed_data(data)
+
+    def close(self, delay: bool = True):
+        """
+        Signal the end of the stream to the remote reader, after the data in flight unless delay is False.
+        """
+        if delay:
+            loop = asyncio.get_running_loop()
+            self.last_delivery = max(self.last_delivery + 1e-9, loop.time() + self.network.get_link(self.source, self.destination)["latency"])
+            loop.call_at(self.last_delivery, self.close, False)
+        elif not self.eof:
+            self.eof = True
+            self.reader.feed_eof()
+
+    def get_backlog(self) -> float:
+        """
+        Get the seconds needed to send the data queued on the link.
+        """
+        return max(0.0, self.busy_until - asyncio.get_running_loop().time())
+
+
+class SimulatedStreamWriter:
+    def __init__(self, network: SimulatedNetwork, host: str, pipe: SimulatedPipe, local_pipe: SimulatedPipe):
+        """
+        Initialize the writing end of a simulated connection, with the subset of the StreamWriter API used by peers.
+        :param host: The host name of the writing node.
+        :param pipe: The pipe carrying the written data to the remote node.
+        :param local_pipe: The pipe carrying data to this node, ended when the connection is closed locally.
+        """
+        self.network = network
+        self.host = host
+        self.pipe = pipe
+        self.local_pipe = local_pipe
+        self.closing = False
+        self.reset = False
+
+    def write(self, data: bytes):
+        """
+        Send data to the remote node. Data written after the connection closed is discarded.
+        """
+        if not self.closing and data:
+            self.pipe.send(bytes(data))
+
+    async def drain(self):
+        """
+        Wait until the data queued on the link fits in the send buffer.
+        """
+        if self.reset:
+            raise ConnectionResetError("Connection reset by simulated network partition")
+        bandwidth = self.network.get_link(self.pipe.source, self.pipe.destination)["bandwidth"]
+        if bandwidth:
+            excess = self.pipe.get_backlog() - self.network.buffer_size / bandwidth
+            if excess > 0:
+                await asyncio.sleep(excess)
+                return
+        await asyncio.sleep(0)
+
+    def close(self):
+        """
+        Close the connection: the local reader ends now, the remote reader after the data in flight.
+        """
+        if not self.closing:
+            self.closing = True
+            self.local_pipe.close(delay=False)
+            self.pipe.close()
+
+    def abort(self):
+        """
+        Reset the connection immediately, discarding the data in flight.
+        """
+        self.reset = True
+        self.closing = True
+        self.local_pipe.close(delay=False)
+        self.pipe.close(delay=False)
+
+    def is_closing(self) -> bool:
+        """
+        Check whether the connection is closed or closing.
+        """
+        return self.closing
+
+    async def wait_closed(self):
+        """
+        Wait until the connection is closed, which happens immediately.
+        """
+        await asyncio.sleep(0)
+
+    def get_extra_info(self, name: str, default=None):
+        """
+        Get transport information; only "peername" is available.
+        """
+        if name == "peername":
+            return (self.pipe.destination, 0)
+        return default
+
+
+class SimulatedServer:
+    def __init__(self, network: SimulatedNetwork, address: str):
+        """
+        Initialize the listening end of a simulated Host, with the subset of the asyncio Server API used by peers.
+        """
+        self.network = network
+        self.address = address
+        self.closed = asyncio.Event()
+
+    async def serve_forever(self):
+        """
+        Accept connections until the server is closed or the task is cancelled.
+        """
+        try:
+            await self.closed.wait()
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop accepting connections.
+        """
+        self.network.servers.pop(self.address, None)
+        self.closed.set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class SimulatedTransport:
+    def __init__(self, network: SimulatedNetwork, host: str):
+        """
+        Initialize the transport of one Host on a SimulatedNetwork.
+        :param network: The simulated network.
+        :param host: The host name of the node.
+        """
+        self.network = network
+        self.host = host
+
+    async def open_connection(self, host: str, port: int):
+        """
+        Connect to a Host listening on the simulated network, after the link latency.
+        :return: A (StreamReader, SimulatedStreamWriter) tuple.
+        """
+        address = f"{host}:{port}"
+        await asyncio.sleep(self.network.get_link(self.host, host)["latency"])
+        client_connected_cb = self.network.servers.get(address)
+        if client_connected_cb is None or not self.network.is_reachable(self.host, host):
+            self.network.stats["refused"] += 1
+            raise ConnectionRefusedError(f"Simulated connection to {address} refused")
+
+        local_reader, remote_reader = asyncio.StreamReader(), asyncio.StreamReader()
+        outgoing_pipe = SimulatedPipe(self.network, self.host, host, remote_reader)
+        incoming_pipe = SimulatedPipe(self.network, host, self.host, local_reader)
+        local_writer = SimulatedStreamWriter(self.network, self.host, outgoing_pipe, incoming_pipe)
+        remote_writer = SimulatedStreamWriter(self.network, host, incoming_pipe, outgoing_pipe)
+        self.network.connections = [pair for pair in self.network.connections if not pair[0].closing]
+        self.network.connections.append((local_writer, remote_writer))
+        self.network.stats["connections"] += 1
+        asyncio.create_task(client_connected_cb(remote_reader, remote_writer))
+        return local_reader, local_writer
+
+    async def start_server(self, client_connected_cb, host: str, port: int):
+        """
+        Start accepting simulated connections at this node's host name; the bind address is ignored.
+        """
+        address = f"{self.host}:{port}"
+        self.network.servers[address] = client_connected_cb
+        return SimulatedServer(self.network, address)
@@ -0,0 +1,36 @@
+import hashlib
+import pytest
+from transaction.transaction_manager import TransactionManager
+
+
+def leaf_hashes(count):
+    return [hashlib.sha256(str(number).encode()).hexdigest() for number in range(count)]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 4, 5, 7, 8, 13])
+def test_every_leaf_proves_against_the_root(count):
+    hashes = leaf_hashes(count)
+    merkle_root = TransactionManager.calculate_merkle_root_from_hashes(hashes)
+    for index, leaf_hash in enumerate(hashes):
+        proof = TransactionManager.get_merkle_proof(hashes, index)
+        assert len(proof) == (count - 1).bit_length()
+        assert TransactionManager.verify_merkle_proof(leaf_hash, proof, merkle_root)
+
+
+def test_proofs_do_not_verify_other_leaves_or_roots():
+    hashes = leaf_hashes(6)
+    merkle_root = TransactionManager.calculate_merkle_root_from_hashes(hashes)
+    proof = TransactionManager.get_merkle_proof(hashes, 2)
+
+    assert not TransactionManager.verify_merkle_proof(hashes[3], proof, merkle_root)
+    assert not TransactionManager.verify_merkle_proof(hashes[2], proof, TransactionManager.calculate_merkle_root_from_hashes(hashes[:5]))
+    # Swapping the side of a sibling changes the path
+    flipped_proof = [[sibling_hash, "left" if side == "right" else "right"] for sibling_hash, side in proof]
+    assert not TransactionManager.verify_merkle_proof(hashes[2], flipped_proof, merkle_root)
+
+
+def test_out_of_range_leaves_are_rejected():
+    with pytest.raises(IndexError):
+        TransactionManager.get_merkle_proof(leaf_hashes(3), 3)
+    with pytest.raises(IndexError):
+        TransactionManager.get_merkle_proof([], 0)
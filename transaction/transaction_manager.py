@@ -13,35 +13,84 @@ class TransactionManager:
         
         self.num_miners = num_miners
         self.transaction_pool = transactions
+        self.tx_pool_file = "transaction/transaction_pool.json"
+        self.pool_version = 0  # Bumped on every change of the pool through this manager
+        self.transactions_by_id = {}  # txid -> Transaction, rebuilt when the pool changes
+        self.indexed_pool_key = None
         
     def get_num_miners(self):
         """
         Get the number of miners.
         """
         return self.num_miners
+
+    def set_num_miners(self, num_miners: int):
+        """
+        Set the number of miners the transactions are partitioned among, e.g. after miners were reassigned.
+        """
+        self.num_miners = num_miners
     
     def get_transactions(self):
         """
         Get all transactions from the pool.
         """
         return self.transaction_pool
+
+    def set_transactions(self, transactions: List[Transaction]):
+        """
+        Replace the transactions of the pool.
+        :param transactions: List of Transaction objects.
+        """
+        self.transaction_pool = transactions
+        self.pool_version += 1
     
-    def get_transactions_for_miner(self, miner_id: int=None) -> List[Transaction]:
+    def get_transactions_by_id(self) -> dict:
+        """
+        Get the pool transactions keyed by their hash. The hashes are cached until the pool changes: its version,
+        bumped by the methods changing the pool, the pool list itself or its size.
+        """
+        pool_key = (self.pool_version, id(self.transaction_pool), len(self.transaction_pool))
+        if self.indexed_pool_key != pool_key:
+            self.transactions_by_id = {tx.calculate_hash(): tx for tx in self.transaction_pool}
+            self.indexed_pool_key = pool_key
+        return self.transactions_by_id
+
+    def get_transactions_for_miner(self, miner_id: int=None, weights: List[float]=None) -> List[Transaction]:
         """
         Returns the subset of transactions assigned to a specific miner.
         :param miner_id: ID of the miner.
+        :param weights: Optional share of the pool of every miner, indexed by miner ID. Without weights the
+                        transactions are dealt out round-robin; with weights each miner gets a contiguous range
+                        proportional to its weight.
         :return: List of transactions for the miner.
         """
         # Distribute transactions deterministically among miners
         if miner_id is None:
             raise ValueError("Miner ID is required to get transactions for miners, otherwise use get_transactions() to get all the transactions from the pool.")
-        
+
+        if weights:
+            transactions = self.get_transactions()
+            total_weight = sum(weights)
+            start = round(len(transactions) * sum(weights[:miner_id]) / total_weight)
+            end = round(len(transactions) * sum(weights[:miner_id + 1]) / total_weight)
+            return transactions[start:end]
+
         miner_transactions = [
             tx for i, tx in enumerate(self.get_transactions()) if i % self.num_miners == miner_id
         ]
 
         return miner_transactions
 
+
+    def get_transactions_for_shard(self, shard_id: int, num_shards: int) -> List[Transaction]:
+        """
+        Returns the partition of the pool that falls to a shard. Transactions are split by their hash, so every
+        node computes the same partition regardless of the order of its pool.
+        :param shard_id: Zero-based ID of the shard.
+        :param num_shards: Number of shards.
+        :return: List of transactions for the shard.
+        """
+        return [tx for txid, tx in self.get_transactions_by_id().items() if int(txid, 16) % num_shards == shard_id]
     
     def get_miner_merkle_root(self, miner_id: int) -> str:
         """
@@ -62,29 +111,81 @@ class TransactionManager:
         
         reference: https://learnmeabitcoin.com/technical/block/merkle-root/
         """
-        if not transactions:
-            return ""
+        # Get the hashes of all transactions
+        return cls.calculate_merkle_root_from_hashes([tx.calculate_hash() for tx in transactions])
 
-        # Helper function to hash two nodes
-        def hash_pair(hash1, hash2):
-            return hashlib.sha256((hash1 + hash2).encode('utf-8')).hexdigest()
+    @classmethod
+    def hash_pair(cls, hash1: str, hash2: str) -> str:
+        """
+        Hash two nodes of a Merkle tree into their parent node.
+        """
+        return hashlib.sha256((hash1 + hash2).encode('utf-8')).hexdigest()
 
-        # Get the hashes of all transactions
-        tx_hashes = [tx.calculate_hash() for tx in transactions]
+    @classmethod
+    def calculate_merkle_root_from_hashes(cls, hashes: List[str]) -> str:
+        """
+        Calculates the Merkle root over already computed leaf hashes, e.g. the Merkle roots of shard blocks.
+        :param hashes: The leaf hashes, in order.
+        :return: Merkle root as a hex string, "" if there are no leaves.
+        """
+        if not hashes:
+            return ""
 
         # Build the Merkle tree
-        while len(tx_hashes) > 1:
+        hashes = list(hashes)
+        while len(hashes) > 1:
             # If odd number of hashes, duplicate the last hash
-            if len(tx_hashes) % 2 == 1:
-                tx_hashes.append(tx_hashes[-1])
+            if len(hashes) % 2 == 1:
+                hashes.append(hashes[-1])
 
             # Pairwise hash to get the next level
-            tx_hashes = [hash_pair(tx_hashes[i], tx_hashes[i + 1]) 
-                         for i in range(0, len(tx_hashes), 2)
-                         ]
+            hashes = [cls.hash_pair(hashes[i], hashes[i + 1]) 
+                      for i in range(0, len(hashes), 2)
+                      ]
 
         # The final hash is the Merkle root
-        return tx_hashes[0]
+        return hashes[0]
+
+    @classmethod
+    def get_merkle_proof(cls, hashes: List[str], index: int) -> List[list]:
+        """
+        Get the Merkle inclusion proof of a leaf: the sibling hashes on the path from the leaf to the root.
+        :param hashes: The leaf hashes, in order.
+        :param index: The position of the leaf.
+        :return: A list of [sibling hash, "left" or "right"] pairs, from the leaf level upwards.
+        """
+        if not 0 <= index < len(hashes):
+            raise IndexError(f"Leaf {index} out of range for {len(hashes)} leaves.")
+
+        proof = []
+        hashes = list(hashes)
+        while len(hashes) > 1:
+            if len(hashes) % 2 == 1:
+                hashes.append(hashes[-1])
+            if index % 2 == 0:
+                proof.append([hashes[index + 1], "right"])
+            else:
+                proof.append([hashes[index - 1], "left"])
+            hashes = [cls.hash_pair(hashes[i], hashes[i + 1]) for i in range(0, len(hashes), 2)]
+            index //= 2
+        return proof
+
+    @classmethod
+    def verify_merkle_proof(cls, leaf_hash: str, proof: List[list], merkle_root: str) -> bool:
+        """
+        Verify a Merkle inclusion proof from get_merkle_proof().
+        :param leaf_hash: The hash of the leaf, e.g. a transaction hash.
+        :param proof: The [sibling hash, side] pairs from the leaf upwards.
+        :param merkle_root: The expected Merkle root.
+        :return: True if the leaf is part of the tree with the given root.
+        """
+        current_hash = leaf_hash
+        for sibling_hash, side in proof:
+            if side == "left":
+                current_hash = cls.hash_pair(sibling_hash, current_hash)
+            else:
+                current_hash = cls.hash_pair(current_hash, sibling_hash)
+        return current_hash == merkle_root
     
     def save_transactions(self, transactions: List[Transaction]):
         """
@@ -99,8 +200,9 @@ class TransactionManager:
         Add a new transaction to the pool.
         :param transaction: Transaction object.
         """
-        self.tx_pool.append(transaction)
-        self.save_transactions(self.tx_pool)
+        self.transaction_pool.append(transaction)
+        self.pool_version += 1
+        self.save_transactions(self.transaction_pool)
 
     def remove_transactions(self, transactions_to_remove: List[Transaction]):
         """
@@ -134,4 +236,4 @@ class TransactionManager:
         """
         Clear the transaction pool.
         """
-        self.tx_pool = []
\ No newline at end of file
+        self.set_transactions([])
\ No newline at end of file
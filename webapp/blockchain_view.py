@@ -1,10 +1,16 @@
-from flask import Flask, jsonify, render_template
+from flask import Flask, jsonify, render_template, request
 import os
 
 app = Flask(__name__, template_folder="templates")
 
 # Placeholder for the blockchain object
 blockchain = None
+# Placeholder for the transaction and address index
+chain_index = None
+# Placeholder for the function returning the network metrics snapshot
+metrics_provider = None
+# Placeholder for the block store the blocks are served from
+block_store = None
 # Reference: https://flask.palletsprojects.com/en/2.0.x/quickstart/
 @app.route('/')
 def home():
@@ -16,23 +22,68 @@ def home():
 @app.route('/blocks', methods=['GET'])
 def get_blocks():
     """
-    Serve the list of all blocks in the blockchain.
+    Serve a page of main chain blocks in ascending order, the most recent ones by default.
+    Use the `limit` and `before_height` query parameters to page back through the chain.
+    Blocks are read from the block store if there is one, so the chain does not load old blocks from this thread.
     """
     if blockchain is None:
         return jsonify({"error": "Blockchain not initialized"}), 500
 
-    # Convert the blockchain to a list of dictionaries
-    blocks = [block.to_dict() for block in blockchain.chain]
+    limit = max(0, request.args.get("limit", default=100, type=int))
+    tip_height = block_store.height if block_store is not None else len(blockchain.chain) - 1
+    end_height = min(request.args.get("before_height", default=tip_height + 1, type=int), tip_height + 1)
+    start_height = max(0, end_height - limit)
+    if block_store is not None:
+        blocks = [block_store.get_block(height) for height in range(start_height, end_height)]
+        blocks = [block for block in blocks if block is not None]
+    else:
+        blocks = [block.to_dict() for block in blockchain.chain[start_height:end_height]]
     return jsonify(blocks)
 
-def start_webserver(bc, node_name:str = None):
+@app.route('/tx/<txid>', methods=['GET'])
+def get_transaction(txid):
+    """
+    Serve the main chain locations (height and position) of a transaction.
+    """
+    if chain_index is None:
+        return jsonify({"error": "Transaction index not enabled"}), 500
+    return jsonify(chain_index.get_transaction_locations(txid))
+
+@app.route('/address/<address>', methods=['GET'])
+def get_address_history(address):
+    """
+    Serve the transactions sent or received by an address, most recent first.
+    Use the `limit` and `before_height` query parameters to page through the history.
+    """
+    if chain_index is None:
+        return jsonify({"error": "Transaction index not enabled"}), 500
+    limit = request.args.get("limit", default=100, type=int)
+    before_height = request.args.get("before_height", default=None, type=int)
+    return jsonify(chain_index.get_address_history(address, limit=limit, before_height=before_height))
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Serve a snapshot of the network metrics: per-peer and per-content-type traffic, peer RTTs and queue depths.
+    """
+    if metrics_provider is None:
+        return jsonify({"error": "Network metrics not enabled"}), 500
+    return jsonify(metrics_provider())
+
+def start_webserver(bc, node_name:str = None, index=None, metrics=None, store=None):
     """
     Start the Flask webserver with the given blockchain instance.
 
     :param bc: The blockchain instance to serve.
+    :param index: Optional ChainIndex used to serve transaction and address lookups.
+    :param metrics: Optional function returning the network metrics snapshot, e.g. Host.get_metrics.
+    :param store: Optional BlockStore the blocks are served from.
     """
-    global blockchain
+    global blockchain, chain_index, metrics_provider, block_store
     blockchain = bc
+    chain_index = index
+    metrics_provider = metrics
+    block_store = store
     
     # for local uncomment the following for local
     # port = int(os.getenv("FLASK_PORT", 8000))